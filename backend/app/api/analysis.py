@@ -2,35 +2,72 @@
 分析相关 API
 处理上传内容的 AI 分析和推荐生成（异步处理）
 """
-from fastapi import APIRouter, HTTPException, Header, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Header, BackgroundTasks, Request
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Literal, Tuple, Callable
 import logging
 import json
 import asyncio
-import base64
+import time
 import httpx
+from contextlib import nullcontext
 from urllib.parse import urlparse
 from datetime import datetime
+from app.config import settings
 from app.database import supabase
 from app.services.deepseek import deepseek_service
 from app.services.jina import jina_service
+from app.services.image_preprocess import image_preprocess_service
+from app.services.blob_cache import blob_cache
+from app.services.dedup import dedup_service
+from app.services.llm_cache import start_cache_tracking, summarize_cache_events
+from app.services.content_reducer import content_reducer, truncate_to_budget
 from app.services.recommender import recommender_service
+from app.services.search import start_shared_search_scope
+from app.services.metrics import stage_span, start_stage_timing, summarize_stage_timings, ANALYSIS_TASKS, STAGE_DURATION
+from app.services.task_progress import TaskProgressReporter
+from app.services.response_cache import response_cache
+from app.services.analysis_profiles import analysis_profile_service
+from app.services.admission import admission_controller, AdmissionRejected, AdmissionTicket
 from app.api.upload import get_user_from_token
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 进行中的任务只向 async_tasks.result_data 写入轮询页面需要的字段，
+# 完整的中间结果保存在 analyses.full_context，查询已完成任务时合并返回
+TASK_PROGRESS_KEYS = ("step_message", "contextual_expand", "profile")
+TASK_RESULT_KEYS = TASK_PROGRESS_KEYS + ("final_result",)
+
+
+AnalysisProfileName = Literal["fast", "standard", "deep"]
+
 
 class AnalyzeRequest(BaseModel):
     upload_id: str
+    reuse_existing: bool = True  # 相同内容已有完成的分析时直接复用
+    profile: Optional[AnalysisProfileName] = None  # 分析档位，为空时使用 ANALYSIS_DEFAULT_PROFILE；负载高时可能降档
 
 
 class AnalyzeResponse(BaseModel):
     task_id: str
     status: str
     message: str
+    queue: Optional[Dict[str, int]] = None  # 排队中时的队列位置和预计完成秒数
+
+
+class BatchAnalyzeRequest(BaseModel):
+    upload_ids: List[str]
+    reuse_existing: bool = True
+    profile: Optional[AnalysisProfileName] = None
+
+
+class BatchAnalyzeResponse(BaseModel):
+    task_id: str
+    status: str
+    message: str
+    items: List[Dict[str, Any]]
 
 
 class TaskStatusResponse(BaseModel):
@@ -41,21 +78,170 @@ class TaskStatusResponse(BaseModel):
     error: Optional[str] = None
 
 
-async def process_analysis_task(task_id: str, upload_id: str, user_id: str):
+async def run_deep_decode(
+    upload_data: Dict[str, Any],
+    intermediate_results: Dict[str, Any]
+) -> Tuple[Optional[str], Optional[str], str, Dict[str, Any]]:
+    """
+    Step 1: Deep Decode (深度解析)
+
+    Returns:
+        (visual_description, extracted_text, content_for_analysis, deep_decode_result)
+    """
+    upload_type = upload_data["type"]
+    visual_description = None
+    extracted_text = None
+    content_for_analysis = ""
+    deep_decode_result = {}
+
+    if upload_type == "image":
+        # 图片分析 - 下载并转换为 Base64 传输
+        image_url = upload_data["image_url"]
+
+        # 从 URL 中提取存储路径
+        # URL 格式通常为: .../storage/v1/object/public/uploads/{path}
+        # 我们假设 bucket 名字是 "uploads"
+        path = blob_cache.normalize_key(image_url.split("/uploads/")[-1])
+
+        # 刚上传的图片优先从本地缓存读取
+        with stage_span("fetch"):
+            img_bytes = await blob_cache.get(path)
+            if img_bytes is not None:
+                logger.info(f"命中本地图片缓存: {path}")
+            else:
+                logger.info(f"正在从 Supabase Storage 下载图片: {image_url}")
+                try:
+                    # 使用 Supabase 客户端直接下载文件内容
+                    img_bytes = supabase.storage.from_("uploads").download(path)
+                except Exception as e:
+                    logger.error(f"从 Supabase 下载图片失败: {str(e)}")
+                    # 如果 Supabase 下载失败，尝试回退到 HTTP 下载 (带 User-Agent)
+                    logger.info("尝试回退到 HTTP 下载...")
+                    async with httpx.AsyncClient(timeout=30.0) as client:
+                        headers = {"User-Agent": "Mosaic-Backend/1.0"}
+                        img_res = await client.get(image_url, headers=headers)
+                        img_res.raise_for_status()
+                        img_bytes = img_res.content
+
+        # 缩放到 OCR 有效分辨率、重新压缩并去除元数据 (进程池中执行)
+        with stage_span("preprocess"):
+            prepared = await image_preprocess_service.prepare_for_ocr(img_bytes)
+        preprocess_stats = prepared["stats"]
+
+        # 第一步：使用简单 Prompt 获取原始 OCR 结果
+        logger.info("Step 1: 使用简单 Prompt 调用 DeepSeek-OCR")
+        ocr_start = time.monotonic()
+        with stage_span("ocr"):
+            vision_result = await deepseek_service.analyze_image(prepared["data_url"], is_url=False)
+        preprocess_stats["ocr_ms"] = round((time.monotonic() - ocr_start) * 1000, 1)
+        intermediate_results["image_preprocess"] = preprocess_stats
+        deep_decode_result = vision_result
+
+        visual_description = vision_result.get("visual_description", "")
+        extracted_text = vision_result.get("extracted_text", "")
+        
+        # 如果 OCR 模型返回了有效的描述，我们认为第一步成功
+        content_for_analysis = f"{visual_description}\n{extracted_text}"
+
+    elif upload_type == "url":
+        # URL 内容抓取
+        url = upload_data["content_text"]
+        with stage_span("fetch"):
+            url_content = await jina_service.fetch_url_content(url)
+        # extracted_text 只保存清理后的正文 (不含导航、链接列表和图片引用)
+        extracted_text = url_content["content"]
+        # 正文已清理，只需压缩到 token 预算 (超长页面分块摘要)
+        with stage_span("content_reduce"):
+            reduced = await content_reducer.reduce(extracted_text, cleaned=True)
+        content_for_analysis = reduced["text"]
+        intermediate_results["content_reduction"] = reduced["stats"]
+        # 页面结构只保留大纲和计数，完整链接列表不入库
+        intermediate_results["page_structure"] = {
+            "title": url_content["title"],
+            "outline": url_content["outline"],
+            "links_count": len(url_content["links"]),
+            "images_count": len(url_content["images"]),
+            "raw_length": url_content["raw_length"],
+            "body_length": url_content["content_length"]
+        }
+
+        # 使用 DeepSeek 分析文本内容
+        with stage_span("content_analysis"):
+            visual_description = await deepseek_service.analyze_text_content(content_for_analysis)
+        deep_decode_result = {"visual_description": visual_description, "extracted_text": extracted_text}
+
+    elif upload_type == "text":
+        # 纯文本
+        extracted_text = upload_data["content_text"]
+        with stage_span("content_reduce"):
+            reduced = await content_reducer.reduce(extracted_text)
+        content_for_analysis = reduced["text"]
+        intermediate_results["content_reduction"] = reduced["stats"]
+        # 使用 DeepSeek 分析文本内容
+        with stage_span("content_analysis"):
+            visual_description = await deepseek_service.analyze_text_content(content_for_analysis)
+        deep_decode_result = {"visual_description": visual_description, "extracted_text": extracted_text}
+
+    return visual_description, extracted_text, content_for_analysis, deep_decode_result
+
+
+async def process_analysis_task(
+    task_id: str,
+    upload_id: str,
+    user_id: str,
+    deep_decode_limit: Optional[asyncio.Semaphore] = None,
+    profile: Optional[str] = None,
+    ticket: Optional[AdmissionTicket] = None,
+    on_start: Optional[Callable[[], None]] = None
+) -> bool:
     """
     后台处理分析任务
     完整流程: Deep Decode -> Contextual Expand -> Dynamic Mosaic
+
+    Args:
+        profile: 请求的分析档位，实际档位在任务开始时按正在运行的分析数决定
+        ticket: 提交时申请的准入名额，先排队等待运行名额再执行
+        on_start: 拿到运行名额后调用 (批量任务据此更新条目状态)
+
+    Returns:
+        任务是否成功完成
     """
+    async with admission_controller.slot(ticket):
+        if on_start:
+            on_start()
+        with analysis_profile_service.track():
+            return await run_analysis_task(task_id, upload_id, user_id, deep_decode_limit, profile)
+
+
+def admission_error(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def release_unbound(tickets: List[AdmissionTicket]):
+    """归还没有分配给任务的准入名额 (复用已有分析的条目，或创建任务失败)"""
+    for ticket in tickets:
+        if ticket.task_id is None:
+            admission_controller.cancel(ticket)
+
+
+async def run_analysis_task(
+    task_id: str,
+    upload_id: str,
+    user_id: str,
+    deep_decode_limit: Optional[asyncio.Semaphore],
+    profile: Optional[str]
+) -> bool:
+    task_started = time.monotonic()
+    selected = analysis_profile_service.select(profile)
+    intermediate_results = {"profile": analysis_profile_service.describe(profile, selected)}
+    progress = TaskProgressReporter(task_id, intermediate_results, progress_keys=TASK_PROGRESS_KEYS)
     try:
-        logger.info(f"开始处理分析任务 {task_id} for upload {upload_id}")
-        intermediate_results = {}
+        logger.info(f"开始处理分析任务 {task_id} for upload {upload_id} (档位 {selected.name})")
+        cache_events = start_cache_tracking()
+        stage_timings = start_stage_timing()
 
-        # 更新任务状态为处理中
-        supabase.table("async_tasks").update({
-            "status": "processing",
-            "progress": 10,
-            "updated_at": datetime.utcnow().isoformat()
-        }).eq("id", task_id).execute()
+        # 更新任务状态为处理中 (状态切换立即写入)
+        progress.update(status="processing", progress=10)
 
         # 1. 获取上传内容
         upload_result = supabase.table("uploads").select("*").eq("id", upload_id).execute()
@@ -71,90 +257,33 @@ async def process_analysis_task(task_id: str, upload_id: str, user_id: str):
         }
 
         # 更新进度: 20%
-        intermediate_results["step_message"] = "正在准备内容..."
-        supabase.table("async_tasks").update({
-            "progress": 20,
-            "result_data": intermediate_results,
-            "updated_at": datetime.utcnow().isoformat()
-        }).eq("id", task_id).execute()
+        progress.update(progress=20, step_message="正在准备内容...")
 
         # 2. Step 1: Deep Decode (深度解析)
         logger.info(f"Step 1: Deep Decode - 解析内容类型: {upload_type}")
 
-        visual_description = None
-        extracted_text = None
-        content_for_analysis = ""
-        deep_decode_result = {}
-
-        if upload_type == "image":
-            # 图片分析 - 下载并转换为 Base64 传输
-            image_url = upload_data["image_url"]
-            logger.info(f"正在从 Supabase Storage 下载图片: {image_url}")
-            
-            try:
-                # 从 URL 中提取存储路径
-                # URL 格式通常为: .../storage/v1/object/public/uploads/{path}
-                # 我们假设 bucket 名字是 "uploads"
-                path = image_url.split("/uploads/")[-1]
-                
-                # 使用 Supabase 客户端直接下载文件内容
-                img_bytes = supabase.storage.from_("uploads").download(path)
-                
-                base64_image = base64.b64encode(img_bytes).decode('utf-8')
-            except Exception as e:
-                logger.error(f"从 Supabase 下载图片失败: {str(e)}")
-                # 如果 Supabase 下载失败，尝试回退到 HTTP 下载 (带 User-Agent)
-                logger.info("尝试回退到 HTTP 下载...")
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    headers = {"User-Agent": "Mosaic-Backend/1.0"}
-                    img_res = await client.get(image_url, headers=headers)
-                    img_res.raise_for_status()
-                    base64_image = base64.b64encode(img_res.content).decode('utf-8')
-            
-            # 第一步：使用简单 Prompt 获取原始 OCR 结果
-            logger.info("Step 1: 使用简单 Prompt 调用 DeepSeek-OCR")
-            vision_result = await deepseek_service.analyze_image(base64_image, is_url=False)
-            deep_decode_result = vision_result
-
-            visual_description = vision_result.get("visual_description", "")
-            extracted_text = vision_result.get("extracted_text", "")
-            
-            # 如果 OCR 模型返回了有效的描述，我们认为第一步成功
-            content_for_analysis = f"{visual_description}\n{extracted_text}"
-
-        elif upload_type == "url":
-            # URL 内容抓取
-            url = upload_data["content_text"]
-            url_content = await jina_service.fetch_url_content(url)
-            # 保存完整内容到 extracted_text 用于前端展示
-            extracted_text = url_content["content"]
-            # 分析用的内容可以稍微长一些 (30k 字符)
-            content_for_analysis = url_content["content"][:30000]
-            
-            # 使用 DeepSeek 分析文本内容
-            visual_description = await deepseek_service.analyze_text_content(content_for_analysis)
-            deep_decode_result = {"visual_description": visual_description, "extracted_text": extracted_text}
-
-        elif upload_type == "text":
-            # 纯文本
-            content_for_analysis = upload_data["content_text"]
-            extracted_text = content_for_analysis
-            # 使用 DeepSeek 分析文本内容
-            visual_description = await deepseek_service.analyze_text_content(content_for_analysis[:30000])
+        # 其他用户分析过相同的公开 URL 时复用内容解析 (与用户无关)，意图分析和推荐仍按当前用户执行
+        shared_decode = dedup_service.find_shared_decode(upload_data, user_id)
+        if shared_decode:
+            logger.info(f"复用分析 {shared_decode['analysis_id']} 的内容解析结果")
+            intermediate_results["shared_decode_from"] = shared_decode["analysis_id"]
+            visual_description = shared_decode["visual_description"]
+            extracted_text = shared_decode["extracted_text"]
+            content_for_analysis = shared_decode["content_for_analysis"]
             deep_decode_result = {"visual_description": visual_description, "extracted_text": extracted_text}
+        else:
+            # 批量任务中限制同时执行 Deep Decode 的条目数
+            async with deep_decode_limit or nullcontext():
+                visual_description, extracted_text, content_for_analysis, deep_decode_result = \
+                    await run_deep_decode(upload_data, intermediate_results)
 
         intermediate_results["deep_decode"] = {
             **deep_decode_result,
             "content_for_analysis": content_for_analysis
         }
-        intermediate_results["step_message"] = "深度解析完成."
 
         # 更新进度: 40%
-        supabase.table("async_tasks").update({
-            "progress": 40,
-            "result_data": intermediate_results,
-            "updated_at": datetime.utcnow().isoformat()
-        }).eq("id", task_id).execute()
+        progress.update(progress=40, step_message="深度解析完成.")
 
         # 3. Step 2: Contextual Expand (意图分析和扩展)
         logger.info("Step 2: Contextual Expand - 进行意图分析")
@@ -165,12 +294,17 @@ async def process_analysis_task(task_id: str, upload_id: str, user_id: str):
         if user_pref_result.data:
             user_history = user_pref_result.data[0].get("liked_keywords", [])
 
-        # AI 意图分析
-        intent_result = await deepseek_service.analyze_intent(
-            content=content_for_analysis,
-            visual_context={"visual_description": visual_description} if visual_description else None,
-            user_history=user_history
-        )
+        # AI 意图分析: 已有内容分析结果时只附带一小段原文摘录，避免重复支付整篇内容的 token
+        intent_content = content_for_analysis
+        if upload_type in ("url", "text") and visual_description:
+            intent_content = truncate_to_budget(content_for_analysis, settings.LLM_INTENT_CONTENT_TOKENS)
+
+        with stage_span("intent"):
+            intent_result = await deepseek_service.analyze_intent(
+                content=intent_content,
+                visual_context={"visual_description": visual_description} if visual_description else None,
+                user_history=user_history
+            )
 
         keywords = intent_result.get("keywords", [])
         interest_tags = intent_result.get("interest_tags", [])
@@ -188,17 +322,13 @@ async def process_analysis_task(task_id: str, upload_id: str, user_id: str):
             "completed_at": datetime.utcnow().isoformat()
         }
 
-        analysis_result = supabase.table("analyses").insert(analysis_data).execute()
+        with stage_span("persist"):
+            analysis_result = supabase.table("analyses").insert(analysis_data).execute()
         intermediate_results["contextual_expand"] = intent_result
-        intermediate_results["step_message"] = "关联扩展完成."
         analysis_id = analysis_result.data[0]["id"]
 
         # 更新进度: 60%
-        supabase.table("async_tasks").update({
-            "progress": 60,
-            "result_data": intermediate_results,
-            "updated_at": datetime.utcnow().isoformat()
-        }).eq("id", task_id).execute()
+        progress.update(progress=60, step_message="关联扩展完成.")
 
         # 4. Step 3: Dynamic Mosaic (生成推荐磁贴)
         logger.info("Step 3: Dynamic Mosaic - 生成推荐内容")
@@ -206,30 +336,29 @@ async def process_analysis_task(task_id: str, upload_id: str, user_id: str):
         recommendations, search_results = await recommender_service.generate_recommendations(
             analysis_data=intent_result,
             user_id=user_id,
-            count=10
+            profile=selected
         )
         intermediate_results["search_results"] = search_results
-        intermediate_results["step_message"] = "搜索完成，正在生成推荐..."
+        intermediate_results["llm_cache"] = summarize_cache_events(cache_events)
 
         # 更新进度: 80%
-        supabase.table("async_tasks").update({
-            "progress": 80,
-            "result_data": intermediate_results,
-            "updated_at": datetime.utcnow().isoformat()
-        }).eq("id", task_id).execute()
+        progress.update(progress=80, step_message="搜索完成，正在生成推荐...")
 
         # 保存推荐结果
         saved_recommendations = []
-        for rec in recommendations:
-            rec_data = {
-                "analysis_id": analysis_id,
-                "user_id": user_id,
-                **rec
-            }
-            res = supabase.table("recommendations").insert(rec_data).execute()
-            if res.data:
-                saved_rec = res.data[0]
-                saved_recommendations.append(saved_rec)
+        with stage_span("persist"):
+            for rec in recommendations:
+                rec_data = {
+                    "analysis_id": analysis_id,
+                    "user_id": user_id,
+                    **rec
+                }
+                res = supabase.table("recommendations").insert(rec_data).execute()
+                if res.data:
+                    saved_rec = res.data[0]
+                    saved_recommendations.append(saved_rec)
+
+        intermediate_results["timings"] = summarize_stage_timings(stage_timings)
 
         # 触发后台文章生成任务 (不等待完成)
         asyncio.create_task(
@@ -239,11 +368,6 @@ async def process_analysis_task(task_id: str, upload_id: str, user_id: str):
             )
         )
 
-        # 更新 analysis 记录，添加完整上下文
-        supabase.table("analyses").update({
-            "full_context": intermediate_results
-        }).eq("id", analysis_id).execute()
-
         final_result_data = {
             "analysis_id": analysis_id,
             "upload_id": upload_id,
@@ -254,25 +378,36 @@ async def process_analysis_task(task_id: str, upload_id: str, user_id: str):
         intermediate_results["final_result"] = final_result_data
         intermediate_results["step_message"] = "动态拼贴完成."
 
-        supabase.table("async_tasks").update({
-            "status": "completed",
-            "progress": 100,
-            "result_data": intermediate_results,
-            "completed_at": datetime.utcnow().isoformat(),
-            "updated_at": datetime.utcnow().isoformat()
-        }).eq("id", task_id).execute()
+        # 更新 analysis 记录，添加完整上下文 (包含 final_result: 推荐已全部写入，去重据此判断分析可以复用)
+        supabase.table("analyses").update({
+            "full_context": intermediate_results
+        }).eq("id", analysis_id).execute()
+        # 分析记录在推荐和完整上下文写入前已标记为 completed，期间可能被缓存
+        response_cache.invalidate(f"analysis:{analysis_id}")
+
+        # 终态总是立即写入，result_data 只包含轻量字段 (完整上下文已写入 analyses.full_context)
+        progress.finish(
+            "completed",
+            result_keys=TASK_RESULT_KEYS,
+            progress=100,
+            completed_at=datetime.utcnow().isoformat()
+        )
 
-        logger.info(f"分析任务 {task_id} 完成")
+        ANALYSIS_TASKS.inc(status="completed")
+        STAGE_DURATION.observe(time.monotonic() - task_started, stage="total", status="ok")
+        logger.info(f"分析任务 {task_id} 完成，进度写入 {progress.stats()}")
+        return True
 
     except Exception as e:
+        ANALYSIS_TASKS.inc(status="failed")
+        STAGE_DURATION.observe(time.monotonic() - task_started, stage="total", status="error")
         logger.error(f"分析任务 {task_id} 失败: {str(e)}", exc_info=True)
 
         # 更新任务为失败状态
-        supabase.table("async_tasks").update({
-            "status": "failed",
-            "error_message": str(e),
-            "updated_at": datetime.utcnow().isoformat()
-        }).eq("id", task_id).execute()
+        try:
+            progress.finish("failed", error_message=str(e))
+        except Exception as write_error:
+            logger.error(f"写入任务 {task_id} 失败状态失败: {str(write_error)}")
 
         # 同时更新 analysis 表状态
         try:
@@ -282,6 +417,49 @@ async def process_analysis_task(task_id: str, upload_id: str, user_id: str):
             }).eq("upload_id", upload_id).execute()
         except:
             pass
+        response_cache.invalidate(f"upload:{upload_id}")
+        return False
+
+
+async def reuse_existing_analysis(
+    upload: Dict[str, Any],
+    user_id: str,
+    parent_task_id: Optional[str] = None
+) -> Optional[AnalyzeResponse]:
+    """复用相同内容的已完成分析，返回已完成的任务；没有可复用结果时返回 None"""
+    try:
+        source = dedup_service.find_reusable_analysis(upload, user_id)
+        if not source:
+            return None
+
+        full_context = dedup_service.clone_analysis(source, upload["id"], user_id)
+        # 与正常完成的任务一致，result_data 只保存轻量字段，查询时从 analyses.full_context 合并完整上下文
+        result_data = {key: full_context[key] for key in TASK_RESULT_KEYS if key in full_context}
+        now = datetime.utcnow().isoformat()
+        input_data = {"upload_id": upload["id"]}
+        if parent_task_id:
+            input_data["parent_task_id"] = parent_task_id
+        task_result = supabase.table("async_tasks").insert({
+            "user_id": user_id,
+            "task_type": "analyze",
+            "status": "completed",
+            "progress": 100,
+            "input_data": input_data,
+            "result_data": result_data,
+            "completed_at": now
+        }).execute()
+        task_id = task_result.data[0]["id"]
+
+        logger.info(f"upload {upload['id']} 复用分析 {source['id']}，任务 {task_id} 直接完成")
+        return AnalyzeResponse(
+            task_id=task_id,
+            status="completed",
+            message="已复用相同内容的分析结果"
+        )
+    except Exception as e:
+        # 复用失败时回退到完整分析
+        logger.warning(f"复用已有分析失败，执行完整分析: {str(e)}")
+        return None
 
 
 @router.post("/analyze", response_model=AnalyzeResponse)
@@ -302,15 +480,30 @@ async def analyze_upload(
         if not upload_result.data:
             raise HTTPException(status_code=404, detail="上传记录不存在或无权访问")
 
-        # 检查是否已经有进行中的分析任务
-        existing_task = supabase.table("async_tasks").select("*").eq("input_data", json.dumps({"upload_id": request.upload_id})).eq("status", "processing").execute()
+        # 相同内容已有完成的分析时直接复制结果，不再执行完整流水线
+        if request.reuse_existing and settings.ANALYSIS_DEDUP_ENABLED:
+            reused = await reuse_existing_analysis(upload_result.data[0], user_id)
+            if reused:
+                return reused
+
+        # 检查是否已经有进行中的分析任务 (包括排队等待运行名额的 pending 任务)
+        existing_task = supabase.table("async_tasks").select("*").eq("input_data", json.dumps({"upload_id": request.upload_id})).in_("status", ["pending", "processing"]).execute()
         if existing_task.data:
+            existing = existing_task.data[0]
             return AnalyzeResponse(
-                task_id=existing_task.data[0]["id"],
-                status="processing",
-                message="分析任务已在进行中"
+                task_id=existing["id"],
+                status=existing["status"],
+                message="分析任务已在进行中",
+                queue=admission_controller.position(existing["id"])
             )
 
+        # 申请准入名额，队列已满时不创建任务
+        try:
+            ticket, = admission_controller.reserve(user_id)
+        except AdmissionRejected as e:
+            logger.info(f"用户 {user_id} 的分析请求被拒绝: {str(e)}")
+            raise admission_error(e)
+
         # 创建异步任务
         task_data = {
             "user_id": user_id,
@@ -320,18 +513,30 @@ async def analyze_upload(
             "input_data": {"upload_id": request.upload_id}
         }
 
-        task_result = supabase.table("async_tasks").insert(task_data).execute()
+        try:
+            task_result = supabase.table("async_tasks").insert(task_data).execute()
+        except Exception:
+            admission_controller.cancel(ticket)
+            raise
         task_id = task_result.data[0]["id"]
+        admission_controller.bind(ticket, task_id)
 
         # 添加后台任务
-        background_tasks.add_task(process_analysis_task, task_id, request.upload_id, user_id)
+        background_tasks.add_task(
+            process_analysis_task, task_id, request.upload_id, user_id, profile=request.profile, ticket=ticket
+        )
 
-        logger.info(f"分析任务 {task_id} 已创建并提交到后台处理")
+        queue = admission_controller.position(task_id)
+        if queue:
+            logger.info(f"分析任务 {task_id} 已创建，排队第 {queue['position']} 位")
+        else:
+            logger.info(f"分析任务 {task_id} 已创建并提交到后台处理")
 
         return AnalyzeResponse(
             task_id=task_id,
             status="pending",
-            message="分析任务已创建，正在后台处理"
+            message=f"分析任务已排队，前面还有 {queue['position'] - 1} 个任务" if queue else "分析任务已创建，正在后台处理",
+            queue=queue
         )
 
     except HTTPException:
@@ -341,6 +546,205 @@ async def analyze_upload(
         raise HTTPException(status_code=500, detail=f"创建分析任务失败: {str(e)}")
 
 
+async def process_batch_analysis_task(
+    parent_task_id: str,
+    items: List[Dict[str, Any]],
+    user_id: str,
+    profile: Optional[str] = None,
+    tickets: Optional[Dict[str, AdmissionTicket]] = None
+):
+    """
+    后台处理批量分析任务
+    子任务并发执行 (受准入控制的运行名额限制)，Deep Decode 限制并发数，所有子任务共享同一个搜索查询作用域
+
+    Args:
+        tickets: 子任务 ID -> 提交时申请的准入名额
+    """
+    tickets = tickets or {}
+    started = time.monotonic()
+    total = len(items)
+    finished = [item for item in items if item["status"] == "completed"]
+    pending = [item for item in items if item["status"] != "completed"]
+    failed_count = 0
+
+    search_scope = start_shared_search_scope()
+    deep_decode_limit = asyncio.Semaphore(settings.BATCH_DEEP_DECODE_CONCURRENCY)
+    progress = TaskProgressReporter(parent_task_id)
+
+    def build_result() -> Dict[str, Any]:
+        elapsed = time.monotonic() - started
+        processed = len(finished) + failed_count
+        return {
+            "items": items,
+            "total": total,
+            "completed": len(finished),
+            "failed": failed_count,
+            "reused": sum(1 for item in items if item.get("reused")),
+            "metrics": {
+                "elapsed_seconds": round(elapsed, 2),
+                "items_per_minute": round(processed / elapsed * 60, 2) if elapsed > 0 else None,
+                **search_scope.stats()
+            }
+        }
+
+    progress.result.update(build_result())
+    progress.update(status="processing", progress=int(len(finished) / total * 100))
+
+    async def run_item(item: Dict[str, Any]):
+        nonlocal failed_count
+        success = await process_analysis_task(
+            item["task_id"], item["upload_id"], user_id, deep_decode_limit=deep_decode_limit, profile=profile,
+            ticket=tickets.get(item["task_id"]), on_start=lambda: item.update(status="processing")
+        )
+        item["status"] = "completed" if success else "failed"
+        if success:
+            finished.append(item)
+        else:
+            failed_count += 1
+
+        # 条目完成得很密集时合并为一次写入
+        progress.result.update(build_result())
+        progress.update(progress=int((len(finished) + failed_count) / total * 100))
+
+    logger.info(f"开始处理批量分析任务 {parent_task_id}: {len(pending)} 条待分析，{len(finished)} 条已复用")
+    try:
+        await asyncio.gather(*[run_item(item) for item in pending])
+    except Exception as e:
+        logger.error(f"批量分析任务 {parent_task_id} 失败: {str(e)}", exc_info=True)
+        progress.finish("failed", error_message=str(e))
+        return
+
+    result = build_result()
+    all_failed = failed_count == total
+    progress.result.update(result)
+    progress.finish(
+        "failed" if all_failed else "completed",
+        progress=100,
+        error_message="批量任务中所有条目均分析失败" if all_failed else None,
+        completed_at=datetime.utcnow().isoformat()
+    )
+
+    logger.info(
+        f"批量分析任务 {parent_task_id} 完成: {result['completed']}/{total} 成功，"
+        f"{result['metrics']['items_per_minute']} 条/分钟，"
+        f"搜索查询 {result['metrics']['queries_requested']} -> {result['metrics']['queries_executed']}"
+    )
+
+
+@router.post("/analyze-batch", response_model=BatchAnalyzeResponse)
+async def analyze_batch(
+    request: BatchAnalyzeRequest,
+    background_tasks: BackgroundTasks,
+    authorization: Optional[str] = Header(None)
+):
+    """
+    批量分析多个上传内容（异步处理）
+    创建一个父任务，每个上传对应一个子任务；父任务的 result_data 汇总子任务状态和吞吐量
+    """
+    tickets: List[AdmissionTicket] = []
+    child_tickets: Dict[str, AdmissionTicket] = {}
+    try:
+        user_id = get_user_from_token(authorization)
+
+        # 去重并保持顺序
+        upload_ids = list(dict.fromkeys(request.upload_ids))
+        if not upload_ids:
+            raise HTTPException(status_code=400, detail="upload_ids 不能为空")
+        if len(upload_ids) > settings.BATCH_ANALYSIS_MAX_ITEMS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"单次最多分析 {settings.BATCH_ANALYSIS_MAX_ITEMS} 个上传"
+            )
+
+        logger.info(f"用户 {user_id} 请求批量分析 {len(upload_ids)} 个上传")
+
+        # 一次查询验证所有上传记录都属于当前用户
+        upload_result = supabase.table("uploads").select("*").in_("id", upload_ids).eq("user_id", user_id).execute()
+        uploads = {row["id"]: row for row in upload_result.data}
+        missing = [upload_id for upload_id in upload_ids if upload_id not in uploads]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"上传记录不存在或无权访问: {', '.join(missing)}")
+
+        # 按上传数申请准入名额 (全部接受或全部拒绝)，复用已有分析的条目随后归还
+        try:
+            tickets = admission_controller.reserve(user_id, len(upload_ids))
+        except AdmissionRejected as e:
+            logger.info(f"用户 {user_id} 的批量分析请求被拒绝: {str(e)}")
+            raise admission_error(e)
+
+        parent_result = supabase.table("async_tasks").insert({
+            "user_id": user_id,
+            "task_type": "analyze_batch",
+            "status": "pending",
+            "progress": 0,
+            "input_data": {"upload_ids": upload_ids}
+        }).execute()
+        parent_task_id = parent_result.data[0]["id"]
+
+        items: List[Dict[str, Any]] = []
+        new_upload_ids: List[str] = []
+        for upload_id in upload_ids:
+            # 相同内容已有完成的分析时直接复制结果
+            if request.reuse_existing and settings.ANALYSIS_DEDUP_ENABLED:
+                reused = await reuse_existing_analysis(uploads[upload_id], user_id, parent_task_id)
+                if reused:
+                    items.append({
+                        "upload_id": upload_id,
+                        "task_id": reused.task_id,
+                        "status": "completed",
+                        "reused": True
+                    })
+                    continue
+            new_upload_ids.append(upload_id)
+
+        # 子任务一次批量写入
+        if new_upload_ids:
+            child_result = supabase.table("async_tasks").insert([
+                {
+                    "user_id": user_id,
+                    "task_type": "analyze",
+                    "status": "pending",
+                    "progress": 0,
+                    "input_data": {"upload_id": upload_id, "parent_task_id": parent_task_id}
+                }
+                for upload_id in new_upload_ids
+            ]).execute()
+            for row, ticket in zip(child_result.data, tickets):
+                admission_controller.bind(ticket, row["id"])
+                child_tickets[row["id"]] = ticket
+                items.append({
+                    "upload_id": row["input_data"]["upload_id"],
+                    "task_id": row["id"],
+                    "status": "pending",
+                    "reused": False
+                })
+        release_unbound(tickets)
+
+        # 按请求顺序返回
+        order = {upload_id: index for index, upload_id in enumerate(upload_ids)}
+        items.sort(key=lambda item: order[item["upload_id"]])
+
+        background_tasks.add_task(
+            process_batch_analysis_task, parent_task_id, items, user_id, request.profile, child_tickets
+        )
+
+        logger.info(f"批量分析任务 {parent_task_id} 已创建: {len(new_upload_ids)} 条新分析，{len(items) - len(new_upload_ids)} 条复用")
+
+        return BatchAnalyzeResponse(
+            task_id=parent_task_id,
+            status="pending",
+            message=f"批量分析任务已创建，共 {len(items)} 条",
+            items=[dict(item) for item in items]
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        release_unbound(tickets)
+        logger.error(f"创建批量分析任务失败: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"创建批量分析任务失败: {str(e)}")
+
+
 class AnalysisDetailResponse(BaseModel):
     id: str
     upload_id: str
@@ -356,13 +760,19 @@ class AnalysisDetailResponse(BaseModel):
 @router.get("/{analysis_id}", response_model=AnalysisDetailResponse)
 async def get_analysis_details(
     analysis_id: str,
+    request: Request,
     authorization: Optional[str] = Header(None)
 ):
     """
-    获取分析详情
+    获取分析详情 (已完成或失败的分析缓存在进程内，支持 If-None-Match)
     """
     try:
         user_id = get_user_from_token(authorization)
+
+        cache_key = f"analysis:{analysis_id}"
+        cached = response_cache.get(user_id, cache_key)
+        if cached:
+            return response_cache.respond(request, cached, "analysis", "hit")
         
         result = supabase.table("analyses").select("*").eq("id", analysis_id).eq("user_id", user_id).execute()
         
@@ -379,8 +789,15 @@ async def get_analysis_details(
                 "type": upload["type"],
                 "content": upload.get("image_url") if upload["type"] == "image" else upload.get("content_text")
             }
-            
-        return analysis_data
+
+        # 进行中的分析仍会变化，只计算 ETag 不缓存
+        finished = analysis_data.get("status") in ("completed", "failed")
+        entry = response_cache.put(
+            user_id, cache_key, AnalysisDetailResponse.model_validate(analysis_data),
+            tags=(f"analysis:{analysis_id}", f"upload:{analysis_data['upload_id']}"),
+            store=finished
+        )
+        return response_cache.respond(request, entry, "analysis", "miss" if finished else "bypass")
 
     except HTTPException:
         raise
@@ -407,12 +824,48 @@ async def get_task_status(
             raise HTTPException(status_code=404, detail="任务不存在或无权访问")
 
         task = task_result.data[0]
+        result_data = task.get("result_data")
+
+        # 已完成的分析任务只保存了轻量字段，完整中间结果从 analyses.full_context 合并
+        analysis_id = ((result_data or {}).get("final_result") or {}).get("analysis_id")
+        if task["status"] == "completed" and analysis_id and "deep_decode" not in result_data:
+            analysis_result = supabase.table("analyses").select("full_context") \
+                .eq("id", analysis_id) \
+                .eq("user_id", user_id) \
+                .execute()
+            if analysis_result.data and analysis_result.data[0].get("full_context"):
+                result_data = {**analysis_result.data[0]["full_context"], **result_data}
+
+        # 批量任务: 附带子任务的实时进度
+        if task.get("task_type") == "analyze_batch" and result_data and result_data.get("items"):
+            child_ids = [item["task_id"] for item in result_data["items"]]
+            children = supabase.table("async_tasks").select("id, status, progress") \
+                .in_("id", child_ids) \
+                .execute()
+            child_state = {row["id"]: row for row in children.data}
+            for item in result_data["items"]:
+                child = child_state.get(item["task_id"])
+                if child:
+                    item["status"] = child["status"]
+                    item["progress"] = child.get("progress", 0)
+                queue = admission_controller.position(item["task_id"])
+                if queue:
+                    item["queue"] = queue
+
+        # 排队中的任务: 附带队列位置和预计完成时间 (只有提交到当前进程的任务)
+        queue = admission_controller.position(task["id"]) if task["status"] == "pending" else None
+        if queue:
+            result_data = {
+                **(result_data or {}),
+                "step_message": f"排队中，前面还有 {queue['position'] - 1} 个任务",
+                "queue": queue
+            }
 
         return TaskStatusResponse(
             task_id=task["id"],
             status=task["status"],
             progress=task.get("progress", 0),
-            result=task.get("result_data"),
+            result=result_data,
             error=task.get("error_message")
         )
 
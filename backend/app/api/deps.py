@@ -0,0 +1,22 @@
+"""
+依赖注入访问器
+路由通过 Depends(get_xxx) 获取服务实例，实例在第一次使用时创建；
+测试中可以用 app.dependency_overrides[get_xxx] 或 app.services.container.override() 替换
+"""
+from app.database import get_supabase  # noqa: F401 (与其他访问器一起从这里导入)
+from app.services.container import provider
+from app.services.deepseek import deepseek_service
+from app.services.image_gen import image_gen_service
+from app.services.jina import jina_service
+from app.services.lazy_images import lazy_image_service
+from app.services.llm_gateway import llm_gateway
+from app.services.recommender import recommender_service
+from app.services.search import search_service
+
+get_deepseek_service = provider(deepseek_service)
+get_image_gen_service = provider(image_gen_service)
+get_jina_service = provider(jina_service)
+get_lazy_image_service = provider(lazy_image_service)
+get_llm_gateway = provider(llm_gateway)
+get_recommender_service = provider(recommender_service)
+get_search_service = provider(search_service)
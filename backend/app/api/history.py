@@ -8,6 +8,9 @@ from typing import List, Optional, Dict, Any
 import logging
 from app.database import supabase
 from app.api.upload import get_user_from_token
+from app.services.blob_cache import blob_cache
+from app.services.image_variants import image_variant_service, THUMBNAIL_LABEL
+from app.services.response_cache import response_cache
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +26,9 @@ class HistoryItem(BaseModel):
     recommendation_count: int
     created_at: str
     full_context: Optional[Dict[str, Any]] = None
+    image_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None  # WebP 缩略图，尚未生成时为空 (使用 image_url)
+    image_variants: Optional[Dict[str, str]] = None  # 响应式宽度版本 {"w480": url, ...}
 
 
 
@@ -111,7 +117,10 @@ async def get_history(
                 analysis_summary=analysis_summary,
                 recommendation_count=recommendation_count,
                 created_at=upload["created_at"],
-                full_context=full_context
+                full_context=full_context,
+                image_url=upload.get("image_url"),
+                thumbnail_url=(upload.get("image_variants") or {}).get(THUMBNAIL_LABEL),
+                image_variants=upload.get("image_variants")
             ))
 
         return HistoryResponse(
@@ -154,13 +163,28 @@ async def delete_history_item(
                 image_url = upload["image_url"]
                 # Supabase Storage URL 格式: https://{project}.supabase.co/storage/v1/object/public/uploads/{path}
                 path = image_url.split("/uploads/")[-1]
-                supabase.storage.from_("uploads").remove([path])
-                logger.info(f"已删除 Storage 文件: {path}")
+
+                # 去重后多条上传可能共用同一个 Storage 对象，仍被引用时保留
+                shared = supabase.table("uploads").select("id").eq("image_url", image_url).neq("id", upload_id).limit(1).execute()
+                if shared.data:
+                    logger.info(f"Storage 文件仍被其他上传引用，跳过删除: {path}")
+                else:
+                    supabase.storage.from_("uploads").remove(
+                        [path, *image_variant_service.variant_paths(path, upload.get("image_variants"))]
+                    )
+                    await blob_cache.discard(path)
+                    logger.info(f"已删除 Storage 文件: {path}")
             except Exception as e:
                 logger.warning(f"删除 Storage 文件失败: {str(e)}")
 
+        # 级联删除前记下关联的分析，文章缓存只带有分析标签
+        analyses = supabase.table("analyses").select("id").eq("upload_id", upload_id).execute()
+
         # 删除上传记录（级联删除会自动删除关联的分析和推荐）
         supabase.table("uploads").delete().eq("id", upload_id).execute()
+        response_cache.invalidate(
+            f"upload:{upload_id}", *(f"analysis:{analysis['id']}" for analysis in analyses.data or [])
+        )
 
         logger.info(f"历史记录已删除: {upload_id}")
 
@@ -0,0 +1,38 @@
+"""
+文章配图 API
+文章中的 <img> 指向这里，首次请求时生成配图，之后重定向到 Storage 中的缓存图片
+"""
+from fastapi import APIRouter, HTTPException, Query, Depends
+from typing import Optional
+from fastapi.responses import RedirectResponse
+import logging
+from app.api.deps import get_lazy_image_service
+from app.services.lazy_images import LazyImageService, InvalidImageToken
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# 重定向的浏览器缓存时间；不宜过长，缓存淘汰后 Storage 对象可能被删除并重新生成
+REDIRECT_MAX_AGE = 3600
+
+
+@router.get("/{token}")
+async def get_article_image(
+    token: str,
+    w: Optional[int] = Query(None, ge=1, le=4096),
+    lazy_image_service: LazyImageService = Depends(get_lazy_image_service)
+):
+    """
+    渲染并重定向到文章配图，w 指定时重定向到不小于该宽度的 WebP 版本 (srcset 使用)
+
+    <img> 请求无法携带 Authorization，地址本身经过签名，只能访问本服务生成的配图
+    """
+    try:
+        url, persistent = await lazy_image_service.render(token, w)
+    except InvalidImageToken:
+        raise HTTPException(status_code=404, detail="配图不存在")
+
+    # 生成失败时重定向到备用图片，不缓存，下次访问重新尝试生成
+    cache_control = f"public, max-age={REDIRECT_MAX_AGE}" if persistent else "no-store"
+    return RedirectResponse(url, status_code=302, headers={"Cache-Control": cache_control})
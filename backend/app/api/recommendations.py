@@ -1,7 +1,7 @@
 """
 推荐和反馈相关 API
 """
-from fastapi import APIRouter, HTTPException, Header, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Header, BackgroundTasks, Request
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import logging
@@ -9,7 +9,10 @@ import asyncio
 from datetime import datetime
 from app.database import supabase
 from app.api.upload import get_user_from_token
-from app.services.recommender import recommender_service
+from app.services.recommender import recommender_service, ArticleGenerationError
+from app.services.response_cache import response_cache
+from app.services.article_store import article_store, ARTICLE_COLUMNS, RECOMMENDATION_COLUMNS
+from app.services.analysis_profiles import analysis_profile_service
 
 logger = logging.getLogger(__name__)
 
@@ -38,53 +41,84 @@ class ArticleResponse(BaseModel):
 @router.get("/{recommendation_id}/article", response_model=ArticleResponse)
 async def get_recommendation_article(
     recommendation_id: str,
+    request: Request,
     regenerate: bool = False,
     authorization: Optional[str] = Header(None)
 ):
     """
-    获取或生成推荐内容的深度文章
+    获取或生成推荐内容的深度文章 (已生成的文章缓存在进程内，支持 If-None-Match)
     """
     try:
         user_id = get_user_from_token(authorization)
 
-        # 1. 获取推荐详情
-        rec_result = supabase.table("recommendations").select("*").eq("id", recommendation_id).eq("user_id", user_id).execute()
+        cache_key = f"article:{recommendation_id}"
+        if regenerate:
+            response_cache.invalidate(f"recommendation:{recommendation_id}")
+        else:
+            cached = response_cache.get(user_id, cache_key)
+            if cached:
+                return response_cache.respond(request, cached, "article", "hit")
+
+        # 1. 获取推荐详情 (先只读取压缩存储的文章)
+        rec_result = supabase.table("recommendations").select(f"id, analysis_id, {ARTICLE_COLUMNS}") \
+            .eq("id", recommendation_id).eq("user_id", user_id).execute()
         if not rec_result.data:
             raise HTTPException(status_code=404, detail="推荐不存在")
         
-        recommendation = rec_result.data[0]
+        analysis_id = rec_result.data[0]["analysis_id"]
+        cache_tags = (f"recommendation:{recommendation_id}", f"analysis:{analysis_id}")
         
         # 2. 如果已有文章且不强制重新生成，直接返回
+        if not regenerate:
+            entry = article_store.to_entry(rec_result.data[0], cache_tags)
+            if entry:
+                response_cache.put_entry(user_id, cache_key, entry)
+                return response_cache.respond(request, entry, "article", "miss")
+
+        rec_result = supabase.table("recommendations").select(f"{RECOMMENDATION_COLUMNS}, article_html") \
+            .eq("id", recommendation_id).execute()
+        recommendation = rec_result.data[0]
         if recommendation.get("article_html") and not regenerate:
-            return ArticleResponse(id=recommendation_id, article_html=recommendation["article_html"])
+            # 压缩存储之前保存的纯文本文章，转为压缩存储
+            values = await article_store.save(recommendation_id, recommendation["article_html"])
+            entry = response_cache.put_entry(
+                user_id, cache_key,
+                article_store.entry(recommendation_id, recommendation["article_html"], values, cache_tags)
+            )
+            return response_cache.respond(request, entry, "article", "miss")
             
         # 3. 获取分析上下文 (Full Context)
-        analysis_id = recommendation["analysis_id"]
         analysis_result = supabase.table("analyses").select("full_context").eq("id", analysis_id).execute()
         
         full_context = {}
         if analysis_result.data and analysis_result.data[0].get("full_context"):
             full_context = analysis_result.data[0]["full_context"]
             
-        # 4. 生成文章
-        article_html = await recommender_service.generate_article(recommendation, full_context)
+        # 4. 生成文章 (失败时返回错误提示，不保存也不缓存，下次请求重新生成)
+        try:
+            article_html = await recommender_service.generate_article(recommendation, full_context)
+        except ArticleGenerationError as e:
+            entry = response_cache.make_entry(article_store.body(recommendation_id, e.to_html()), cache_tags)
+            return response_cache.respond(request, entry, "article", "bypass")
         
+        values: Dict[str, Any] = {}
         if article_html is None:
             # 如果返回 None，说明被锁住并等待结束，此时应该从数据库重新获取
-            rec_result = supabase.table("recommendations").select("article_html").eq("id", recommendation_id).execute()
+            rec_result = supabase.table("recommendations").select(f"article_html, {ARTICLE_COLUMNS}").eq("id", recommendation_id).execute()
             if rec_result.data:
-                article_html = rec_result.data[0].get("article_html")
+                values = rec_result.data[0]
+                article_html = article_store.article_html(values)
         else:
-            # 5. 保存文章
-            try:
-                supabase.table("recommendations").update({
-                    "article_html": article_html
-                }).eq("id", recommendation_id).execute()
-            except Exception as e:
-                logger.warning(f"保存文章到数据库失败 (可能是缺少 article_html 字段): {str(e)}")
-                # 继续执行，返回生成的文章给前端
+            # 5. 保存文章 (压缩存储)，保存失败仍返回生成的文章给前端
+            values = await article_store.save(recommendation_id, article_html)
         
-        return ArticleResponse(id=recommendation_id, article_html=article_html or "")
+        # 等待的其他生成任务失败时没有文章，不缓存，下次请求重新生成
+        entry = response_cache.put_entry(
+            user_id, cache_key,
+            article_store.entry(recommendation_id, article_html or "", values, cache_tags),
+            store=bool(article_html)
+        )
+        return response_cache.respond(request, entry, "article", "miss" if article_html else "bypass")
 
     except HTTPException:
         raise
@@ -118,7 +152,7 @@ async def update_user_preferences(user_id: str, recommendation_id: str, action:
         logger.info(f"更新用户 {user_id} 的偏好，基于反馈: {action}")
 
         # 获取推荐内容详情
-        rec_result = supabase.table("recommendations").select("*").eq("id", recommendation_id).execute()
+        rec_result = supabase.table("recommendations").select(RECOMMENDATION_COLUMNS).eq("id", recommendation_id).execute()
         if not rec_result.data:
             return
 
@@ -215,21 +249,27 @@ async def update_user_preferences(user_id: str, recommendation_id: str, action:
 @router.get("/analysis/{analysis_id}", response_model=RecommendationsResponse)
 async def get_recommendations(
     analysis_id: str,
+    request: Request,
     authorization: Optional[str] = Header(None)
 ):
     """
-    获取分析结果的推荐内容
+    获取分析结果的推荐内容 (分析完成后缓存在进程内，支持 If-None-Match)
     """
     try:
         user_id = get_user_from_token(authorization)
 
+        cache_key = f"recommendations:{analysis_id}"
+        cached = response_cache.get(user_id, cache_key)
+        if cached:
+            return response_cache.respond(request, cached, "recommendations", "hit")
+
         # 验证分析结果是否存在且属于当前用户
         analysis_result = supabase.table("analyses").select("*").eq("id", analysis_id).eq("user_id", user_id).execute()
         if not analysis_result.data:
             raise HTTPException(status_code=404, detail="分析结果不存在或无权访问")
 
         # 获取推荐内容
-        rec_result = supabase.table("recommendations").select("*").eq("analysis_id", analysis_id).order("display_order").execute()
+        rec_result = supabase.table("recommendations").select(RECOMMENDATION_COLUMNS).eq("analysis_id", analysis_id).order("display_order").execute()
 
         recommendations = [
             RecommendationItem(
@@ -247,11 +287,20 @@ async def get_recommendations(
             for rec in rec_result.data
         ]
 
-        return RecommendationsResponse(
-            analysis_id=analysis_id,
-            recommendations=recommendations,
-            total=len(recommendations)
+        # 分析完成前推荐列表还会写入，只计算 ETag 不缓存
+        analysis = analysis_result.data[0]
+        completed = analysis.get("status") == "completed"
+        entry = response_cache.put(
+            user_id, cache_key,
+            RecommendationsResponse(
+                analysis_id=analysis_id,
+                recommendations=recommendations,
+                total=len(recommendations)
+            ),
+            tags=(f"analysis:{analysis_id}", f"upload:{analysis['upload_id']}"),
+            store=completed
         )
+        return response_cache.respond(request, entry, "recommendations", "miss" if completed else "bypass")
 
     except HTTPException:
         raise
@@ -278,7 +327,7 @@ async def submit_feedback(
             raise HTTPException(status_code=400, detail="无效的操作类型")
 
         # 验证推荐是否存在且属于当前用户
-        rec_result = supabase.table("recommendations").select("*").eq("id", request.recommendation_id).eq("user_id", user_id).execute()
+        rec_result = supabase.table("recommendations").select(RECOMMENDATION_COLUMNS).eq("id", request.recommendation_id).eq("user_id", user_id).execute()
         if not rec_result.data:
             raise HTTPException(status_code=404, detail="推荐不存在或无权访问")
 
@@ -290,6 +339,7 @@ async def submit_feedback(
             "user_action": request.action,
             "user_action_at": datetime.utcnow().isoformat()
         }).eq("id", request.recommendation_id).execute()
+        response_cache.invalidate(f"analysis:{analysis_id}")
 
         # 后台更新用户偏好
         background_tasks.add_task(update_user_preferences, user_id, request.recommendation_id, request.action)
@@ -302,13 +352,16 @@ async def submit_feedback(
 
         analysis_data = analysis_result.data[0]
         intent_analysis = analysis_data.get("intent_analysis", {})
+        # 沿用分析时实际使用的档位
+        profile_record = (analysis_data.get("full_context") or {}).get("profile")
+        profile = analysis_profile_service.for_context(analysis_data.get("full_context"))
 
         # 重新生成推荐（异步）
         try:
             new_recommendations, search_results = await recommender_service.generate_recommendations(
                 analysis_data=intent_analysis,
                 user_id=user_id,
-                count=10
+                profile=profile
             )
 
             # 删除旧的推荐（除了已有用户反馈的）
@@ -328,13 +381,16 @@ async def submit_feedback(
             
             # 触发后台文章生成
             if saved_new_recs:
-                context = {"search_results": search_results}
+                context = {"search_results": search_results, "profile": profile_record}
                 asyncio.create_task(
                     recommender_service.generate_articles_background(saved_new_recs, context)
                 )
 
+            # 重新生成替换了推荐列表，在反馈之后读到的缓存也要失效
+            response_cache.invalidate(f"analysis:{analysis_id}")
+
             # 获取更新后的推荐列表
-            updated_result = supabase.table("recommendations").select("*").eq("analysis_id", analysis_id).order("display_order").execute()
+            updated_result = supabase.table("recommendations").select(RECOMMENDATION_COLUMNS).eq("analysis_id", analysis_id).order("display_order").execute()
 
             updated_recs = [
                 RecommendationItem(
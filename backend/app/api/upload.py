@@ -2,15 +2,20 @@
 上传相关 API
 支持图片、URL、文本三种类型的上传
 """
-from fastapi import APIRouter, HTTPException, Header, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, Header, Request, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional
 import logging
-import base64
 import uuid
 from datetime import datetime
+from app.config import settings
 from app.database import supabase
 from app.services.jina import jina_service
+from app.services.blob_cache import blob_cache
+from app.services.dedup import dedup_service, hash_url, hash_text
+from app.services.image_variants import image_variant_service
+from app.services.upload_stream import receive_file_upload, UploadRejectedError, UploadTooLargeError
 
 logger = logging.getLogger(__name__)
 
@@ -46,55 +51,94 @@ def get_user_from_token(authorization: Optional[str]) -> str:
         raise HTTPException(status_code=401, detail="认证失败")
 
 
-@router.post("/image", response_model=UploadResponse)
+@router.post(
+    "/image",
+    response_model=UploadResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["file"],
+                        "properties": {"file": {"type": "string", "format": "binary"}}
+                    }
+                }
+            }
+        }
+    }
+)
 async def upload_image(
-    file: UploadFile = File(...),
+    request: Request,
+    background_tasks: BackgroundTasks,
     authorization: Optional[str] = Header(None)
 ):
-    """上传图片"""
+    """上传图片（流式接收，边读边校验大小并落盘到临时文件）"""
+    upload = None
     try:
         user_id = get_user_from_token(authorization)
-        logger.info(f"用户 {user_id} 上传图片: {file.filename}")
 
-        # 验证文件类型
-        if not file.content_type or not file.content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail="只支持图片文件")
+        # 流式读取文件，超过大小上限立即拒绝
+        try:
+            upload = await receive_file_upload(request, max_bytes=settings.MAX_IMAGE_UPLOAD_BYTES)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except UploadRejectedError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-        # 读取文件内容
-        file_content = await file.read()
-        file_size = len(file_content)
+        logger.info(f"用户 {user_id} 上传图片: {upload.filename} ({upload.size} 字节, sha256={upload.sha256[:12]})")
+        file_size = upload.size
 
         # 生成唯一文件名
-        file_ext = file.filename.split(".")[-1] if "." in file.filename else "jpg"
+        file_ext = upload.filename.split(".")[-1] if "." in upload.filename else "jpg"
         unique_filename = f"{user_id}/{uuid.uuid4()}.{file_ext}"
 
-        # 上传到 Supabase Storage
-        try:
-            storage_response = supabase.storage.from_("uploads").upload(
-                unique_filename,
-                file_content,
-                {"content-type": file.content_type}
-            )
-            logger.info(f"图片上传到 Storage: {unique_filename}")
-        except Exception as e:
-            logger.error(f"上传到 Storage 失败: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
-
-        # 获取公开 URL
-        image_url = supabase.storage.from_("uploads").get_public_url(unique_filename)
+        # 相同图片已上传过时直接复用 Storage 对象
+        duplicate = dedup_service.find_duplicate_upload(user_id, "image", upload.sha256)
+        image_variants = None
+        if duplicate:
+            image_url = duplicate["image_url"]
+            image_variants = duplicate.get("image_variants")
+            logger.info(f"图片内容与上传 {duplicate['id']} 相同，复用 Storage 对象")
+        else:
+            # 上传到 Supabase Storage (从临时文件流式发送，放到线程池避免阻塞事件循环)
+            try:
+                await run_in_threadpool(
+                    supabase.storage.from_("uploads").upload,
+                    unique_filename,
+                    upload.path,
+                    {"content-type": upload.content_type}
+                )
+                logger.info(f"图片上传到 Storage: {unique_filename}")
+            except Exception as e:
+                logger.error(f"上传到 Storage 失败: {str(e)}")
+                raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
+
+            # 获取公开 URL
+            image_url = supabase.storage.from_("uploads").get_public_url(unique_filename)
+
+        # 暂存到本地缓存，分析任务可直接读取，无需再从 Storage 下载
+        await blob_cache.put_file(image_url.split("/uploads/")[-1], upload.path, upload.size)
 
         # 保存上传记录到数据库
         upload_data = {
             "user_id": user_id,
             "type": "image",
             "image_url": image_url,
-            "content_preview": f"图片: {file.filename}",
-            "file_size": file_size
+            "content_preview": f"图片: {upload.filename}",
+            "file_size": file_size,
+            "content_hash": upload.sha256,
+            "image_variants": image_variants
         }
 
         result = supabase.table("uploads").insert(upload_data).execute()
         upload_id = result.data[0]["id"]
 
+        # 响应返回后在进程池中生成缩略图和响应式版本 (复用的图片已有派生图片时跳过)
+        if not image_variants and image_variant_service.enabled:
+            background_tasks.add_task(image_variant_service.create_for_upload, image_url)
+
         logger.info(f"上传记录已保存: {upload_id}")
 
         return UploadResponse(
@@ -109,6 +153,10 @@ async def upload_image(
     except Exception as e:
         logger.error(f"上传图片失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
+    finally:
+        # 未交给缓存的临时文件在这里清理
+        if upload is not None:
+            upload.cleanup()
 
 
 @router.post("/url", response_model=UploadResponse)
@@ -125,20 +173,28 @@ async def upload_url(
         if not request.content.startswith(("http://", "https://")):
             raise HTTPException(status_code=400, detail="无效的 URL 格式")
 
-        # 使用 Jina Reader 预抓取内容（可选，用于生成预览）
-        try:
-            url_content = await jina_service.fetch_url_content(request.content)
-            content_preview = url_content.get("title", request.content)[:200]
-        except Exception as e:
-            logger.warning(f"预抓取 URL 失败: {str(e)}")
-            content_preview = request.content[:200]
+        content_hash = hash_url(request.content)
+
+        # 同一 URL 已上传过时沿用已有预览，省去一次 Jina 抓取
+        duplicate = dedup_service.find_duplicate_upload(user_id, "url", content_hash)
+        if duplicate and duplicate.get("content_preview"):
+            content_preview = duplicate["content_preview"]
+        else:
+            # 使用 Jina Reader 预抓取内容（可选，用于生成预览）
+            try:
+                url_content = await jina_service.fetch_url_content(request.content)
+                content_preview = url_content.get("title", request.content)[:200]
+            except Exception as e:
+                logger.warning(f"预抓取 URL 失败: {str(e)}")
+                content_preview = request.content[:200]
 
         # 保存上传记录
         upload_data = {
             "user_id": user_id,
             "type": "url",
             "content_text": request.content,
-            "content_preview": content_preview
+            "content_preview": content_preview,
+            "content_hash": content_hash
         }
 
         result = supabase.table("uploads").insert(upload_data).execute()
@@ -185,7 +241,8 @@ async def upload_text(
             "user_id": user_id,
             "type": "text",
             "content_text": request.content,
-            "content_preview": content_preview
+            "content_preview": content_preview,
+            "content_hash": hash_text(request.content)
         }
 
         result = supabase.table("uploads").insert(upload_data).execute()
@@ -1,32 +1,158 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Optional, Dict, List
+
+
+class MissingSettingError(RuntimeError):
+    """使用某项服务时发现所需的配置 (通常是 API Key) 未设置"""
 
 
 class Settings(BaseSettings):
+    # 密钥类配置不在启动时校验，第一次使用对应服务时通过 require() 检查，
+    # 这样只用到部分服务 (或在测试中) 时不需要配置全部密钥
+
     # Supabase
-    SUPABASE_URL: str
-    SUPABASE_KEY: str
-    SUPABASE_DB_PASSWORD: str
+    SUPABASE_URL: Optional[str] = None
+    SUPABASE_KEY: Optional[str] = None
+    SUPABASE_DB_PASSWORD: Optional[str] = None
 
     # DeepSeek (SiliconFlow)
-    DEEPSEEK_API_KEY: str
+    DEEPSEEK_API_KEY: Optional[str] = None
     DEEPSEEK_BASE_URL: str = "https://api.siliconflow.cn/v1"
 
     # Jina Reader
-    JINA_API_KEY: str
+    JINA_API_KEY: Optional[str] = None
+
+    # LLM Gateway (限流、并发和重试)
+    LLM_REQUESTS_PER_MINUTE: int = 120
+    LLM_TOKENS_PER_MINUTE: int = 100000
+    LLM_BACKGROUND_RESERVE: float = 0.2  # 后台调用为交互式调用保留的令牌比例
+    LLM_DEFAULT_CONCURRENCY: int = 4
+    LLM_MODEL_CONCURRENCY: Dict[str, int] = {
+        "deepseek-ai/DeepSeek-OCR": 4,
+        "deepseek-ai/DeepSeek-V3": 8
+    }
+    LLM_JSON_MODE_MODELS: List[str] = ["deepseek-ai/DeepSeek-V3"]  # 支持 response_format=json_object 的模型
+    LLM_MAX_RETRIES: int = 3
+    LLM_BACKOFF_BASE: float = 1.0
+    LLM_BACKOFF_MAX: float = 30.0
+
+    # Token Budgets (内容压缩)
+    LLM_CONTENT_ANALYSIS_TOKENS: int = 12000  # 内容深度分析的输入预算
+    LLM_INTENT_CONTENT_TOKENS: int = 1500  # 意图分析附带的原文摘录预算
+    CONTENT_CHUNK_TOKENS: int = 6000  # 分块摘要时每块的大小
+    CONTENT_MAP_REDUCE_FACTOR: float = 2.0  # 超过预算多少倍时改为分块摘要
+
+    # LLM Response Cache
+    LLM_CACHE_BACKEND: str = "memory"  # memory / sqlite / postgres / none
+    LLM_CACHE_MAX_ENTRIES: int = 1000
+    LLM_CACHE_TTL_SECONDS: float = 7 * 24 * 3600
+    LLM_CACHE_SQLITE_PATH: str = "llm_cache.db"
+    LLM_CACHE_MAX_TEMPERATURE: float = 0.7  # 高于此温度的"创意型"调用不走缓存
 
     # Search APIs
     TAVILY_API_KEY: Optional[str] = None
     SERPER_API_KEY: Optional[str] = None
     SEARCH_PROVIDER: str = "tavily"  # or "serper"
+    SEARCH_TIMEOUT: float = 20.0  # 单次搜索请求超时 (秒)
+    SEARCH_FAILOVER_ENABLED: bool = True  # 主引擎失败时自动切换到备用引擎
+    SEARCH_HEDGE_ENABLED: bool = False  # 主引擎超过 p95 未返回时并发请求备用引擎
+    SEARCH_HEDGE_DEFAULT_DELAY: float = 3.0  # 样本不足时的对冲等待时间 (秒)
+    SEARCH_CIRCUIT_FAILURE_THRESHOLD: int = 3  # 连续失败多少次后熔断
+    SEARCH_CIRCUIT_RESET_SECONDS: float = 30.0  # 熔断后多久进入半开状态
+
+    # Image Preprocessing (OCR 前的缩放和重新压缩)
+    OCR_IMAGE_MAX_SHORT_SIDE: int = 1280  # 短边上限 (DeepSeek-OCR 的有效分辨率)，长截图按宽度缩放，文字保持可读
+    OCR_IMAGE_MAX_LONG_SIDE: int = 8192  # 长边上限，只对极端的长图和全景图生效
+    OCR_IMAGE_FORMAT: str = "JPEG"  # or "WEBP"
+    OCR_IMAGE_QUALITY: int = 85
+    OCR_IMAGE_PASSTHROUGH_BYTES: int = 512 * 1024  # 不超过该大小且尺寸在上限内的图片不重新压缩，直接发送
+    IMAGE_PROCESS_WORKERS: int = 2  # Pillow 进程池大小
+
+    # Upload Limits
+    MAX_IMAGE_UPLOAD_BYTES: int = 20 * 1024 * 1024
+
+    # Upload Deduplication
+    ANALYSIS_DEDUP_ENABLED: bool = True  # 相同内容复用已完成的分析
+    ANALYSIS_DEDUP_CROSS_USER: bool = False  # 公开 URL 复用其他用户的内容解析 (意图分析和推荐按当前用户重新生成)
+
+    # Batch Analysis
+    BATCH_ANALYSIS_MAX_ITEMS: int = 50
+    BATCH_DEEP_DECODE_CONCURRENCY: int = 3  # 批量任务中同时执行 Deep Decode 的条目数
+
+    # Analysis Profiles (fast / standard / deep，正在运行的分析较多时自动降档)
+    ANALYSIS_DEFAULT_PROFILE: str = "deep"  # 未指定档位时使用完整流程，只在负载高时降档
+    ANALYSIS_DOWNGRADE_STANDARD_AT: int = 5  # 正在运行的分析 (包括自身) 达到该数量时 deep 降为 standard (0 关闭)
+    ANALYSIS_DOWNGRADE_FAST_AT: int = 8  # 达到该数量时降为 fast (0 关闭)，不应超过 ANALYSIS_MAX_RUNNING
+
+    # Analysis Admission (提交分析时的准入控制，超出排队上限返回 429)
+    ANALYSIS_MAX_RUNNING: int = 8  # 同时运行的分析流水线数，其余任务排队
+    ANALYSIS_MAX_RUNNING_PER_USER: int = 2  # 单个用户同时运行的分析数 (0 不限制)
+    ANALYSIS_QUEUE_MAX: int = 100  # 等待中的分析任务数上限 (0 不限制)
+    ANALYSIS_QUEUE_MAX_PER_USER: int = 50  # 单个用户进行中 (运行 + 等待) 的任务数上限 (0 不限制)
+    ANALYSIS_ETA_INITIAL_SECONDS: float = 60.0  # 还没有完成的分析时，预计耗时使用的初始值
+
+    # Task Progress (async_tasks 进度写入)
+    TASK_PROGRESS_MIN_INTERVAL: float = 2.0  # 两次进度写入的最小间隔 (秒)，期间的更新合并写入
+
+    # Generated Image Cache (配图按规范化提示词缓存)
+    IMAGE_CACHE_ENABLED: bool = True
+    IMAGE_CACHE_SCOPE: str = "global"  # global: 所有用户共享 / user: 每个用户独立
+    IMAGE_CACHE_MAX_ENTRIES: int = 5000  # 超出后按最近使用时间淘汰
+
+    # Image Generation (相同描述由配图缓存合并为一次调用)
+    IMAGE_GEN_CONCURRENCY: int = 4  # 同时进行的 FLUX 调用数，429 时按 Retry-After 暂停所有调用
+
+    # Lazy Image Rendering (文章先保存，配图在首次请求或后台预取时生成)
+    IMAGE_LAZY_RENDERING: bool = True  # 需要同时开启 IMAGE_CACHE_ENABLED
+    IMAGE_PREFETCH_PER_ARTICLE: int = 1  # 每篇文章后台预取的配图数量
+    IMAGE_PREFETCH_CONCURRENCY: int = 2
+    IMAGE_URL_SECRET: Optional[str] = None  # 配图地址签名密钥，默认由 SUPABASE_KEY 派生
+
+    # Image Variants (上传和生成的图片派生 WebP 缩略图和响应式宽度版本)
+    IMAGE_VARIANTS_ENABLED: bool = True
+    IMAGE_VARIANT_WIDTHS: List[int] = [480, 768]
+    IMAGE_THUMBNAIL_SIZE: int = 256  # 正方形缩略图边长 (历史记录)
+    IMAGE_VARIANT_QUALITY: int = 80
+
+    # Local Blob Cache (上传后暂存图片，分析时免去 Storage 下载)
+    BLOB_CACHE_MEMORY_BYTES: int = 64 * 1024 * 1024
+    BLOB_CACHE_DISK_BYTES: int = 512 * 1024 * 1024
+    BLOB_CACHE_TTL_SECONDS: float = 900.0
+    BLOB_CACHE_DIR: Optional[str] = None  # 默认使用系统临时目录
+
+    # Response Cache (读接口的进程内响应缓存和 ETag)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_ENTRIES: int = 2000
+    RESPONSE_CACHE_TTL_SECONDS: float = 600.0  # 多 worker 时其他进程的过期条目最多保留这么久
+
+    # Article Compression (文章生成时预压缩一次，读取时直接返回)
+    ARTICLE_COMPRESSION_ENABLED: bool = True
+    ARTICLE_BROTLI_QUALITY: int = 11  # 只在生成时压缩一次，使用最高压缩率
+    ARTICLE_GZIP_LEVEL: int = 9  # 未安装 brotli 时使用 gzip
+
+    # Response Compression (GZipMiddleware；级别 9 比 6 多花一倍以上的 CPU，体积只小约 10%)
+    GZIP_MINIMUM_SIZE: int = 1000
+    GZIP_COMPRESS_LEVEL: int = 6
+
+    # Observability
+    OTEL_ENABLED: bool = False  # 需要安装 opentelemetry-api / sdk 并配置导出器
+    OTEL_SERVICE_NAME: str = "mosaic-backend"
 
     # App Settings
     BACKEND_PORT: int = 8000
     FRONTEND_URL: str = "http://localhost:3000"
+    PUBLIC_API_URL: str = "http://localhost:8000"  # 浏览器访问后端的地址 (与前端 NEXT_PUBLIC_API_URL 一致)
 
     class Config:
         env_file = ".env"
         case_sensitive = True
 
+    def require(self, name: str) -> str:
+        """返回必需的配置项，未设置时抛出 MissingSettingError"""
+        value = getattr(self, name)
+        if not value:
+            raise MissingSettingError(f"{name} 未配置，请在 .env 中设置")
+        return value
+
 
 settings = Settings()
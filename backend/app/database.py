@@ -1,10 +1,25 @@
-from supabase import create_client, Client
+from typing import TYPE_CHECKING
 from app.config import settings
+from app.services.container import lazy_service, provider
 import logging
 
+if TYPE_CHECKING:
+    from supabase import Client
+
 logger = logging.getLogger(__name__)
 
-# 初始化 Supabase 客户端
-supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
 
-logger.info("Supabase client initialized successfully")
+def create_supabase_client() -> "Client":
+    # supabase 及其依赖 (postgrest / storage3 / gotrue / realtime) 导入较慢，推迟到第一次访问数据库时
+    from supabase import create_client
+
+    client = create_client(settings.require("SUPABASE_URL"), settings.require("SUPABASE_KEY"))
+    logger.info("Supabase client initialized successfully")
+    return client
+
+
+# Supabase 客户端 (第一次访问属性时创建)
+supabase: "Client" = lazy_service(create_supabase_client, "supabase")
+
+# FastAPI 依赖注入访问器
+get_supabase = provider(supabase)
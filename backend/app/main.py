@@ -1,7 +1,11 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from app.config import settings
+from app.api.deps import get_search_service
+from app.services.search import SearchService
 import logging
 
 # 配置日志
@@ -12,14 +16,29 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 服务实例和上游客户端在第一次使用时创建，启动阶段不做任何初始化
+    yield
+    # 只关闭已经创建过的服务 (进程池、LLM 和配图的连接池)
+    from app.services.container import shutdown_services
+    await shutdown_services()
+
+
 app = FastAPI(
     title="Mosaic API",
     description="AI-powered interest mapping and recommendation system",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Gzip 压缩 (提升大 JSON 响应速度)
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=settings.GZIP_MINIMUM_SIZE,
+    compresslevel=settings.GZIP_COMPRESS_LEVEL
+)
 
 # CORS 配置
 app.add_middleware(
@@ -45,14 +64,28 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/health/search")
+async def search_health(search_service: SearchService = Depends(get_search_service)):
+    """搜索引擎健康状态、熔断状态和延迟直方图"""
+    return search_service.get_provider_stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 指标: 流水线阶段耗时、上游服务耗时和任务计数"""
+    from app.services.metrics import registry
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 # 导入并注册路由
-from app.api import auth, upload, analysis, recommendations, history
+from app.api import auth, upload, analysis, recommendations, history, images
 
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(upload.router, prefix="/api/upload", tags=["upload"])
 app.include_router(analysis.router, prefix="/api/analysis", tags=["analysis"])
 app.include_router(recommendations.router, prefix="/api/recommendations", tags=["recommendations"])
 app.include_router(history.router, prefix="/api/history", tags=["history"])
+app.include_router(images.router, prefix="/api/images", tags=["images"])
 
 if __name__ == "__main__":
     import uvicorn
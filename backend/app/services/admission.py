@@ -0,0 +1,182 @@
+"""
+分析任务准入控制
+提交分析时先申请名额，分析任务在后台排队，拿到运行名额后才执行流水线:
+- 全局同时运行的分析数不超过 ANALYSIS_MAX_RUNNING，单个用户不超过 ANALYSIS_MAX_RUNNING_PER_USER
+  (达到上限的用户的任务留在队列中，排在后面的其他用户的任务可以先运行)
+- 等待中的任务数不超过 ANALYSIS_QUEUE_MAX，单个用户进行中 (运行 + 等待) 的任务不超过 ANALYSIS_QUEUE_MAX_PER_USER；
+  超出时拒绝提交 (接口返回 429 和 Retry-After)，不创建任务
+- 排队中的任务在任务状态中返回队列位置和预计完成时间 (按最近完成的分析耗时估算)
+
+队列只在当前进程内有效，多个 worker 时每个进程各自限制
+"""
+import asyncio
+import itertools
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional
+from app.config import settings
+from app.services.metrics import registry, STAGE_DURATION
+from app.services.container import lazy_service
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_ADMISSION = registry.counter(
+    "mosaic_analysis_admission_total",
+    "Analysis submissions by admission outcome (started / queued / rejected_user / rejected_queue)",
+    ("outcome",)
+)
+
+
+class AdmissionRejected(Exception):
+    """队列已满或用户进行中的任务过多"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class AdmissionTicket:
+    user_id: str
+    seq: int
+    task_id: Optional[str] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    ready: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class AdmissionController:
+    def __init__(self):
+        self.max_running = max(1, settings.ANALYSIS_MAX_RUNNING)
+        self.max_running_per_user = settings.ANALYSIS_MAX_RUNNING_PER_USER
+        self.queue_max = settings.ANALYSIS_QUEUE_MAX
+        self.queue_max_per_user = settings.ANALYSIS_QUEUE_MAX_PER_USER
+        # 最近完成的分析耗时 (指数移动平均)，用于估算等待时间
+        self.average_seconds = settings.ANALYSIS_ETA_INITIAL_SECONDS
+        self._queue: List[AdmissionTicket] = []
+        self._running: Dict[int, AdmissionTicket] = {}
+        self._by_task: Dict[str, AdmissionTicket] = {}
+        self._seq = itertools.count()
+
+    def reserve(self, user_id: str, count: int = 1) -> List[AdmissionTicket]:
+        """
+        为 count 个分析申请排队名额 (批量提交时全部接受或全部拒绝)
+
+        Raises:
+            AdmissionRejected: 超出用户或全局的排队上限
+        """
+        in_flight = self._user_tickets(user_id)
+        if self.queue_max_per_user and len(in_flight) + count > self.queue_max_per_user:
+            ANALYSIS_ADMISSION.inc(count, outcome="rejected_user")
+            raise AdmissionRejected(
+                f"进行中的分析任务过多 (最多 {self.queue_max_per_user} 个)，请稍后再试",
+                self._user_retry_after(in_flight)
+            )
+        if self.queue_max and len(self._queue) + count > self.queue_max + self._free_slots():
+            ANALYSIS_ADMISSION.inc(count, outcome="rejected_queue")
+            raise AdmissionRejected(
+                "分析队列已满，请稍后再试",
+                self._seconds(self.average_seconds * count / self.max_running)
+            )
+
+        tickets = [AdmissionTicket(user_id, next(self._seq)) for _ in range(count)]
+        self._queue.extend(tickets)
+        self._dispatch()
+        for ticket in tickets:
+            ANALYSIS_ADMISSION.inc(outcome="started" if ticket.ready.is_set() else "queued")
+        return tickets
+
+    def bind(self, ticket: AdmissionTicket, task_id: str):
+        """关联任务 ID (查询任务状态时返回队列位置)"""
+        ticket.task_id = task_id
+        self._by_task[task_id] = ticket
+
+    def cancel(self, ticket: AdmissionTicket):
+        """释放没有执行的名额 (创建任务失败时)"""
+        if ticket in self._queue:
+            self._queue.remove(ticket)
+        self._release(ticket, finished=False)
+
+    @asynccontextmanager
+    async def slot(self, ticket: Optional[AdmissionTicket]) -> AsyncIterator[None]:
+        """等待运行名额，执行结束后释放；ticket 为空时不限制 (基准测试直接调用流水线)"""
+        if ticket is None:
+            yield
+            return
+        try:
+            if not ticket.ready.is_set():
+                await ticket.ready.wait()
+                STAGE_DURATION.observe(time.monotonic() - ticket.enqueued_at, stage="queue", status="ok")
+            yield
+        finally:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+            self._release(ticket, finished=ticket.started_at is not None)
+
+    def position(self, task_id: str) -> Optional[Dict[str, int]]:
+        """排队中任务的队列位置 (从 1 开始) 和预计完成秒数，任务未在本进程排队时返回 None"""
+        ticket = self._by_task.get(task_id)
+        if ticket is None or ticket not in self._queue:
+            return None
+        position = self._queue.index(ticket) + 1
+        return {"position": position, "eta_seconds": self._eta(position)}
+
+    def stats(self) -> Dict[str, int]:
+        return {"running": len(self._running), "queued": len(self._queue)}
+
+    def _dispatch(self):
+        """按提交顺序启动等待中的任务，跳过已达到单用户运行上限的用户"""
+        if len(self._running) >= self.max_running:
+            return
+        running_by_user: Dict[str, int] = {}
+        for ticket in self._running.values():
+            running_by_user[ticket.user_id] = running_by_user.get(ticket.user_id, 0) + 1
+        for ticket in list(self._queue):
+            if len(self._running) >= self.max_running:
+                break
+            if self.max_running_per_user and running_by_user.get(ticket.user_id, 0) >= self.max_running_per_user:
+                continue
+            self._queue.remove(ticket)
+            ticket.started_at = time.monotonic()
+            self._running[ticket.seq] = ticket
+            running_by_user[ticket.user_id] = running_by_user.get(ticket.user_id, 0) + 1
+            ticket.ready.set()
+
+    def _release(self, ticket: AdmissionTicket, finished: bool):
+        if self._running.pop(ticket.seq, None) is not None and finished:
+            elapsed = time.monotonic() - ticket.started_at
+            self.average_seconds = 0.8 * self.average_seconds + 0.2 * elapsed
+        if ticket.task_id:
+            self._by_task.pop(ticket.task_id, None)
+        self._dispatch()
+
+    def _user_tickets(self, user_id: str) -> List[AdmissionTicket]:
+        return [t for t in itertools.chain(self._running.values(), self._queue) if t.user_id == user_id]
+
+    def _free_slots(self) -> int:
+        return max(0, self.max_running - len(self._running))
+
+    def _eta(self, position: int) -> int:
+        """前面的任务按运行名额数并行完成，再加上自身的运行时间"""
+        return self._seconds(self.average_seconds * (position / self.max_running + 1))
+
+    def _user_retry_after(self, tickets: List[AdmissionTicket]) -> int:
+        """用户最早结束的任务的预计剩余时间"""
+        now = time.monotonic()
+        estimates = [
+            self.average_seconds - (now - t.started_at) if t.started_at is not None
+            else self._eta(self._queue.index(t) + 1)
+            for t in tickets
+        ]
+        return self._seconds(min(estimates, default=self.average_seconds))
+
+    @staticmethod
+    def _seconds(value: float) -> int:
+        return max(1, math.ceil(value))
+
+
+# 创建全局实例
+admission_controller = lazy_service(AdmissionController, "admission_controller")
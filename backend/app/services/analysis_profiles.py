@@ -0,0 +1,121 @@
+"""
+分析档位
+同一条流水线按档位调整开销: 搜索深度和查询数、是否使用 LLM 排序及其模型、推荐数、
+后台预生成的文章数、文章篇幅和是否生成配图
+
+- fast:     基础搜索 2 个查询，按搜索得分排序，不预生成文章，短文章且不配图
+- standard: 高级搜索 3 个查询，LLM 排序，预生成前 5 篇文章 (其余在打开时生成)
+- deep:     高级搜索 5 个查询，LLM 排序，预生成全部文章 (原有的完整流程)
+
+当前进程中正在运行的分析任务 (不包括排队等待运行名额的任务) 达到阈值时自动降档，负载高峰时单个分析的耗时保持有界；
+实际使用的档位记录在 full_context["profile"]，之后的反馈和按需生成文章沿用同一档位
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional
+from app.config import settings
+from app.services.metrics import registry
+from app.services.container import lazy_service
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_PROFILES = registry.counter(
+    "mosaic_analysis_profiles_total",
+    "Analysis tasks by requested and effective profile (differs when downgraded under load)",
+    ("requested", "effective")
+)
+
+
+@dataclass(frozen=True)
+class AnalysisProfile:
+    name: str
+    search_depth: str             # Tavily search_depth: basic / advanced
+    search_queries: int           # 执行的搜索查询数
+    results_per_query: int
+    ranker_model: Optional[str]   # None 时不调用 LLM，按搜索得分排序
+    recommendation_count: int
+    article_count: int            # 后台预生成文章的推荐数
+    article_words: int
+    article_max_tokens: int
+    article_images: bool
+
+
+PROFILES: Dict[str, AnalysisProfile] = {
+    "fast": AnalysisProfile(
+        name="fast", search_depth="basic", search_queries=2, results_per_query=5, ranker_model=None,
+        recommendation_count=8, article_count=0, article_words=800, article_max_tokens=3000, article_images=False
+    ),
+    "standard": AnalysisProfile(
+        name="standard", search_depth="advanced", search_queries=3, results_per_query=5,
+        ranker_model="deepseek-ai/DeepSeek-V3", recommendation_count=10, article_count=5,
+        article_words=1500, article_max_tokens=5000, article_images=True
+    ),
+    "deep": AnalysisProfile(
+        name="deep", search_depth="advanced", search_queries=5, results_per_query=5,
+        ranker_model="deepseek-ai/DeepSeek-V3", recommendation_count=10, article_count=10,
+        article_words=1500, article_max_tokens=5000, article_images=True
+    ),
+}
+
+# 从轻到重，降档时按此顺序取较轻的档位
+PROFILE_ORDER = ("fast", "standard", "deep")
+
+
+class AnalysisProfileService:
+    def __init__(self):
+        self.default = settings.ANALYSIS_DEFAULT_PROFILE if settings.ANALYSIS_DEFAULT_PROFILE in PROFILES else "deep"
+        self.standard_at = settings.ANALYSIS_DOWNGRADE_STANDARD_AT
+        self.fast_at = settings.ANALYSIS_DOWNGRADE_FAST_AT
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def get(self, name: Optional[str]) -> AnalysisProfile:
+        return PROFILES.get(name or self.default, PROFILES[self.default])
+
+    def for_context(self, context: Optional[Dict[str, Any]]) -> AnalysisProfile:
+        """分析上下文 (full_context) 中记录的实际档位，旧记录没有时使用默认档位"""
+        return self.get(((context or {}).get("profile") or {}).get("effective"))
+
+    def load_cap(self) -> str:
+        """当前负载 (正在运行的分析数，包括正在选择档位的任务) 允许的最重档位"""
+        if self.fast_at and self.active >= self.fast_at:
+            return "fast"
+        if self.standard_at and self.active >= self.standard_at:
+            return "standard"
+        return "deep"
+
+    def select(self, requested: Optional[str]) -> AnalysisProfile:
+        """按请求的档位和当前负载选择实际档位"""
+        requested_profile = self.get(requested)
+        cap = self.load_cap()
+        name = min(requested_profile.name, cap, key=PROFILE_ORDER.index)
+        ANALYSIS_PROFILES.inc(requested=requested_profile.name, effective=name)
+        if name != requested_profile.name:
+            logger.info(f"进行中的分析 {self.active} 个，档位 {requested_profile.name} 降为 {name}")
+        return PROFILES[name]
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        """统计正在运行的分析任务 (降档依据)，在拿到运行名额后进入"""
+        with self._lock:
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def describe(self, requested: Optional[str], profile: AnalysisProfile) -> Dict[str, Any]:
+        """写入 full_context["profile"] 的记录"""
+        requested_name = self.get(requested).name
+        return {
+            "requested": requested_name,
+            "effective": profile.name,
+            "downgraded": requested_name != profile.name
+        }
+
+
+# 创建全局实例
+analysis_profile_service = lazy_service(AnalysisProfileService, "analysis_profile_service")
@@ -0,0 +1,153 @@
+"""
+文章压缩存储
+文章生成后只压缩一次: 文章接口的 JSON 响应体按一种规范编码 (brotli，未安装时 gzip) 压缩，
+以二进制存入 recommendations.article_body (bytea)，不再保存纯文本 article_html；
+读取时客户端接受该编码就直接返回压缩后的字节，否则解压后由 GZipMiddleware 处理
+
+- article_etag: 响应体的 ETag，读取时不需要重新计算
+- article_images: 文章引用的生成图片 Storage 路径 (生成图片缓存淘汰时按它判断引用，不扫描文章内容)
+- 开启压缩后，只有纯文本 article_html 的旧记录在第一次读取时转为压缩存储
+"""
+import asyncio
+import gzip
+import json
+import logging
+import re
+from typing import Any, Dict, Iterable, List, Optional
+from app.config import settings
+from app.database import supabase
+from app.services.response_cache import response_cache, make_etag, CachedResponse
+from app.services.container import lazy_service
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时使用 gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 文章中生成图片的 Storage 路径 (同步生成配图时以公开 URL 嵌入；延迟渲染的配图地址不含路径)
+GENERATED_IMAGE_PATH = re.compile(r"generated/[\w-]+/[\w-]+\.jpg")
+
+# 读取文章接口使用的列 (不包括旧的 article_html)
+ARTICLE_COLUMNS = "article_body, article_encoding, article_etag"
+# 推荐记录中除文章之外的列: 列表和反馈只读取这些列，不传输压缩的文章 (bytea 以十六进制传输，体积翻倍)
+RECOMMENDATION_COLUMNS = (
+    "id, analysis_id, user_id, title, description, url, image_url, source, relevance_score, "
+    "tile_type, user_action, user_action_at, display_order, created_at"
+)
+
+
+def referenced_images(article_html: str) -> List[str]:
+    return sorted(set(GENERATED_IMAGE_PATH.findall(article_html)))
+
+
+def encode_bytea(data: bytes) -> str:
+    """PostgREST 以十六进制文本读写 bytea"""
+    return "\\x" + data.hex()
+
+
+def decode_bytea(value: str) -> bytes:
+    return bytes.fromhex(value[2:] if value.startswith("\\x") else value)
+
+
+class ArticleStore:
+    def __init__(self):
+        self.enabled = settings.ARTICLE_COMPRESSION_ENABLED
+        self.encoding = "br" if brotli is not None else "gzip"
+        self.brotli_quality = settings.ARTICLE_BROTLI_QUALITY
+        self.gzip_level = settings.ARTICLE_GZIP_LEVEL
+
+    @staticmethod
+    def body(recommendation_id: str, article_html: str) -> bytes:
+        """文章接口的 JSON 响应体 (与 ArticleResponse 的字段一致)"""
+        return json.dumps(
+            {"id": recommendation_id, "article_html": article_html},
+            ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+
+    def columns(self, recommendation_id: str, article_html: str) -> Dict[str, Any]:
+        """
+        保存文章时写入的列
+
+        开启压缩时只保存压缩后的响应体 (article_html 置空)，关闭时保存纯文本
+        """
+        values: Dict[str, Any] = {"article_images": referenced_images(article_html)}
+        if not self.enabled:
+            return {**values, "article_html": article_html, "article_body": None,
+                    "article_encoding": None, "article_etag": None}
+        body = self.body(recommendation_id, article_html)
+        if self.encoding == "br":
+            compressed = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            # mtime=0 使相同内容的压缩结果稳定
+            compressed = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+        return {
+            **values,
+            "article_html": None,
+            "article_body": encode_bytea(compressed),
+            "article_encoding": self.encoding,
+            "article_etag": make_etag(body)
+        }
+
+    async def save(self, recommendation_id: str, article_html: str) -> Dict[str, Any]:
+        """
+        保存文章，返回写入的列 (可直接用于构造响应)
+
+        保存失败只记录日志，返回的列仍可用于本次响应
+        """
+        values = await asyncio.to_thread(self.columns, recommendation_id, article_html)
+        try:
+            await asyncio.to_thread(
+                lambda: supabase.table("recommendations").update(values).eq("id", recommendation_id).execute()
+            )
+        except Exception as e:
+            logger.warning(f"保存文章到数据库失败 ({recommendation_id}): {str(e)}")
+        return values
+
+    def article_html(self, row: Dict[str, Any]) -> Optional[str]:
+        """由推荐记录还原文章 HTML (压缩存储或旧的纯文本)，没有文章或记录损坏时返回 None"""
+        if row.get("article_body"):
+            body = self._decompress(row)
+            if body is not None:
+                return json.loads(body).get("article_html")
+        return row.get("article_html") or None
+
+    def copy_columns(self, row: Dict[str, Any], recommendation_id: str) -> Dict[str, Any]:
+        """复制推荐时的文章列: 响应体包含推荐 ID，需要按新 ID 重新压缩"""
+        article_html = self.article_html(row)
+        return self.columns(recommendation_id, article_html) if article_html else {}
+
+    def to_entry(self, row: Dict[str, Any], tags: Iterable[str]) -> Optional[CachedResponse]:
+        """由压缩存储的文章构造响应缓存条目，没有压缩版本或记录损坏时返回 None"""
+        if not row.get("article_body"):
+            return None
+        body = self._decompress(row)
+        if body is None:
+            return None
+        return response_cache.make_entry(
+            body, tags,
+            encoded={row["article_encoding"]: decode_bytea(row["article_body"])},
+            etag=row.get("article_etag")
+        )
+
+    def entry(self, recommendation_id: str, article_html: str, row: Dict[str, Any], tags: Iterable[str]) -> CachedResponse:
+        """文章的响应缓存条目，没有压缩版本时 (关闭压缩) 只序列化，由 GZipMiddleware 压缩"""
+        return self.to_entry(row, tags) or response_cache.make_entry(self.body(recommendation_id, article_html), tags)
+
+    @staticmethod
+    def _decompress(row: Dict[str, Any]) -> Optional[bytes]:
+        try:
+            data = decode_bytea(row["article_body"])
+            if row.get("article_encoding") == "br":
+                if brotli is None:
+                    raise ValueError("文章以 brotli 压缩保存，但未安装 brotli")
+                return brotli.decompress(data)
+            return gzip.decompress(data)
+        except Exception as e:  # 十六进制格式错误、解压失败 (包括 brotli.error)
+            logger.warning(f"压缩文章记录无效: {str(e)}")
+            return None
+
+
+# 创建全局实例
+article_store = lazy_service(ArticleStore, "article_store")
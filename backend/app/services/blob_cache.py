@@ -0,0 +1,283 @@
+"""
+本地 Blob 缓存
+上传时把图片字节暂存在本地，分析任务优先从这里读取，省去一次 Storage 下载
+内存优先，超出内存上限时按 LRU 溢出到磁盘；两级都有容量上限和 TTL
+
+- 磁盘读写和删除在线程中执行，不阻塞事件循环；锁只保护索引，不在持有锁时做文件 IO
+- 每个进程使用独立的溢出目录 (mosaic-blobs-{pid}-*)，关闭时删除；
+  启动时清理已退出进程遗留的目录 (多个 worker 可以共用 BLOB_CACHE_DIR)
+"""
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import time
+import shutil
+import uuid
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from app.config import settings
+from app.services.container import lazy_service
+
+logger = logging.getLogger(__name__)
+
+# put_file 时小于该大小的文件直接放入内存层
+INLINE_MAX_BYTES = 1024 * 1024
+SPILL_DIR_PREFIX = "mosaic-blobs-"
+
+# 待写入磁盘的条目 (key, bytes, expires_at)
+Spill = Tuple[str, bytes, float]
+
+
+def read_file(file_path: str) -> bytes:
+    with open(file_path, "rb") as f:
+        return f.read()
+
+
+def remove_files(file_paths: List[str]):
+    for file_path in file_paths:
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_stale_spill_dirs(base_dir: str):
+    """删除已退出进程遗留的溢出目录"""
+    try:
+        names = os.listdir(base_dir)
+    except OSError:
+        return
+    for name in names:
+        if not name.startswith(SPILL_DIR_PREFIX):
+            continue
+        pid = name[len(SPILL_DIR_PREFIX):].split("-", 1)[0]
+        if pid.isdigit() and int(pid) != os.getpid() and not process_alive(int(pid)):
+            shutil.rmtree(os.path.join(base_dir, name), ignore_errors=True)
+            logger.info(f"已清理遗留的磁盘缓存目录: {name}")
+
+
+class BlobCache:
+    def __init__(
+        self,
+        memory_limit: int,
+        disk_limit: int,
+        ttl_seconds: float,
+        spill_dir: Optional[str] = None
+    ):
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self.ttl_seconds = ttl_seconds
+        # 溢出目录的父目录 (默认系统临时目录)，本进程的目录在第一次溢出时创建
+        self._spill_base = spill_dir or tempfile.gettempdir()
+        self._spill_dir: Optional[str] = None
+        # key -> (bytes, expires_at)
+        self._memory: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        # key -> (file_path, size, expires_at)
+        self._disk: "OrderedDict[str, Tuple[str, int, float]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        remove_stale_spill_dirs(self._spill_base)
+
+    @staticmethod
+    def normalize_key(path: str) -> str:
+        """Storage 路径作为缓存键，去掉 public URL 可能带的查询串"""
+        return path.split("?", 1)[0].lstrip("/")
+
+    async def put(self, path: str, data: bytes):
+        """写入缓存 (单个对象超过内存上限时直接写磁盘)"""
+        key = self.normalize_key(path)
+        expires_at = time.monotonic() + self.ttl_seconds
+
+        with self._lock:
+            stale = self._remove(key)
+            if len(data) > self.memory_limit:
+                spills = [(key, data, expires_at)]
+            else:
+                self._memory[key] = (data, expires_at)
+                self._memory_bytes += len(data)
+                spills = self._evict_memory()
+        if stale or spills:
+            await asyncio.to_thread(self._write_spills, spills, stale)
+
+    async def put_file(self, path: str, file_path: str, size: int):
+        """
+        把已落盘的文件交给缓存 (调用后源文件归缓存所有)
+        小文件读入内存，大文件直接移动到磁盘层，避免整体载入内存
+        """
+        if size <= INLINE_MAX_BYTES:
+            data = await asyncio.to_thread(read_file, file_path)
+            await asyncio.to_thread(remove_files, [file_path])
+            await self.put(path, data)
+            return
+
+        if size > self.disk_limit:
+            with self._lock:
+                stale = self._remove(self.normalize_key(path))
+            await asyncio.to_thread(remove_files, [file_path, *stale])
+            return
+
+        await asyncio.to_thread(self._adopt_file, self.normalize_key(path), file_path, size)
+
+    async def get(self, path: str) -> Optional[bytes]:
+        """读取缓存，未命中或已过期返回 None"""
+        key = self.normalize_key(path)
+
+        with self._lock:
+            expired = self._purge_expired(time.monotonic())
+            entry = self._memory.get(key)
+            if entry:
+                self._memory.move_to_end(key)
+                self.hits += 1
+            disk_entry = None if entry else self._disk.get(key)
+        if expired:
+            await asyncio.to_thread(remove_files, expired)
+        if entry:
+            return entry[0]
+
+        if disk_entry:
+            try:
+                data = await asyncio.to_thread(read_file, disk_entry[0])
+                with self._lock:
+                    self.hits += 1
+                return data
+            except OSError as e:
+                # 文件可能刚被淘汰删除
+                logger.warning(f"读取磁盘缓存失败: {str(e)}")
+                with self._lock:
+                    stale = self._remove(key) if self._disk.get(key) is disk_entry else []
+                await asyncio.to_thread(remove_files, stale)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    async def discard(self, path: str):
+        with self._lock:
+            stale = self._remove(self.normalize_key(path))
+        if stale:
+            await asyncio.to_thread(remove_files, stale)
+
+    def close(self):
+        """删除本进程的溢出目录 (应用关闭时)"""
+        with self._lock:
+            self._memory.clear()
+            self._disk.clear()
+            self._memory_bytes = self._disk_bytes = 0
+            spill_dir, self._spill_dir = self._spill_dir, None
+        if spill_dir:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def _get_spill_dir(self) -> str:
+        with self._lock:
+            if self._spill_dir is None:
+                os.makedirs(self._spill_base, exist_ok=True)
+                self._spill_dir = tempfile.mkdtemp(prefix=f"{SPILL_DIR_PREFIX}{os.getpid()}-", dir=self._spill_base)
+            return self._spill_dir
+
+    def _evict_memory(self) -> List[Spill]:
+        """内存超限时取出最久未使用的条目，由调用方写入磁盘"""
+        spills = []
+        while self._memory_bytes > self.memory_limit and self._memory:
+            key, (data, expires_at) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(data)
+            spills.append((key, data, expires_at))
+        return spills
+
+    def _write_spills(self, spills: List[Spill], stale: List[str]):
+        """写入溢出的条目并删除被替换或淘汰的文件 (在线程中执行)"""
+        remove_files(stale)
+        for key, data, expires_at in spills:
+            if len(data) > self.disk_limit:
+                continue
+            file_path = os.path.join(self._get_spill_dir(), uuid.uuid4().hex)
+            try:
+                with open(file_path, "wb") as f:
+                    f.write(data)
+            except OSError as e:
+                logger.warning(f"写入磁盘缓存失败: {str(e)}")
+                continue
+            self._register_disk(key, file_path, len(data), expires_at)
+
+    def _adopt_file(self, key: str, file_path: str, size: int):
+        """把上传的临时文件移动到磁盘层 (在线程中执行)"""
+        target = os.path.join(self._get_spill_dir(), uuid.uuid4().hex)
+        try:
+            shutil.move(file_path, target)
+        except OSError as e:
+            logger.warning(f"写入磁盘缓存失败: {str(e)}")
+            remove_files([file_path])
+            return
+        with self._lock:
+            stale = self._remove(key)
+        remove_files(stale)
+        self._register_disk(key, target, size, time.monotonic() + self.ttl_seconds)
+
+    def _register_disk(self, key: str, file_path: str, size: int, expires_at: float):
+        with self._lock:
+            if key in self._memory or key in self._disk:
+                # 写入期间同一个键已被重新写入，以新的为准
+                evicted = [file_path]
+            else:
+                self._disk[key] = (file_path, size, expires_at)
+                self._disk_bytes += size
+                evicted = self._evict_disk()
+        remove_files(evicted)
+
+    def _evict_disk(self) -> List[str]:
+        evicted = []
+        while self._disk_bytes > self.disk_limit and self._disk:
+            evicted.append(self._pop_disk(next(iter(self._disk))))
+        return evicted
+
+    def _purge_expired(self, now: float) -> List[str]:
+        for key in [k for k, (_, exp) in self._memory.items() if exp <= now]:
+            data, _ = self._memory.pop(key)
+            self._memory_bytes -= len(data)
+        return [self._pop_disk(key) for key in [k for k, (_, _, exp) in self._disk.items() if exp <= now]]
+
+    def _remove(self, key: str) -> List[str]:
+        """从索引中移除，返回需要删除的文件"""
+        entry = self._memory.pop(key, None)
+        if entry:
+            self._memory_bytes -= len(entry[0])
+        return [self._pop_disk(key)] if key in self._disk else []
+
+    def _pop_disk(self, key: str) -> str:
+        file_path, size, _ = self._disk.pop(key)
+        self._disk_bytes -= size
+        return file_path
+
+
+# 创建全局实例
+blob_cache = lazy_service(lambda: BlobCache(
+    memory_limit=settings.BLOB_CACHE_MEMORY_BYTES,
+    disk_limit=settings.BLOB_CACHE_DISK_BYTES,
+    ttl_seconds=settings.BLOB_CACHE_TTL_SECONDS,
+    spill_dir=settings.BLOB_CACHE_DIR
+), "blob_cache", close="close")
@@ -0,0 +1,106 @@
+"""
+服务实例的延迟创建和生命周期管理
+模块导入时只创建轻量的代理，第一次访问属性时才构造真正的实例 (以及它依赖的客户端和 API Key 校验)；
+应用关闭时只清理已经创建过的实例
+
+代理会转发所有属性读写，调用方照常使用 `from app.services.x import x_service`；
+代理本身不暴露任何方法 (避免与服务自己的 get / reset 等方法重名)，管理操作使用本模块的函数:
+- get_instance(proxy): 取得 (必要时创建) 真正的实例
+- provider(proxy): 生成 FastAPI Depends 使用的访问器
+- override(proxy, instance): 在测试中替换实例
+"""
+import inspect
+import logging
+import threading
+import time
+from typing import Any, Callable, List, Optional, TypeVar, cast
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _LazyService:
+    __slots__ = ("_lazy_name", "_lazy_factory", "_lazy_close", "_lazy_instance", "_lazy_lock")
+
+    def __init__(self, name: str, factory: Callable[[], Any], close: Optional[str]):
+        object.__setattr__(self, "_lazy_name", name)
+        object.__setattr__(self, "_lazy_factory", factory)
+        object.__setattr__(self, "_lazy_close", close)
+        object.__setattr__(self, "_lazy_instance", None)
+        object.__setattr__(self, "_lazy_lock", threading.Lock())
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(get_instance(self), name)
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(get_instance(self), name, value)
+
+    def __repr__(self) -> str:
+        state = "initialized" if self._lazy_instance is not None else "pending"
+        return f"<lazy {self._lazy_name} ({state})>"
+
+
+_services: List[_LazyService] = []
+
+
+def lazy_service(factory: Callable[[], T], name: Optional[str] = None, close: Optional[str] = None) -> T:
+    """
+    注册一个延迟创建的服务
+
+    Args:
+        factory: 构造实例的无参函数 (通常就是服务类)
+        name: 日志中的名称，默认使用 factory 的名称
+        close: 应用关闭时调用的实例方法名 (同步或异步)，只对已创建的实例调用
+    """
+    proxy = _LazyService(name or getattr(factory, "__name__", "service"), factory, close)
+    _services.append(proxy)
+    return cast(T, proxy)
+
+
+def get_instance(proxy: T) -> T:
+    """取得代理背后的实例，第一次调用时创建 (线程安全)"""
+    if not isinstance(proxy, _LazyService):
+        return proxy
+    instance = proxy._lazy_instance
+    if instance is None:
+        with proxy._lazy_lock:
+            instance = proxy._lazy_instance
+            if instance is None:
+                start = time.monotonic()
+                instance = proxy._lazy_factory()
+                object.__setattr__(proxy, "_lazy_instance", instance)
+                logger.info(f"服务 {proxy._lazy_name} 已初始化 ({(time.monotonic() - start) * 1000:.1f}ms)")
+    return instance
+
+
+def is_initialized(proxy: Any) -> bool:
+    return not isinstance(proxy, _LazyService) or proxy._lazy_instance is not None
+
+
+def override(proxy: T, instance: Optional[T]):
+    """替换代理背后的实例 (传入 None 时恢复为下次访问重新创建)"""
+    object.__setattr__(proxy, "_lazy_instance", instance)
+
+
+def provider(proxy: T) -> Callable[[], T]:
+    """生成 FastAPI 依赖注入使用的访问器: Depends(provider(x_service))"""
+    def get() -> T:
+        return get_instance(proxy)
+    get.__name__ = f"get_{proxy._lazy_name if isinstance(proxy, _LazyService) else 'service'}"
+    return get
+
+
+async def shutdown_services():
+    """按注册的逆序关闭已创建的服务实例，未创建的服务不会被初始化"""
+    for proxy in reversed(_services):
+        instance = proxy._lazy_instance
+        if instance is None or not proxy._lazy_close:
+            continue
+        try:
+            result = getattr(instance, proxy._lazy_close)()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.warning(f"关闭服务 {proxy._lazy_name} 失败: {str(e)}")
+        override(proxy, None)
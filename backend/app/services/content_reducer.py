@@ -0,0 +1,170 @@
+"""
+内容压缩服务
+在把网页 / 文本内容送进 LLM 之前:
+1. 去除 Markdown 中的导航、页脚、链接列表等样板内容
+2. 按 token 预算截断 (按字符类别估算 DeepSeek 分词器的 token 数)
+3. 超长页面按块并发摘要后再合并 (map-reduce)
+"""
+import asyncio
+import logging
+import re
+from typing import Dict, Any, List, Optional
+from app.config import settings
+from app.services.llm_cache import llm_cache
+from app.services.llm_gateway import llm_gateway
+from app.services.markdown_extract import extract_markdown_structure
+from app.services.container import lazy_service
+
+logger = logging.getLogger(__name__)
+
+CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算 DeepSeek 分词器的 token 数
+    中日韩字符约 0.6 token/字，其余字符约 4 字符/token
+    """
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    return int(cjk * 0.6 + (len(text) - cjk) / 4) + 1
+
+
+def truncate_to_budget(text: str, max_tokens: int) -> str:
+    """按段落截断到 token 预算以内，单段超长时按字符截断"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    kept: List[str] = []
+    used = 0
+    for paragraph in text.split("\n\n"):
+        cost = estimate_tokens(paragraph) + 1
+        if used + cost > max_tokens:
+            remaining = max_tokens - used
+            if remaining > 50:
+                # 用当前段落的平均字符/token 比换算剩余字符数
+                ratio = len(paragraph) / max(1, estimate_tokens(paragraph))
+                kept.append(paragraph[:int(remaining * ratio)])
+            break
+        kept.append(paragraph)
+        used += cost
+
+    return "\n\n".join(kept)
+
+
+def strip_boilerplate(markdown: str) -> str:
+    """
+    去除 Markdown 样板内容:
+    纯链接行 / 链接列表、图片引用、导航和版权短行、页脚区块、多余空行
+    """
+    return extract_markdown_structure(markdown)["body"]
+
+
+def split_chunks(text: str, chunk_tokens: int) -> List[str]:
+    """按段落切块，每块不超过 chunk_tokens"""
+    chunks: List[str] = []
+    current: List[str] = []
+    used = 0
+    for paragraph in text.split("\n\n"):
+        cost = estimate_tokens(paragraph)
+        if cost > chunk_tokens:
+            paragraph = truncate_to_budget(paragraph, chunk_tokens)
+            cost = chunk_tokens
+        if current and used + cost > chunk_tokens:
+            chunks.append("\n\n".join(current))
+            current, used = [], 0
+        current.append(paragraph)
+        used += cost
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+class ContentReducer:
+    def __init__(self):
+        self.analysis_budget = settings.LLM_CONTENT_ANALYSIS_TOKENS
+        self.chunk_tokens = settings.CONTENT_CHUNK_TOKENS
+        self.map_reduce_factor = settings.CONTENT_MAP_REDUCE_FACTOR
+
+    async def reduce(self, content: str, budget: Optional[int] = None, cleaned: bool = False) -> Dict[str, Any]:
+        """
+        把内容压缩到 token 预算以内
+
+        Args:
+            content: 原始 Markdown / 文本
+            budget: token 预算，默认使用 LLM_CONTENT_ANALYSIS_TOKENS
+            cleaned: 内容是否已经过 Markdown 结构提取 (跳过样板清理)
+
+        Returns:
+            包含压缩后文本和统计信息的字典
+        """
+        budget = budget or self.analysis_budget
+        original_tokens = estimate_tokens(content)
+        if not cleaned:
+            content = strip_boilerplate(content)
+        cleaned_tokens = estimate_tokens(content)
+
+        stats = {
+            "original_tokens": original_tokens,
+            "cleaned_tokens": cleaned_tokens,
+            "budget": budget,
+            "chunks": 0
+        }
+
+        if cleaned_tokens <= budget:
+            stats.update({"strategy": "clean", "compact_tokens": cleaned_tokens})
+            return {"text": content, "stats": stats}
+
+        if cleaned_tokens <= budget * self.map_reduce_factor:
+            compact = truncate_to_budget(content, budget)
+            stats.update({"strategy": "truncate", "compact_tokens": estimate_tokens(compact)})
+            return {"text": compact, "stats": stats}
+
+        # 超长页面: 分块并发摘要，再按预算合并
+        chunks = split_chunks(content, self.chunk_tokens)
+        per_chunk = max(200, budget // len(chunks))
+        summaries = await asyncio.gather(
+            *[self._summarize_chunk(chunk, i, len(chunks), per_chunk) for i, chunk in enumerate(chunks)]
+        )
+        compact = truncate_to_budget("\n\n".join(s for s in summaries if s), budget)
+        stats.update({
+            "strategy": "map_reduce",
+            "chunks": len(chunks),
+            "compact_tokens": estimate_tokens(compact)
+        })
+        logger.info(f"长内容分块摘要: {cleaned_tokens} -> {stats['compact_tokens']} tokens ({len(chunks)} 块)")
+        return {"text": compact, "stats": stats}
+
+    async def _summarize_chunk(self, chunk: str, index: int, total: int, max_tokens: int) -> str:
+        payload = {
+            "model": "deepseek-ai/DeepSeek-V3",
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "你是一个信息压缩助手。保留事实、数据、人名、地名、专业术语和时间线，删除修饰和重复内容。"
+                },
+                {
+                    "role": "user",
+                    "content": f"以下是一篇长文的第 {index + 1}/{total} 部分，请压缩为要点式摘要，直接输出摘要：\n\n{chunk}"
+                }
+            ],
+            "temperature": 0.2,
+            "max_tokens": max_tokens
+        }
+
+        try:
+            cached = await llm_cache.get(payload, "summarize_chunk")
+            if cached is not None:
+                return cached
+            summary = await llm_gateway.chat_content(payload, timeout=120.0, label="summarize_chunk")
+            await llm_cache.set(payload, summary)
+            return summary
+        except Exception as e:
+            # 摘要失败时退回到截断原文
+            logger.warning(f"分块摘要失败 ({index + 1}/{total}): {str(e)}")
+            return truncate_to_budget(chunk, max_tokens)
+
+
+# 创建全局实例
+content_reducer = lazy_service(ContentReducer, "content_reducer")
@@ -0,0 +1,207 @@
+"""
+上传去重服务
+为上传内容计算内容哈希，并在分析时复用已完成的相同内容分析结果，
+避免重复执行 OCR、意图分析、搜索、排序和文章生成整条流水线；
+其他用户的相同公开 URL 只复用内容解析，意图分析和推荐按当前用户重新生成
+"""
+import hashlib
+import logging
+import re
+import uuid
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+from app.config import settings
+from app.database import supabase
+from app.services.article_store import article_store, ARTICLE_COLUMNS, RECOMMENDATION_COLUMNS
+from app.services.container import lazy_service
+
+logger = logging.getLogger(__name__)
+
+# 复制推荐时保留的字段 (用户反馈不复制；文章按新的推荐 ID 重新压缩)
+RECOMMENDATION_COPY_FIELDS = (
+    "title", "description", "url", "image_url", "source",
+    "relevance_score", "tile_type", "display_order"
+)
+
+
+def hash_url(url: str) -> str:
+    """规范化 URL 后计算哈希 (忽略大小写的协议/域名、片段和末尾斜杠)"""
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip("/") or "/"
+    normalized = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ""))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def hash_text(text: str) -> str:
+    """折叠空白后计算哈希，仅空白不同的文本视为相同内容"""
+    normalized = re.sub(r"\s+", " ", text).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class AnalysisDedupService:
+    def find_duplicate_upload(self, user_id: str, upload_type: str, content_hash: str) -> Optional[Dict[str, Any]]:
+        """查找当前用户已上传过的相同内容"""
+        try:
+            result = supabase.table("uploads").select("*") \
+                .eq("user_id", user_id) \
+                .eq("type", upload_type) \
+                .eq("content_hash", content_hash) \
+                .order("created_at", desc=True) \
+                .limit(1) \
+                .execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.warning(f"查找重复上传失败: {str(e)}")
+            return None
+
+    def find_reusable_analysis(self, upload: Dict[str, Any], user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查找当前用户相同内容的已完成分析
+
+        意图分析和推荐按用户的历史偏好个性化，只在同一用户范围内整体复用
+        """
+        content_hash = upload.get("content_hash")
+        if not content_hash:
+            return None
+
+        candidates = supabase.table("uploads").select("id") \
+            .eq("user_id", user_id) \
+            .eq("type", upload["type"]) \
+            .eq("content_hash", content_hash) \
+            .neq("id", upload["id"]) \
+            .order("created_at", desc=True) \
+            .limit(20) \
+            .execute()
+        return self._latest_completed([row["id"] for row in candidates.data])
+
+    def find_shared_decode(self, upload: Dict[str, Any], user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查找其他用户对相同公开 URL 的内容解析结果 (Deep Decode)
+
+        开启 ANALYSIS_DEDUP_CROSS_USER 后只共享与用户无关的网页抓取、正文压缩和内容分析，
+        意图分析和推荐仍按当前用户的历史偏好重新执行
+
+        Returns:
+            包含 analysis_id, visual_description, extracted_text, content_for_analysis 的字典，
+            没有可复用结果时返回 None
+        """
+        content_hash = upload.get("content_hash")
+        if not (settings.ANALYSIS_DEDUP_CROSS_USER and upload["type"] == "url" and content_hash):
+            return None
+        try:
+            candidates = supabase.table("uploads").select("id") \
+                .eq("type", "url") \
+                .eq("content_hash", content_hash) \
+                .neq("user_id", user_id) \
+                .order("created_at", desc=True) \
+                .limit(20) \
+                .execute()
+            source = self._latest_completed([row["id"] for row in candidates.data])
+        except Exception as e:
+            logger.warning(f"查找可共享的内容解析失败: {str(e)}")
+            return None
+        if not source:
+            return None
+
+        deep_decode = (source.get("full_context") or {}).get("deep_decode") or {}
+        if not deep_decode.get("content_for_analysis"):
+            return None
+        return {
+            "analysis_id": source["id"],
+            "visual_description": deep_decode.get("visual_description") or source.get("visual_description"),
+            "extracted_text": deep_decode.get("extracted_text") or source.get("extracted_text"),
+            "content_for_analysis": deep_decode["content_for_analysis"]
+        }
+
+    @staticmethod
+    def _latest_completed(upload_ids: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        最近一次完整结束的分析
+
+        分析记录在意图分析后就标记为 completed，推荐写入后才把包含 final_result 的 full_context 写入，
+        没有 final_result 的记录可能仍在生成推荐，不能复用
+        """
+        if not upload_ids:
+            return None
+        analysis_result = supabase.table("analyses").select("*") \
+            .in_("upload_id", upload_ids) \
+            .eq("status", "completed") \
+            .order("created_at", desc=True) \
+            .limit(5) \
+            .execute()
+        return next(
+            (row for row in analysis_result.data if (row.get("full_context") or {}).get("final_result")),
+            None
+        )
+
+    def clone_analysis(self, source: Dict[str, Any], upload_id: str, user_id: str) -> Dict[str, Any]:
+        """
+        将已有分析及其推荐复制到新的上传记录下
+
+        Returns:
+            新分析的 full_context (包含 final_result)
+        """
+        full_context = dict(source.get("full_context") or {})
+        full_context["reused_from"] = {
+            "analysis_id": source["id"],
+            "upload_id": source["upload_id"]
+        }
+
+        # 复制推荐 (包括已生成的文章)，插入分析记录后一次批量写入
+        rec_result = supabase.table("recommendations").select(f"{RECOMMENDATION_COLUMNS}, article_html, {ARTICLE_COLUMNS}") \
+            .eq("analysis_id", source["id"]) \
+            .order("display_order") \
+            .execute()
+        if not rec_result.data:
+            # 没有推荐的分析 (推荐生成失败或仍在写入) 不复制，调用方回退到完整分析
+            raise ValueError(f"分析 {source['id']} 没有推荐，不能复用")
+
+        analysis_data = {
+            "upload_id": upload_id,
+            "user_id": user_id,
+            "visual_description": source.get("visual_description"),
+            "extracted_text": source.get("extracted_text"),
+            "intent_analysis": source.get("intent_analysis"),
+            "keywords": source.get("keywords"),
+            "interest_tags": source.get("interest_tags"),
+            "status": "completed",
+            "completed_at": datetime.utcnow().isoformat()
+        }
+        analysis_result = supabase.table("analyses").insert(analysis_data).execute()
+        analysis_id = analysis_result.data[0]["id"]
+
+        rec_rows = []
+        for rec in rec_result.data:
+            # 文章响应体包含推荐 ID，预先分配新 ID 以便一次写入
+            rec_id = str(uuid.uuid4())
+            rec_rows.append({
+                "id": rec_id,
+                "analysis_id": analysis_id,
+                "user_id": user_id,
+                **{field: rec.get(field) for field in RECOMMENDATION_COPY_FIELDS},
+                **article_store.copy_columns(rec, rec_id)
+            })
+        supabase.table("recommendations").insert(rec_rows).execute()
+
+        logger.info(f"复用分析 {source['id']} -> {analysis_id}，复制 {len(rec_rows)} 条推荐")
+
+        full_context["final_result"] = {
+            "analysis_id": analysis_id,
+            "upload_id": upload_id,
+            "recommendations_count": len(rec_rows),
+            "keywords": source.get("keywords") or [],
+            "interest_tags": source.get("interest_tags") or []
+        }
+        full_context["step_message"] = "已复用相同内容的分析结果."
+
+        # full_context 需要新的 analysis_id，插入后单独写入一次
+        supabase.table("analyses").update({
+            "full_context": full_context
+        }).eq("id", analysis_id).execute()
+
+        return full_context
+
+
+# 创建全局实例
+dedup_service = lazy_service(AnalysisDedupService, "dedup_service")
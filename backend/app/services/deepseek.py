@@ -2,19 +2,69 @@
 DeepSeek AI 服务
 集成 DeepSeek-OCR (视觉理解) 和 DeepSeek-V3.2 (文本推理)
 """
-import httpx
 import logging
 import base64
 import json
+import re
 from typing import Dict, Any, List, Optional
+from pydantic import BaseModel, ConfigDict, field_validator, model_validator
 from app.config import settings
+from app.services.llm_cache import llm_cache
+from app.services.llm_gateway import llm_gateway
+from app.services.content_reducer import truncate_to_budget
+from app.services.structured_output import chat_structured
+from app.services.container import lazy_service
 
 logger = logging.getLogger(__name__)
 
+LIST_SEPARATORS = re.compile(r"[,，、;；\n]")
+
+
+class IntentAnalysis(BaseModel):
+    """意图分析结果，宽松接受模型常见的格式偏差 (逗号分隔的字符串、"8/10" 之类的评分)"""
+    model_config = ConfigDict(extra="allow")
+
+    primary_intent: str = "explore"
+    interest_level: int = 5
+    keywords: List[str] = []
+    interest_tags: List[str] = []
+    search_queries: List[str] = []
+    content_preferences: List[str] = []
+    reasoning: str = ""
+
+    @field_validator("keywords", "interest_tags", "search_queries", "content_preferences", mode="before")
+    @classmethod
+    def _coerce_list(cls, value: Any) -> Any:
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [item.strip() for item in LIST_SEPARATORS.split(value) if item.strip()]
+        if isinstance(value, list):
+            return [str(item).strip() for item in value if item is not None and str(item).strip()]
+        return value
+
+    @field_validator("interest_level", mode="before")
+    @classmethod
+    def _coerce_level(cls, value: Any) -> int:
+        match = re.search(r"\d+", str(value)) if value is not None else None
+        return min(10, max(1, int(match.group()))) if match else 5
+
+    @field_validator("primary_intent", "reasoning", mode="before")
+    @classmethod
+    def _coerce_text(cls, value: Any) -> str:
+        return "" if value is None else str(value)
+
+    @model_validator(mode="after")
+    def _require_search_terms(self) -> "IntentAnalysis":
+        # 没有关键词和搜索词时后续的搜索和排序都是浪费，交给修复重试
+        if not self.keywords and not self.search_queries:
+            raise ValueError("keywords 和 search_queries 不能同时为空")
+        return self
+
 
 class DeepSeekService:
     def __init__(self):
-        self.api_key = settings.DEEPSEEK_API_KEY
+        self.api_key = settings.require("DEEPSEEK_API_KEY")
         self.base_url = settings.DEEPSEEK_BASE_URL
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
@@ -63,31 +113,22 @@ class DeepSeekService:
                 "max_tokens": 1024
             }
 
-            # 打印请求参数以便观察 (截断过长的图片数据)
-            safe_payload = json.loads(json.dumps(payload))
-            for msg in safe_payload["messages"]:
-                for content_item in msg["content"]:
-                    if content_item.get("type") == "image_url" and "image_url" in content_item:
-                        url = content_item["image_url"].get("url", "")
-                        if url.startswith("data:") and len(url) > 100:
-                            content_item["image_url"]["url"] = url[:50] + "...(truncated)..." + url[-50:]
-            
-            logger.info(f"--- DeepSeek OCR Request Payload ---\n{json.dumps(safe_payload, indent=2, ensure_ascii=False)}\n-----------------------------------")
-
-            async with httpx.AsyncClient(timeout=60.0, trust_env=False) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    json=payload,
-                    headers=self.headers
-                )
-                if response.status_code != 200:
-                    logger.error(f"DeepSeek API Error: {response.status_code} - {response.text}")
-                
-                response.raise_for_status()
-                result = response.json()
+            # 打印请求参数以便观察 (截断过长的图片数据)，仅在 DEBUG 级别序列化整个请求体
+            if logger.isEnabledFor(logging.DEBUG):
+                safe_payload = json.loads(json.dumps(payload))
+                for msg in safe_payload["messages"]:
+                    for content_item in msg["content"]:
+                        if content_item.get("type") == "image_url" and "image_url" in content_item:
+                            url = content_item["image_url"].get("url", "")
+                            if url.startswith("data:") and len(url) > 100:
+                                content_item["image_url"]["url"] = url[:50] + "...(truncated)..." + url[-50:]
+
+                logger.debug(f"--- DeepSeek OCR Request Payload ---\n{json.dumps(safe_payload, indent=2, ensure_ascii=False)}\n-----------------------------------")
+
+            result = await llm_gateway.chat(payload, timeout=60.0, label="analyze_image")
 
             # log raw response for debugging
-            logger.info(f"DeepSeek Raw Response: {json.dumps(result, ensure_ascii=False)[:500]}...")
+            logger.debug(f"DeepSeek Raw Response: {json.dumps(result, ensure_ascii=False)[:500]}...")
 
             # 解析结果
             if not result.get("choices") or len(result["choices"]) == 0:
@@ -99,7 +140,7 @@ class DeepSeekService:
                  content = ""
                  
             # 打印完整的原始返回内容以便观察
-            logger.info(f"--- DeepSeek OCR Original Content START ---\n{content}\n--- DeepSeek OCR Original Content END ---")
+            logger.debug(f"--- DeepSeek OCR Original Content START ---\n{content}\n--- DeepSeek OCR Original Content END ---")
 
             # 尝试从纯文本描述中“模拟”出 visual_description 和 extracted_text
             # 因为我们使用了简单 Prompt，返回的将是纯文本
@@ -117,10 +158,10 @@ class DeepSeekService:
             logger.error(f"DeepSeek-OCR 分析失败: {str(e)}", exc_info=True)
             raise Exception(f"图片分析失败: {str(e)}")
 
-    async def analyze_text_content(self, content: str) -> str:
+    async def analyze_text_content(self, content: str, bypass_cache: bool = False) -> str:
         """
         深度分析文本内容，提取关键信息（摘要、事件、人物、技术等）
-        返回纯文本分析结果
+        返回纯文本分析结果，相同输入命中响应缓存时不再调用模型
         """
         try:
             logger.info("开始使用 DeepSeek-V3 分析文本内容")
@@ -136,7 +177,7 @@ class DeepSeekService:
                         "role": "user",
                         "content": f"""请深度阅读并分析以下内容：
 
-{content[:30000]}  # 限制长度以避免超长
+{truncate_to_budget(content, settings.LLM_CONTENT_ANALYSIS_TOKENS)}
 
 请提供一份结构化的分析报告，包含以下部分（如果没有相关信息则跳过）：
 1. **内容摘要**：一句话概括核心内容。
@@ -152,16 +193,12 @@ class DeepSeekService:
                 "max_tokens": 2000
             }
 
-            async with httpx.AsyncClient(timeout=120.0, trust_env=False) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    json=payload,
-                    headers=self.headers
-                )
-                response.raise_for_status()
-                result = response.json()
+            cached = await llm_cache.get(payload, "analyze_text_content", bypass=bypass_cache)
+            if cached is not None:
+                return cached
 
-            analysis = result["choices"][0]["message"]["content"]
+            analysis = await llm_gateway.chat_content(payload, timeout=120.0, label="analyze_text_content")
+            await llm_cache.set(payload, analysis, bypass=bypass_cache)
             return analysis
 
         except Exception as e:
@@ -172,7 +209,8 @@ class DeepSeekService:
         self,
         content: str,
         visual_context: Optional[Dict[str, Any]] = None,
-        user_history: Optional[List[str]] = None
+        user_history: Optional[List[str]] = None,
+        bypass_cache: bool = False
     ) -> Dict[str, Any]:
         """
         使用 DeepSeek-V3.2 进行意图分析和关键词提取
@@ -181,6 +219,7 @@ class DeepSeekService:
             content: 要分析的文本内容
             visual_context: 可选的视觉上下文（来自图片分析）
             user_history: 可选的用户历史偏好
+            bypass_cache: 是否跳过响应缓存
 
         Returns:
             包含意图分析、关键词、兴趣标签的字典
@@ -230,42 +269,22 @@ class DeepSeekService:
                 "max_tokens": 1500
             }
 
-            async with httpx.AsyncClient(timeout=120.0, trust_env=False) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    json=payload,
-                    headers=self.headers
-                )
-                response.raise_for_status()
-                result = response.json()
-
-            # 解析结果
-            content = result["choices"][0]["message"]["content"]
-            logger.info(f"DeepSeek-V3.2 意图分析完成: {content[:200]}...")
-
-            # 尝试解析 JSON
-            try:
-                # Find the start and end of the JSON object
-                start_index = content.find('{')
-                end_index = content.rfind('}')
-                if start_index != -1 and end_index != -1:
-                    json_str = content[start_index:end_index+1]
-                    parsed_result = json.loads(json_str)
-                else:
-                    raise json.JSONDecodeError("No JSON object found", content, 0)
-            except json.JSONDecodeError:
-                # 如果不是标准 JSON，提取关键信息
-                logger.warning(f"Failed to parse JSON from DeepSeek response: {content}")
-                parsed_result = {
-                    "primary_intent": "explore",
-                    "interest_level": 5,
-                    "keywords": [],
-                    "interest_tags": [],
-                    "search_queries": [],
-                    "content_preferences": [],
-                    "reasoning": content[:500]
-                }
-
+            # JSON 模式 + 容错解析 + Schema 校验，解析失败时修复重试一次，仍失败则直接报错，
+            # 不再用空关键词继续执行搜索和排序
+            intent = await chat_structured(
+                payload,
+                IntentAnalysis,
+                label="analyze_intent",
+                timeout=120.0,
+                use_cache=True,
+                bypass_cache=bypass_cache
+            )
+            parsed_result = intent.model_dump()
+
+            logger.info(
+                f"DeepSeek-V3.2 意图分析完成: {parsed_result['primary_intent']}，"
+                f"关键词 {parsed_result['keywords'][:5]}"
+            )
             return parsed_result
 
         except Exception as e:
@@ -274,4 +293,4 @@ class DeepSeekService:
 
 
 # 创建全局实例
-deepseek_service = DeepSeekService()
+deepseek_service = lazy_service(DeepSeekService, "deepseek_service")
@@ -0,0 +1,192 @@
+"""
+生成图片缓存
+以 (模型, 作用域, 规范化后的提示词) 为键，把已生成并存入 Storage 的图片 URL 保存在 public.generated_images，
+重新生成文章或相似主题产生相同的配图描述时，不再调用 FLUX，也不再写入 Storage
+
+- 作用域: global (所有用户共享) 或 user (每个用户独立)，由 IMAGE_CACHE_SCOPE 配置
+- 同一进程内相同键的并发请求只生成一次，其中一个请求被取消不影响其他请求
+- 每次生成写入新的 Storage 路径，淘汰后仍被文章引用的图片不会被重新生成的图片覆盖
+- 超过 IMAGE_CACHE_MAX_ENTRIES 时按最近使用时间淘汰，没有被任何文章引用的 Storage 对象 (及其派生图片) 一并删除
+- 缓存的值为 {"url": 公开 URL, "variants": {标签: 派生图片 URL}}
+"""
+import asyncio
+import hashlib
+import logging
+import random
+import re
+import unicodedata
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Callable, Awaitable
+from app.config import settings
+from app.database import supabase
+from app.services.image_variants import image_variant_service
+from app.services.container import lazy_service
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TRIM_CHARS = " .。!！,，;；:：\"'“”‘’"
+# 中文字符两侧的空白没有语义
+CJK_SPACE_PATTERN = re.compile(r"(?<=[\u4e00-\u9fff])\s+|\s+(?=[\u4e00-\u9fff])")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """全角转半角、合并空白、转小写并去掉首尾标点"""
+    text = unicodedata.normalize("NFKC", prompt or "")
+    text = CJK_SPACE_PATTERN.sub("", text)
+    text = re.sub(r"\s+", " ", text).strip().lower()
+    return text.strip(PROMPT_TRIM_CHARS)
+
+
+class ImageCache:
+    # 每次写入时执行淘汰的概率，避免每次写入都扫描整表
+    EVICTION_PROBABILITY = 0.05
+    EVICTION_BATCH = 100
+
+    def __init__(self):
+        self.enabled = settings.IMAGE_CACHE_ENABLED
+        self.scope = settings.IMAGE_CACHE_SCOPE
+        self.max_entries = settings.IMAGE_CACHE_MAX_ENTRIES
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def scope_for(self, user_id: Optional[str]) -> str:
+        return f"user:{user_id}" if self.scope == "user" and user_id else "global"
+
+    @staticmethod
+    def make_key(prompt: str, model: str, scope: str) -> str:
+        source = f"{model}\n{scope}\n{normalize_prompt(prompt)}"
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    def storage_path(self, key: str, user_id: Optional[str]) -> str:
+        """
+        每次生成使用新的路径: 缓存记录被淘汰后仍被文章引用的图片会保留在 Storage 中，
+        相同提示词再次生成时不能覆盖它
+        """
+        owner = user_id if self.scope == "user" and user_id else "shared"
+        return f"generated/{owner}/{key[:16]}-{uuid.uuid4().hex[:16]}.jpg"
+
+    async def get_or_generate(
+        self,
+        prompt: str,
+        model: str,
+        user_id: Optional[str],
+        generate: Callable[[str], Awaitable[Optional[Dict[str, Any]]]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        返回提示词对应的图片 {"url", "variants"}，未命中时调用 generate 生成
+
+        Args:
+            generate: 接收 Storage 路径，生成并上传图片后返回 {"url", "variants"}，失败返回 None (不缓存)
+        """
+        if not self.enabled:
+            return await generate(f"generated/{user_id}/{uuid.uuid4()}.jpg")
+
+        scope = self.scope_for(user_id)
+        key = self.make_key(prompt, model, scope)
+
+        # 相同键的并发请求共享一个任务；单个请求被取消不影响任务和其他等待者
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._lookup_or_generate(key, prompt, model, scope, user_id, generate))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    async def _lookup_or_generate(
+        self,
+        key: str,
+        prompt: str,
+        model: str,
+        scope: str,
+        user_id: Optional[str],
+        generate: Callable[[str], Awaitable[Optional[Dict[str, Any]]]]
+    ) -> Optional[Dict[str, Any]]:
+        image = await asyncio.to_thread(self._lookup, key)
+        if image:
+            logger.info(f"命中图片缓存: {prompt[:40]}")
+            return image
+        path = self.storage_path(key, user_id)
+        image = await generate(path)
+        if image:
+            await asyncio.to_thread(self._store, key, prompt, model, scope, user_id, path, image)
+        return image
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 所有请求都已取消时避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            result = supabase.table("generated_images").select("public_url, variants, hit_count").eq("cache_key", key).execute()
+            if not result.data:
+                return None
+            row = result.data[0]
+            supabase.table("generated_images").update({
+                "hit_count": (row.get("hit_count") or 0) + 1,
+                "last_used_at": datetime.now(timezone.utc).isoformat()
+            }).eq("cache_key", key).execute()
+            return {"url": row["public_url"], "variants": row.get("variants") or {}}
+        except Exception as e:
+            logger.warning(f"读取图片缓存失败: {str(e)}")
+            return None
+
+    def _store(self, key: str, prompt: str, model: str, scope: str,
+               user_id: Optional[str], path: str, image: Dict[str, Any]):
+        try:
+            now = datetime.now(timezone.utc).isoformat()
+            supabase.table("generated_images").upsert({
+                "cache_key": key,
+                "prompt": normalize_prompt(prompt),
+                "model": model,
+                "scope": scope,
+                "user_id": user_id,
+                "storage_path": path,
+                "public_url": image["url"],
+                "variants": image.get("variants") or None,
+                "created_at": now,
+                "last_used_at": now
+            }, on_conflict="cache_key").execute()
+
+            if random.random() < self.EVICTION_PROBABILITY:
+                self.evict()
+        except Exception as e:
+            logger.warning(f"写入图片缓存失败: {str(e)}")
+
+    def evict(self) -> int:
+        """淘汰超出容量的最久未使用条目，返回删除的 Storage 对象数量"""
+        overflow = supabase.table("generated_images").select("cache_key, storage_path, variants") \
+            .order("last_used_at", desc=True) \
+            .range(self.max_entries, self.max_entries + self.EVICTION_BATCH - 1) \
+            .execute()
+        if not overflow.data:
+            return 0
+
+        # 仍被文章引用的图片只删除缓存记录，保留 Storage 对象
+        orphaned = [
+            path
+            for row in overflow.data if not self._is_referenced(row["storage_path"])
+            for path in [row["storage_path"], *image_variant_service.variant_paths(row["storage_path"], row.get("variants"))]
+        ]
+        if orphaned:
+            supabase.storage.from_("uploads").remove(orphaned)
+        supabase.table("generated_images").delete().in_(
+            "cache_key", [row["cache_key"] for row in overflow.data]
+        ).execute()
+        logger.info(f"图片缓存淘汰 {len(overflow.data)} 条，删除 {len(orphaned)} 个未引用的 Storage 对象")
+        return len(orphaned)
+
+    @staticmethod
+    def _is_referenced(path: str) -> bool:
+        # article_images 记录文章引用的图片路径 (GIN 索引)，不扫描文章内容
+        result = supabase.table("recommendations").select("id") \
+            .contains("article_images", [path]) \
+            .limit(1) \
+            .execute()
+        return bool(result.data)
+
+
+# 创建全局实例
+image_cache = lazy_service(ImageCache, "image_cache")
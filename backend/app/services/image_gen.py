@@ -1,16 +1,80 @@
 import logging
 import httpx
 import base64
-import uuid
 import asyncio
+import random
+import time
+from typing import Any, Optional, Dict, Callable, Awaitable
 from app.config import settings
+from app.services.metrics import observe_upstream
+from app.services.image_cache import image_cache
+from app.services.image_variants import image_variant_service
+from app.services.llm_gateway import parse_retry_after
 from app.database import supabase
+from app.services.container import lazy_service
 
 logger = logging.getLogger(__name__)
 
+
+class ImageRateLimited(Exception):
+    def __init__(self, retry_after: Optional[float]):
+        super().__init__(f"image generation rate limited (retry after {retry_after})")
+        self.retry_after = retry_after
+
+
+class ImageRequestLimiter:
+    """
+    Caps concurrent FLUX calls; a 429 pauses every queued call for Retry-After.
+
+    Identical prompts are already collapsed by the single-flight in ImageCache.get_or_generate
+    (with the image cache enabled), so each call here is a distinct prompt; SiliconFlow's batch_size
+    only yields variants of one prompt, so there is nothing left to batch.
+    """
+
+    MAX_RATE_LIMIT_RETRIES = 2
+
+    def __init__(self, call: Callable[[str, str], Awaitable[Optional[str]]], concurrency: int):
+        self._call = call
+        self.concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._paused_until = 0.0
+        self.stats = {"requested": 0, "calls": 0, "rate_limited": 0}
+
+    async def submit(self, prompt: str, size: str) -> Optional[str]:
+        """Wait for a slot and return the (temporary) provider image URL"""
+        self.stats["requested"] += 1
+        async with self._get_semaphore():
+            return await self._call_with_backoff(prompt, size)
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # The semaphore belongs to one event loop; rebuild when it changes
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def _call_with_backoff(self, prompt: str, size: str) -> Optional[str]:
+        for attempt in range(self.MAX_RATE_LIMIT_RETRIES + 1):
+            wait = self._paused_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.stats["calls"] += 1
+            try:
+                return await self._call(prompt, size)
+            except ImageRateLimited as e:
+                self.stats["rate_limited"] += 1
+                if attempt == self.MAX_RATE_LIMIT_RETRIES:
+                    raise
+                delay = e.retry_after if e.retry_after is not None else random.uniform(1.0, 2.0) * (2 ** attempt)
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logger.warning(f"Image generation rate limited, pausing queue for {delay:.1f}s")
+
+
 class ImageGenerationService:
     def __init__(self):
-        self.api_key = settings.DEEPSEEK_API_KEY
+        self.api_key = settings.require("DEEPSEEK_API_KEY")
         # Ensure we use the correct base URL for image generation
         # If BASE_URL is https://api.siliconflow.cn/v1, we use that.
         self.base_url = settings.DEEPSEEK_BASE_URL
@@ -19,79 +83,136 @@ class ImageGenerationService:
             "Content-Type": "application/json"
         }
         self.model = "black-forest-labs/FLUX.1-schnell" # Efficient and high quality
+        self.image_size = "1024x1024"
+        self.limiter = ImageRequestLimiter(self._request_image, concurrency=settings.IMAGE_GEN_CONCURRENCY)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def image_width(self) -> int:
+        return int(self.image_size.split("x")[0])
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Reuse one pooled client for generation and downloads (bound to the running loop)
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(timeout=60.0)
+            self._client_loop = loop
+        return self._client
 
     async def generate_image(self, prompt: str, user_id: str) -> str:
         """
         Generate an image based on the prompt, upload to Supabase, and return the persistent URL.
+        Repeated prompts are served from the generated image cache.
+        """
+        image = await self.render(prompt, user_id)
+        return image["url"] if image else self.fallback_url(prompt)
+
+    async def render(self, prompt: str, user_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Persistent image for the prompt (cached or freshly generated) as {"url", "variants"},
+        or None when generation fails
         """
         try:
-            # 1. Optimize prompt for Flux (English preferred)
-            # We could use a small LLM call to translate/enhance prompt if it's Chinese, 
-            # but Flux handles simple prompts okay. Let's assume the LLM generates Chinese descriptions,
-            # so we might want to translate them or hope Flux handles Chinese (it often struggles).
-            # Let's prepend "High quality, realistic, " to style it.
-            
-            # Simple translation/enhancement via LLM is safer but adds latency.
-            # Let's try direct prompt first.
-            
-            logger.info(f"Generating image for prompt: {prompt}")
-            
-            payload = {
-                "model": self.model,
-                "prompt": f"high quality, realistic, {prompt}", 
-                "image_size": "1024x1024",
-                "batch_size": 1,
-                "num_inference_steps": 4, # Schnell is fast
-                "guidance_scale": 0.0 # Schnell often uses 0 or small guidance
-            }
-
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/images/generations",
-                    json=payload,
-                    headers=self.headers
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Image Gen API Error: {response.text}")
-                    # Fallback to a placeholder service if generation fails
-                    return f"https://image.pollinations.ai/prompt/{prompt}"
-                
-                result = response.json()
-                
-            # SiliconFlow usually returns a URL in 'data' list
-            image_data = result["data"][0]
-            image_url = image_data.get("url")
-            
-            if not image_url:
-                raise Exception("No image URL returned")
-
-            # 2. Download and Upload to Supabase to make it persistent
-            # (SiliconFlow URLs are temporary)
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                img_res = await client.get(image_url)
-                img_res.raise_for_status()
-                img_bytes = img_res.content
-            
-            # Generate filename
-            filename = f"generated/{user_id}/{uuid.uuid4()}.jpg"
-            
-            # Upload
-            supabase.storage.from_("uploads").upload(
-                filename,
-                img_bytes,
-                {"content-type": "image/jpeg"}
+            return await image_cache.get_or_generate(
+                prompt, self.model, user_id,
+                lambda storage_path: self._generate_and_store(prompt, storage_path)
             )
-            
-            # Get Public URL
-            public_url = supabase.storage.from_("uploads").get_public_url(filename)
-            
-            logger.info(f"Image generated and stored: {public_url}")
-            return public_url
-
         except Exception as e:
             logger.error(f"Image generation failed: {str(e)}", exc_info=True)
-            # Fallback
-            return f"https://image.pollinations.ai/prompt/{prompt}"
+            return None
+
+    @staticmethod
+    def fallback_url(prompt: str) -> str:
+        return f"https://image.pollinations.ai/prompt/{prompt}"
+
+    async def _generate_and_store(self, prompt: str, storage_path: str) -> Optional[Dict[str, Any]]:
+        """
+        Generate through the limiter, copy the result (and its WebP variants) to Supabase Storage
+        and return {"url", "variants"}.
+        Returns None when the API rejects the request (caller falls back, nothing is cached).
+        """
+        image_url = await self.limiter.submit(prompt, self.image_size)
+        if not image_url:
+            return None
+
+        # 2. Download and Upload to Supabase to make it persistent
+        # (SiliconFlow URLs are temporary)
+        img_res = await self._get_client().get(image_url, timeout=30.0)
+        img_res.raise_for_status()
+        img_bytes = img_res.content
+        
+        # Upload (every generation gets a fresh path, so nothing an article references is overwritten)
+        supabase.storage.from_("uploads").upload(
+            storage_path,
+            img_bytes,
+            {"content-type": "image/jpeg", "upsert": "true"}
+        )
+        
+        # Get Public URL
+        public_url = supabase.storage.from_("uploads").get_public_url(storage_path)
+        
+        logger.info(f"Image generated and stored: {public_url}")
+
+        # Responsive WebP widths for the article srcset
+        variants = await image_variant_service.create_variants(img_bytes, storage_path)
+        return {"url": public_url, "variants": variants}
+
+    async def _request_image(self, prompt: str, size: str) -> Optional[str]:
+        """
+        One FLUX call; returns the temporary image URL, or None when the API rejects the request.
+        """
+        # 1. Optimize prompt for Flux (English preferred)
+        # We could use a small LLM call to translate/enhance prompt if it's Chinese, 
+        # but Flux handles simple prompts okay. Let's assume the LLM generates Chinese descriptions,
+        # so we might want to translate them or hope Flux handles Chinese (it often struggles).
+        # Let's prepend "High quality, realistic, " to style it.
+        
+        # Simple translation/enhancement via LLM is safer but adds latency.
+        # Let's try direct prompt first.
+        
+        logger.info(f"Generating image for prompt: {prompt}")
+        
+        payload = {
+            "model": self.model,
+            "prompt": f"high quality, realistic, {prompt}", 
+            "image_size": size,
+            "batch_size": 1,
+            "num_inference_steps": 4, # Schnell is fast
+            "guidance_scale": 0.0 # Schnell often uses 0 or small guidance
+        }
+
+        started = time.monotonic()
+        try:
+            response = await self._get_client().post(
+                f"{self.base_url}/images/generations",
+                json=payload,
+                headers=self.headers
+            )
+        except httpx.TimeoutException:
+            observe_upstream("flux", self.model, time.monotonic() - started, "timeout")
+            raise
+        observe_upstream("flux", self.model, time.monotonic() - started, str(response.status_code))
+
+        if response.status_code == 429:
+            raise ImageRateLimited(parse_retry_after(response.headers.get("Retry-After")))
+        if response.status_code != 200:
+            logger.error(f"Image Gen API Error: {response.text}")
+            return None
+        
+        result = response.json()
+            
+        # SiliconFlow usually returns a URL in 'data' list
+        image_data = result["data"][0]
+        image_url = image_data.get("url")
+        
+        if not image_url:
+            raise Exception("No image URL returned")
+        return image_url
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
-image_gen_service = ImageGenerationService()
+image_gen_service = lazy_service(ImageGenerationService, "image_gen_service", close="aclose")
@@ -0,0 +1,325 @@
+"""
+图片预处理服务
+在发送给 DeepSeek-OCR 之前缩放、重新压缩图片并去除 EXIF 等元数据
+Pillow 的解码/编码是 CPU 密集操作，放在进程池中执行以免阻塞事件循环
+
+缩放只限制短边: 长截图 (如 1170x5000) 按最长边缩放会把文字缩到无法识别，
+限制短边时宽度保持可读，长边另有一个很宽松的上限 (只处理极端的长图和全景图)
+
+不重新压缩直接发送原图时同样不带元数据: JPEG 无损删除元数据段，其他格式只有不带元数据时才直接发送
+"""
+import asyncio
+import base64
+import io
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Optional, Tuple, Callable, TypeVar
+from PIL import Image, ImageOps
+from app.config import settings
+from app.services.container import lazy_service
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 图片格式对应的 MIME 类型 (输出格式和保留原图时的输入格式)
+FORMAT_MIME = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "PNG": "image/png",
+    "GIF": "image/gif"
+}
+
+# 预处理失败时按文件头识别原图格式
+MAGIC_FORMATS = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF8", "GIF"),
+)
+
+
+# 图片信息中的元数据 (EXIF 中可能包含 GPS 位置、拍摄设备等)
+METADATA_KEYS = ("exif", "xmp", "XML:com.adobe.xmp", "icc_profile", "photoshop", "comment")
+# JPEG 中保留的段: APP0 (JFIF) 和 APP14 (Adobe 颜色变换，解码需要)
+JPEG_KEPT_APP_MARKERS = ("APP0", "APP14")
+
+
+def sniff_format(data: bytes) -> Optional[str]:
+    """按文件头识别 JPEG / PNG / GIF / WEBP，无法识别时返回 None"""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "WEBP"
+    for magic, image_format in MAGIC_FORMATS:
+        if data.startswith(magic):
+            return image_format
+    return None
+
+
+def target_size(size: Tuple[int, int], max_short_side: int, max_long_side: int) -> Tuple[int, int]:
+    """短边不超过 max_short_side、长边不超过 max_long_side 的等比缩放尺寸 (不放大)"""
+    width, height = size
+    scale = min(1.0, max_short_side / min(width, height), max_long_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def flatten_to_rgb(img: Image.Image) -> Image.Image:
+    """转换为 RGB / L，透明背景铺白，避免 JPEG 中出现黑底"""
+    if img.mode in ("RGB", "L"):
+        return img
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    return img.convert("RGB")
+
+
+def has_metadata(img: Image.Image) -> bool:
+    """只读取文件头判断图片是否带 EXIF / XMP / ICC / IPTC / 文本等元数据"""
+    if any(img.info.get(key) for key in METADATA_KEYS):
+        return True
+    if img.format == "JPEG":
+        return any(marker not in JPEG_KEPT_APP_MARKERS for marker, _ in getattr(img, "applist", []))
+    if img.format == "PNG":
+        # tEXt / iTXt / zTXt 文本块 (其他 PNG 信息为数值或元组)
+        return any(isinstance(value, str) for value in img.info.values())
+    return False
+
+
+def strip_jpeg_metadata(data: bytes) -> Optional[bytes]:
+    """
+    无损删除 JPEG 的元数据段 (APP1-APP13、APP15 和 COM: EXIF、XMP、ICC、IPTC、注释)，
+    只复制段结构，不解码像素；EOI 之后的附加数据 (如 MPF 缩略图) 一并丢弃。格式异常时返回 None
+    """
+    if not data.startswith(b"\xff\xd8"):
+        return None
+    parts = [b"\xff\xd8"]
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:  # 填充字节
+            pos += 1
+            continue
+        if marker == 0xDA:
+            # SOS 之后是压缩数据，其中的 0xFF 都经过转义，第一个 FFD9 就是 EOI
+            end = data.find(b"\xff\xd9", pos)
+            if end < 0:
+                return None
+            parts.append(data[pos:end + 2])
+            return b"".join(parts)
+        length = int.from_bytes(data[pos + 2:pos + 4], "big")
+        end = pos + 2 + length
+        if length < 2 or end > len(data):
+            return None
+        if not ((0xE1 <= marker <= 0xEF and marker != 0xEE) or marker == 0xFE):
+            parts.append(data[pos:end])
+        pos = end
+    return None
+
+
+def can_send_as_is(data: bytes, max_short_side: int, max_long_side: int) -> Optional[Tuple[str, Tuple[int, int]]]:
+    """
+    只读取文件头判断原图是否可以直接发送 (尺寸在上限内、不需要按 EXIF 旋转、格式受支持、
+    不带元数据或为 JPEG 可以无损删除元数据)，可以时返回 (格式, 尺寸)，否则返回 None；不解码像素，在事件循环中执行
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if img.format not in FORMAT_MIME:
+                return None
+            if img.format != "JPEG" and has_metadata(img):
+                return None
+            # PNG / GIF 读取 EXIF 需要解码整张图片，这两种格式 (截图) 基本不带方向信息，不检查
+            if img.format in ("JPEG", "WEBP") and img.getexif().get(0x0112, 1) != 1:
+                return None
+            if target_size(img.size, max_short_side, max_long_side) != img.size:
+                return None
+            return img.format, img.size
+    except Exception:
+        return None
+
+
+def preprocess_image_bytes(
+    data: bytes,
+    max_short_side: int,
+    max_long_side: int,
+    image_format: str,
+    quality: int
+) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    缩放并重新压缩图片 (在子进程中运行，必须是模块级函数)
+
+    Args:
+        data: 原始图片字节
+        max_short_side: 短边的像素上限
+        max_long_side: 长边的像素上限
+        image_format: 输出格式 (JPEG / WEBP)
+        quality: 压缩质量 (1-95)
+
+    Returns:
+        (处理后的图片字节, 尺寸信息、原图格式和原图是否带元数据)
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        original_size = img.size
+        source_format = img.format
+        metadata = has_metadata(img)
+        # EXIF 方向 (1 表示不需要旋转)
+        orientation = img.getexif().get(0x0112, 1)
+        size = target_size(original_size, max_short_side, max_long_side)
+
+        # JPEG 可以在解码阶段直接按 1/2、1/4、1/8 缩小 (不小于目标尺寸)，显著减少解码耗时
+        # EXIF 旋转不改变短边和长边，按旋转前的方向请求即可
+        img.draft("RGB", size)
+
+        # 先按 EXIF 方向旋转，再丢弃全部元数据
+        img = flatten_to_rgb(ImageOps.exif_transpose(img))
+
+        img.thumbnail(target_size(img.size, max_short_side, max_long_side), Image.LANCZOS)
+
+        output = io.BytesIO()
+        save_kwargs = {"quality": quality}
+        if image_format == "JPEG":
+            save_kwargs.update({"optimize": True, "progressive": True})
+        else:
+            save_kwargs["method"] = 4
+        img.save(output, format=image_format, **save_kwargs)
+
+        return output.getvalue(), {
+            "original_size": list(original_size),
+            "processed_size": list(img.size),
+            "source_format": source_format,
+            "rotated": orientation != 1,
+            "has_metadata": metadata
+        }
+
+
+class ImagePreprocessService:
+    def __init__(self):
+        self.max_short_side = settings.OCR_IMAGE_MAX_SHORT_SIDE
+        self.max_long_side = settings.OCR_IMAGE_MAX_LONG_SIDE
+        self.image_format = settings.OCR_IMAGE_FORMAT.upper()
+        self.quality = settings.OCR_IMAGE_QUALITY
+        self.passthrough_bytes = settings.OCR_IMAGE_PASSTHROUGH_BYTES
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=settings.IMAGE_PROCESS_WORKERS)
+        return self._executor
+
+    async def run_in_pool(self, func: Callable[..., T], *args: Any) -> T:
+        """在共享的 Pillow 进程池中执行模块级函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), func, *args)
+
+    async def prepare_for_ocr(self, img_bytes: bytes) -> Dict[str, Any]:
+        """
+        将原始图片转换为适合 OCR 的 data URL
+
+        Args:
+            img_bytes: 原始图片字节
+
+        Returns:
+            包含 data_url 和处理统计 (节省字节数、耗时、是否使用原图) 的字典
+        """
+        start = time.monotonic()
+        original_bytes = len(img_bytes)
+
+        # 已经足够小且尺寸在上限内的图片 (常见于截图) 重新压缩几乎没有收益，跳过进程池直接发送
+        as_is = (
+            can_send_as_is(img_bytes, self.max_short_side, self.max_long_side)
+            if original_bytes <= self.passthrough_bytes else None
+        )
+        if as_is:
+            source_format, size = as_is
+            original = self._without_metadata(img_bytes, source_format, source_format == "JPEG")
+            if original is not None:
+                dimensions = {"original_size": list(size), "processed_size": list(size)}
+                return self._result(original, original_bytes, dimensions, FORMAT_MIME[source_format], True, start)
+
+        try:
+            processed, dimensions = await self.run_in_pool(
+                preprocess_image_bytes,
+                img_bytes,
+                self.max_short_side,
+                self.max_long_side,
+                self.image_format,
+                self.quality
+            )
+            source_format = dimensions.pop("source_format", None)
+            rotated = dimensions.pop("rotated", False)
+            metadata = dimensions.pop("has_metadata", True)
+            # 重新压缩后反而更大 (例如已经高度压缩的截图) 时发送原图 (不带元数据)；需要按 EXIF 旋转的图片仍使用处理结果
+            original = (
+                self._without_metadata(img_bytes, source_format, metadata)
+                if source_format in FORMAT_MIME and not rotated else None
+            )
+            kept_original = original is not None and len(original) <= len(processed)
+            if kept_original:
+                processed = original
+                mime_type = FORMAT_MIME[source_format]
+            else:
+                mime_type = FORMAT_MIME.get(self.image_format, "image/jpeg")
+        except Exception as e:
+            # 预处理失败不影响主流程，直接使用原图 (JPEG 仍尽量删除元数据)
+            logger.warning(f"图片预处理失败，使用原图: {str(e)}")
+            source_format = sniff_format(img_bytes)
+            processed, dimensions = img_bytes, {}
+            if source_format == "JPEG":
+                processed = strip_jpeg_metadata(img_bytes) or img_bytes
+            kept_original = True
+            mime_type = FORMAT_MIME.get(source_format, "image/jpeg")
+
+        return self._result(processed, original_bytes, dimensions, mime_type, kept_original, start)
+
+    @staticmethod
+    def _without_metadata(data: bytes, source_format: Optional[str], metadata: bool) -> Optional[bytes]:
+        """可以直接发送的原图字节: 不带元数据时原样返回，JPEG 无损删除元数据段，其他格式返回 None (需要重新编码)"""
+        if not metadata:
+            return data
+        if source_format == "JPEG":
+            return strip_jpeg_metadata(data)
+        return None
+
+    @staticmethod
+    def _result(
+        processed: bytes,
+        original_bytes: int,
+        dimensions: Dict[str, Any],
+        mime_type: str,
+        kept_original: bool,
+        start: float
+    ) -> Dict[str, Any]:
+        elapsed_ms = round((time.monotonic() - start) * 1000, 1)
+        encoded = base64.b64encode(processed).decode("utf-8")
+
+        stats = {
+            **dimensions,
+            "original_bytes": original_bytes,
+            "processed_bytes": len(processed),
+            "bytes_saved": original_bytes - len(processed),
+            # base64 编码后的请求体节省量 (4/3 膨胀)
+            "payload_bytes_saved": (original_bytes - len(processed)) * 4 // 3,
+            "format": mime_type,
+            "kept_original": kept_original,
+            "preprocess_ms": elapsed_ms
+        }
+        logger.info(
+            f"图片预处理完成: {original_bytes} -> {len(processed)} 字节 "
+            f"(节省 {stats['bytes_saved']})，耗时 {elapsed_ms}ms"
+        )
+
+        return {
+            "data_url": f"data:{mime_type};base64,{encoded}",
+            "stats": stats
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# 创建全局实例
+image_preprocess_service = lazy_service(ImagePreprocessService, "image_preprocess_service", close="shutdown")
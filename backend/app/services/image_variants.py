@@ -0,0 +1,161 @@
+"""
+派生图片
+图片上传或生成后，在 Pillow 进程池中生成 WebP 缩略图和几个响应式宽度的版本，存放在原图旁边:
+    {user_id}/{uuid}.jpg -> {user_id}/{uuid}@thumb.webp, {user_id}/{uuid}@w480.webp, ...
+
+历史记录使用缩略图 (推荐磁贴目前没有本站存储的图片，有了之后再返回缩略图)，文章配图通过 srcset 让浏览器按显示宽度选择版本，不再总是下载原图
+"""
+import asyncio
+import io
+import logging
+from typing import Any, Dict, List, Optional
+from PIL import Image, ImageOps
+from app.config import settings
+from app.database import supabase
+from app.services.blob_cache import blob_cache
+from app.services.image_preprocess import image_preprocess_service, flatten_to_rgb
+from app.services.container import lazy_service
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_LABEL = "thumb"
+# 文章配图在页面中的显示宽度 (文章弹窗的正文最宽 768px)
+ARTICLE_IMAGE_SIZES = "(max-width: 768px) 100vw, 768px"
+
+
+def width_label(width: int) -> str:
+    return f"w{width}"
+
+
+def render_variants(data: bytes, widths: List[int], thumbnail_size: int, quality: int) -> Dict[str, bytes]:
+    """
+    生成缩略图和响应式宽度的 WebP 版本 (在子进程中运行，必须是模块级函数)
+
+    Args:
+        data: 原始图片字节
+        widths: 响应式宽度，不小于原图宽度的跳过
+        thumbnail_size: 正方形缩略图边长 (居中裁剪)
+        quality: WebP 压缩质量
+
+    Returns:
+        {标签: WebP 字节}
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        # JPEG 在解码阶段直接缩小到不低于最大目标尺寸
+        largest = max([thumbnail_size, *widths])
+        img.draft("RGB", (largest, largest))
+        img = flatten_to_rgb(ImageOps.exif_transpose(img))
+
+        def encode(image: Image.Image) -> bytes:
+            output = io.BytesIO()
+            image.save(output, format="WEBP", quality=quality, method=4)
+            return output.getvalue()
+
+        variants = {THUMBNAIL_LABEL: encode(ImageOps.fit(img, (thumbnail_size, thumbnail_size), Image.LANCZOS))}
+        for width in sorted(widths):
+            if width >= img.width:
+                continue
+            height = max(1, round(img.height * width / img.width))
+            variants[width_label(width)] = encode(img.resize((width, height), Image.LANCZOS))
+        return variants
+
+
+class ImageVariantService:
+    def __init__(self):
+        self.enabled = settings.IMAGE_VARIANTS_ENABLED
+        self.widths = sorted(settings.IMAGE_VARIANT_WIDTHS)
+        self.thumbnail_size = settings.IMAGE_THUMBNAIL_SIZE
+        self.quality = settings.IMAGE_VARIANT_QUALITY
+
+    @staticmethod
+    def variant_path(storage_path: str, label: str) -> str:
+        stem = storage_path.rsplit(".", 1)[0] if "." in storage_path.rsplit("/", 1)[-1] else storage_path
+        return f"{stem}@{label}.webp"
+
+    def variant_paths(self, storage_path: str, variants: Optional[Dict[str, str]]) -> List[str]:
+        """原图对应的派生图片路径 (删除原图时一并删除)"""
+        return [self.variant_path(storage_path, label) for label in (variants or {})]
+
+    async def create_variants(self, data: bytes, storage_path: str) -> Dict[str, str]:
+        """
+        生成并上传派生图片，返回 {标签: 公开 URL}
+
+        失败只记录日志并返回已上传的部分，调用方继续使用原图
+        """
+        if not self.enabled:
+            return {}
+        try:
+            rendered = await image_preprocess_service.run_in_pool(
+                render_variants, data, self.widths, self.thumbnail_size, self.quality
+            )
+        except Exception as e:
+            logger.warning(f"生成派生图片失败 ({storage_path}): {str(e)}")
+            return {}
+
+        async def store(label: str, blob: bytes) -> Optional[str]:
+            path = self.variant_path(storage_path, label)
+            try:
+                await asyncio.to_thread(
+                    supabase.storage.from_("uploads").upload,
+                    path,
+                    blob,
+                    {"content-type": "image/webp", "upsert": "true"}
+                )
+            except Exception as e:
+                logger.warning(f"上传派生图片失败 ({path}): {str(e)}")
+                return None
+            return supabase.storage.from_("uploads").get_public_url(path)
+
+        labels = list(rendered)
+        urls = await asyncio.gather(*[store(label, rendered[label]) for label in labels])
+        variants = {label: url for label, url in zip(labels, urls) if url}
+        logger.info(
+            f"派生图片已生成: {storage_path} -> {', '.join(variants)} "
+            f"({sum(len(blob) for blob in rendered.values())} 字节)"
+        )
+        return variants
+
+    async def create_for_upload(self, image_url: str):
+        """为上传的图片生成派生图片，并写入所有引用该图片的上传记录 (后台任务)"""
+        path = blob_cache.normalize_key(image_url.split("/uploads/")[-1])
+        data = await blob_cache.get(path)
+        if data is None:
+            try:
+                data = await asyncio.to_thread(supabase.storage.from_("uploads").download, path)
+            except Exception as e:
+                logger.warning(f"下载原图失败，跳过派生图片 ({path}): {str(e)}")
+                return
+
+        variants = await self.create_variants(data, path)
+        if not variants:
+            return
+        try:
+            await asyncio.to_thread(
+                lambda: supabase.table("uploads").update({"image_variants": variants}).eq("image_url", image_url).execute()
+            )
+        except Exception as e:
+            logger.warning(f"保存派生图片记录失败: {str(e)}")
+
+    def pick(self, image: Dict[str, Any], width: Optional[int]) -> str:
+        """不小于请求宽度的最小版本，没有合适的版本时返回原图"""
+        variants = image.get("variants") or {}
+        if width:
+            for candidate in self.widths:
+                if candidate >= width and width_label(candidate) in variants:
+                    return variants[width_label(candidate)]
+        return image["url"]
+
+    def srcset(self, variants: Optional[Dict[str, str]], original_url: str, original_width: Optional[int] = None) -> str:
+        """按宽度排列的 srcset，原图作为最大的候选"""
+        candidates = [
+            f"{variants[width_label(width)]} {width}w"
+            for width in self.widths
+            if variants and width_label(width) in variants
+        ]
+        if original_width:
+            candidates.append(f"{original_url} {original_width}w")
+        return ", ".join(candidates)
+
+
+# 创建全局实例
+image_variant_service = lazy_service(ImageVariantService, "image_variant_service")
@@ -4,15 +4,19 @@ Jina Reader 服务
 """
 import httpx
 import logging
+import time
 from typing import Dict, Any
 from app.config import settings
+from app.services.markdown_extract import extract_markdown_structure
+from app.services.metrics import observe_upstream
+from app.services.container import lazy_service
 
 logger = logging.getLogger(__name__)
 
 
 class JinaReaderService:
     def __init__(self):
-        self.api_key = settings.JINA_API_KEY
+        self.api_key = settings.require("JINA_API_KEY")
         self.base_url = "https://r.jina.ai"
 
     async def fetch_url_content(self, url: str) -> Dict[str, Any]:
@@ -23,7 +27,7 @@ class JinaReaderService:
             url: 要抓取的 URL
 
         Returns:
-            包含标题、内容、摘要的字典
+            包含标题、正文 (已清理的 Markdown)、大纲、外链、图片和摘要的字典
         """
         try:
             logger.info(f"开始使用 Jina Reader 抓取 URL: {url}")
@@ -35,10 +39,16 @@ class JinaReaderService:
 
             # 禁用 trust_env 以避免代理问题，并增加超时时间
             async with httpx.AsyncClient(timeout=60.0, trust_env=False, follow_redirects=True) as client:
-                response = await client.get(
-                    f"{self.base_url}/{url}",
-                    headers=headers
-                )
+                started = time.monotonic()
+                try:
+                    response = await client.get(
+                        f"{self.base_url}/{url}",
+                        headers=headers
+                    )
+                except httpx.TimeoutException:
+                    observe_upstream("jina", "reader", time.monotonic() - started, "timeout")
+                    raise
+                observe_upstream("jina", "reader", time.monotonic() - started, str(response.status_code))
                 response.raise_for_status()
 
                 # Jina Reader 返回的是 Markdown 文本
@@ -46,19 +56,28 @@ class JinaReaderService:
 
             logger.info(f"Jina Reader 抓取成功，内容长度: {len(markdown_content)}")
 
-            # 提取标题（第一行通常是标题）
-            lines = markdown_content.split('\n')
-            title = lines[0].replace('#', '').strip() if lines else "无标题"
+            # 单遍提取标题、大纲、正文、外链和图片，正文不含导航和页脚
+            structure = extract_markdown_structure(markdown_content)
+            body = structure["body"]
 
-            # 生成摘要（前 500 字符）
-            summary = markdown_content[:500] + "..." if len(markdown_content) > 500 else markdown_content
+            # 生成摘要（正文前 500 字符）
+            summary = body[:500] + "..." if len(body) > 500 else body
+
+            logger.info(
+                f"Markdown 结构提取完成: {len(markdown_content)} -> {len(body)} 字符，"
+                f"{len(structure['links'])} 个链接，{len(structure['images'])} 张图片"
+            )
 
             return {
-                "title": title,
-                "content": markdown_content,
+                "title": structure["title"],
+                "content": body,
+                "outline": structure["outline"],
+                "links": structure["links"],
+                "images": structure["images"],
                 "summary": summary,
                 "url": url,
-                "content_length": len(markdown_content)
+                "content_length": len(body),
+                "raw_length": len(markdown_content)
             }
 
         except httpx.HTTPStatusError as e:
@@ -70,4 +89,4 @@ class JinaReaderService:
 
 
 # 创建全局实例
-jina_service = JinaReaderService()
+jina_service = lazy_service(JinaReaderService, "jina_service")
@@ -0,0 +1,130 @@
+"""
+配图延迟渲染
+生成文章时不再等待配图，占位符直接替换为指向 /api/images/{token} 的稳定地址，文章可以立即保存；
+浏览器第一次请求该地址 (或后台预取轮到它) 时才生成配图，之后由生成图片缓存直接重定向到 Storage
+
+- token 内含提示词和用户 ID，并用 HMAC 签名，接口只渲染本服务签发的地址 (<img> 无法携带 Authorization)
+- 每篇文章只预取前 IMAGE_PREFETCH_PER_ARTICLE 张配图，其余配图在读者滚动到时才生成
+- 依赖生成图片缓存: 缓存关闭时回退为生成文章时同步生成配图
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+from typing import List, Optional, Set, Tuple
+from app.config import settings
+from app.services.image_gen import image_gen_service
+from app.services.image_variants import image_variant_service
+from app.services.metrics import registry
+from app.services.container import lazy_service
+
+logger = logging.getLogger(__name__)
+
+# 签名截取的十六进制位数 (128 bit)
+SIGNATURE_CHARS = 32
+
+LAZY_IMAGE_RENDERS = registry.counter(
+    "mosaic_lazy_image_renders_total",
+    "Lazy article image renders by source (request / prefetch) and outcome (ok / fallback / invalid)",
+    ("source", "outcome")
+)
+
+
+class InvalidImageToken(ValueError):
+    """配图地址格式错误或签名不匹配"""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class LazyImageService:
+    def __init__(self):
+        self.enabled = settings.IMAGE_LAZY_RENDERING and settings.IMAGE_CACHE_ENABLED
+        self.base_url = settings.PUBLIC_API_URL.rstrip("/")
+        self.prefetch_per_article = settings.IMAGE_PREFETCH_PER_ARTICLE
+        self.prefetch_concurrency = settings.IMAGE_PREFETCH_CONCURRENCY
+        secret = settings.IMAGE_URL_SECRET or f"mosaic-image-url\n{settings.require('SUPABASE_KEY')}"
+        self._secret = hashlib.sha256(secret.encode("utf-8")).digest()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _sign(self, payload: str) -> str:
+        return hmac.new(self._secret, payload.encode("ascii"), hashlib.sha256).hexdigest()[:SIGNATURE_CHARS]
+
+    def make_token(self, prompt: str, user_id: Optional[str]) -> str:
+        payload = _b64encode(json.dumps([prompt, user_id or ""], ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        return f"{payload}.{self._sign(payload)}"
+
+    def parse_token(self, token: str) -> Tuple[str, Optional[str]]:
+        """校验签名并返回 (提示词, 用户 ID)"""
+        payload, _, signature = token.partition(".")
+        if not payload or not hmac.compare_digest(signature, self._sign(payload)):
+            raise InvalidImageToken("配图地址签名无效")
+        try:
+            prompt, user_id = json.loads(_b64decode(payload).decode("utf-8"))
+        except (ValueError, TypeError) as e:
+            raise InvalidImageToken(f"配图地址格式错误: {str(e)}")
+        return prompt, user_id or None
+
+    def url_for(self, prompt: str, user_id: Optional[str]) -> str:
+        return f"{self.base_url}/api/images/{self.make_token(prompt, user_id)}"
+
+    def srcset_for(self, prompt: str, user_id: Optional[str]) -> str:
+        """响应式宽度通过 ?w= 请求，由接口重定向到对应的派生图片"""
+        url = self.url_for(prompt, user_id)
+        candidates = [f"{url}?w={width} {width}w" for width in image_variant_service.widths] \
+            if image_variant_service.enabled else []
+        candidates.append(f"{url} {image_gen_service.image_width}w")
+        return ", ".join(candidates)
+
+    async def render(self, token: str, width: Optional[int] = None) -> Tuple[str, bool]:
+        """
+        渲染 token 对应的配图，width 指定时返回不小于该宽度的派生图片
+
+        Returns:
+            (图片 URL, 是否为持久地址)；生成失败时返回备用图片地址，不应被长期缓存
+
+        Raises:
+            InvalidImageToken: 签名无效
+        """
+        try:
+            prompt, user_id = self.parse_token(token)
+        except InvalidImageToken:
+            LAZY_IMAGE_RENDERS.inc(source="request", outcome="invalid")
+            raise
+        image = await image_gen_service.render(prompt, user_id)
+        LAZY_IMAGE_RENDERS.inc(source="request", outcome="ok" if image else "fallback")
+        if image:
+            return image_variant_service.pick(image, width), True
+        return image_gen_service.fallback_url(prompt), False
+
+    def prefetch(self, prompts: List[str], user_id: Optional[str]):
+        """后台渲染文章开头的配图，读者打开文章时通常已经命中缓存"""
+        prompts = prompts[:self.prefetch_per_article]
+        if not prompts:
+            return
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.prefetch_concurrency)
+        for prompt in prompts:
+            task = asyncio.create_task(self._prefetch_one(prompt, user_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _prefetch_one(self, prompt: str, user_id: Optional[str]):
+        async with self._semaphore:
+            image = await image_gen_service.render(prompt, user_id)
+        LAZY_IMAGE_RENDERS.inc(source="prefetch", outcome="ok" if image else "fallback")
+
+
+# 创建全局实例
+lazy_image_service = lazy_service(LazyImageService, "lazy_image_service")
@@ -0,0 +1,278 @@
+"""
+LLM 响应缓存
+以 (model, messages 哈希, temperature, max_tokens) 为键缓存确定性调用的返回内容，
+相同 URL / 文本再次分析时无需重复调用大模型
+
+支持三种后端: 内存 LRU、SQLite 文件、Postgres 表 (通过 Supabase)
+高温度的"创意型"调用默认绕过缓存
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple
+from app.config import settings
+from app.services.container import lazy_service
+
+logger = logging.getLogger(__name__)
+
+# 当前任务的缓存命中记录 (写入 full_context)
+_cache_events: contextvars.ContextVar[Optional[List[Dict[str, Any]]]] = contextvars.ContextVar(
+    "llm_cache_events", default=None
+)
+
+
+def make_cache_key(payload: Dict[str, Any]) -> str:
+    """根据请求体计算缓存键"""
+    messages_hash = hashlib.sha256(
+        json.dumps(payload.get("messages", []), ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    key_source = json.dumps({
+        "model": payload.get("model"),
+        "messages": messages_hash,
+        "temperature": payload.get("temperature"),
+        "max_tokens": payload.get("max_tokens")
+    }, sort_keys=True)
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """进程内 LRU 缓存"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, created_at = entry
+            if time.time() - created_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, model: str, value: str):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteCacheBackend:
+    """SQLite 文件缓存，进程重启后仍然有效"""
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "cache_key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_llm_cache_last_accessed ON llm_cache(last_accessed_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE cache_key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE llm_cache SET last_accessed_at = ? WHERE cache_key = ?", (now, key)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, model: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (cache_key, model, response, created_at, last_accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, value, now, now)
+            )
+            # 过期淘汰 + 超出容量时按最近访问时间淘汰
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE cache_key IN ("
+                "SELECT cache_key FROM llm_cache ORDER BY last_accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+
+class PostgresCacheBackend:
+    """Postgres 表缓存 (public.llm_cache)，多个 worker 共享"""
+
+    # 每次写入时执行淘汰的概率，避免每次写入都扫描整表
+    EVICTION_PROBABILITY = 0.05
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        from app.database import supabase
+
+        result = supabase.table("llm_cache").select("response, created_at").eq("cache_key", key).execute()
+        if not result.data:
+            return None
+
+        row = result.data[0]
+        created_at = datetime.fromisoformat(row["created_at"])
+        if datetime.now(timezone.utc) - created_at > timedelta(seconds=self.ttl_seconds):
+            return None
+
+        supabase.table("llm_cache").update({
+            "last_accessed_at": datetime.now(timezone.utc).isoformat()
+        }).eq("cache_key", key).execute()
+        return row["response"]
+
+    def set(self, key: str, model: str, value: str):
+        from app.database import supabase
+
+        now = datetime.now(timezone.utc).isoformat()
+        supabase.table("llm_cache").upsert({
+            "cache_key": key,
+            "model": model,
+            "response": value,
+            "created_at": now,
+            "last_accessed_at": now
+        }).execute()
+
+        if random.random() < self.EVICTION_PROBABILITY:
+            self._evict(supabase)
+
+    def _evict(self, supabase):
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=self.ttl_seconds)).isoformat()
+        supabase.table("llm_cache").delete().lt("created_at", cutoff).execute()
+
+        overflow = supabase.table("llm_cache").select("cache_key") \
+            .order("last_accessed_at", desc=True) \
+            .range(self.max_entries, self.max_entries + 499) \
+            .execute()
+        if overflow.data:
+            supabase.table("llm_cache").delete().in_(
+                "cache_key", [row["cache_key"] for row in overflow.data]
+            ).execute()
+
+
+class LLMResponseCache:
+    def __init__(self):
+        self.backend_name = settings.LLM_CACHE_BACKEND
+        self.max_temperature = settings.LLM_CACHE_MAX_TEMPERATURE
+        self._backend = None
+
+    def _get_backend(self):
+        if self._backend is None:
+            if self.backend_name == "sqlite":
+                self._backend = SQLiteCacheBackend(
+                    settings.LLM_CACHE_SQLITE_PATH,
+                    settings.LLM_CACHE_MAX_ENTRIES,
+                    settings.LLM_CACHE_TTL_SECONDS
+                )
+            elif self.backend_name == "postgres":
+                self._backend = PostgresCacheBackend(
+                    settings.LLM_CACHE_MAX_ENTRIES,
+                    settings.LLM_CACHE_TTL_SECONDS
+                )
+            else:
+                self._backend = MemoryCacheBackend(
+                    settings.LLM_CACHE_MAX_ENTRIES,
+                    settings.LLM_CACHE_TTL_SECONDS
+                )
+        return self._backend
+
+    def is_cacheable(self, payload: Dict[str, Any], bypass: bool = False) -> bool:
+        """关闭缓存、显式绕过或高温度调用不走缓存"""
+        if bypass or self.backend_name == "none":
+            return False
+        return payload.get("temperature", 1.0) <= self.max_temperature
+
+    async def get(self, payload: Dict[str, Any], label: str, bypass: bool = False) -> Optional[str]:
+        """
+        查询缓存
+
+        Args:
+            payload: chat/completions 请求体
+            label: 调用名称 (记录在任务上下文中)
+            bypass: 是否跳过缓存
+
+        Returns:
+            缓存的响应内容，未命中返回 None
+        """
+        if not self.is_cacheable(payload, bypass):
+            self._record(label, "bypass")
+            return None
+
+        key = make_cache_key(payload)
+        try:
+            value = await asyncio.to_thread(self._get_backend().get, key)
+        except Exception as e:
+            logger.warning(f"读取 LLM 缓存失败: {str(e)}")
+            value = None
+
+        self._record(label, "hit" if value is not None else "miss", key)
+        if value is not None:
+            logger.info(f"LLM 缓存命中: {label} ({key[:12]})")
+        return value
+
+    async def set(self, payload: Dict[str, Any], value: str, bypass: bool = False):
+        if not value or not self.is_cacheable(payload, bypass):
+            return
+        try:
+            await asyncio.to_thread(
+                self._get_backend().set, make_cache_key(payload), payload.get("model", ""), value
+            )
+        except Exception as e:
+            logger.warning(f"写入 LLM 缓存失败: {str(e)}")
+
+    def _record(self, label: str, status: str, key: Optional[str] = None):
+        events = _cache_events.get()
+        if events is not None:
+            events.append({"call": label, "status": status, "key": key[:12] if key else None})
+
+
+def start_cache_tracking() -> List[Dict[str, Any]]:
+    """在当前异步任务中开始记录缓存命中情况，返回记录列表"""
+    events: List[Dict[str, Any]] = []
+    _cache_events.set(events)
+    return events
+
+
+def summarize_cache_events(events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "hits": sum(1 for e in events if e["status"] == "hit"),
+        "misses": sum(1 for e in events if e["status"] == "miss"),
+        "calls": events
+    }
+
+
+# 创建全局实例
+llm_cache = lazy_service(LLMResponseCache, "llm_cache")
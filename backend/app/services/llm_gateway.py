@@ -0,0 +1,310 @@
+"""
+LLM 网关
+所有 chat/completions 调用的统一出口:
+- 全局令牌桶限流 (每分钟请求数 / 每分钟 token 数)
+- 按模型的并发上限，交互式调用优先于后台文章生成
+- 指数退避 + 抖动重试，遵守 429 的 Retry-After
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+from typing import Dict, Any, List, Optional, Tuple
+import httpx
+from app.config import settings
+from app.services.metrics import observe_upstream
+from app.services.container import lazy_service
+
+logger = logging.getLogger(__name__)
+
+# 可重试的 HTTP 状态码
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class LLMPriority(IntEnum):
+    """数值越小优先级越高"""
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+class PrioritySemaphore:
+    """按优先级唤醒等待者的信号量，同优先级先到先得"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._in_use = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    async def acquire(self, priority: int):
+        if self._in_use < self.limit and not self._waiters:
+            self._in_use += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._counter), future)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 名额已转交给本协程，但调用方已取消，归还名额
+                self.release()
+            else:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def release(self):
+        # 名额直接转交给优先级最高的等待者
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._in_use -= 1
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+
+class RateLimiter:
+    """
+    请求数 + token 数双令牌桶
+    后台调用需要为交互式调用保留一部分余量，令牌紧张时交互式调用先通过
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, background_reserve: float):
+        self.request_capacity = float(requests_per_minute)
+        self.token_capacity = float(tokens_per_minute)
+        self.background_reserve = background_reserve
+        self._requests = self.request_capacity
+        self._tokens = self.token_capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.request_capacity, self._requests + elapsed * self.request_capacity / 60)
+        self._tokens = min(self.token_capacity, self._tokens + elapsed * self.token_capacity / 60)
+
+    def reserve(self, tokens: int, priority: LLMPriority) -> float:
+        """尝试扣减令牌，成功返回 0，否则返回建议等待的秒数"""
+        self._refill()
+
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+
+        tokens = min(float(tokens), self.token_capacity)
+        reserve = self.background_reserve if priority >= LLMPriority.BACKGROUND else 0.0
+        # 桶的容量有上限: 调用本身加上余量超过容量时只要求桶满，否则大的后台调用永远无法通过
+        need_requests = min(1 + reserve * self.request_capacity, self.request_capacity)
+        need_tokens = min(tokens + reserve * self.token_capacity, self.token_capacity)
+
+        if self._requests >= need_requests and self._tokens >= need_tokens:
+            self._requests -= 1
+            self._tokens -= tokens
+            return 0.0
+
+        wait_requests = max(0.0, need_requests - self._requests) * 60 / self.request_capacity
+        wait_tokens = max(0.0, need_tokens - self._tokens) * 60 / self.token_capacity
+        return max(wait_requests, wait_tokens, 0.05)
+
+    def adjust(self, delta_tokens: int):
+        """用实际 usage 修正预估的 token 数"""
+        self._tokens = min(self.token_capacity, self._tokens - delta_tokens)
+
+    def block_for(self, seconds: float):
+        """收到 429 后全局暂停"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+def estimate_tokens(payload: Dict[str, Any]) -> int:
+    """粗略估算一次调用消耗的 token 数 (提示词 + 最大输出)"""
+    prompt_chars = 0
+    for message in payload.get("messages", []):
+        content = message.get("content", "")
+        if isinstance(content, str):
+            prompt_chars += len(content)
+        else:
+            # 多模态内容: 图片按固定 token 数计
+            for item in content:
+                if item.get("type") == "text":
+                    prompt_chars += len(item.get("text", ""))
+                else:
+                    prompt_chars += 2000
+    # 中英文混合内容约 2 字符 / token
+    return prompt_chars // 2 + payload.get("max_tokens", 1024)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After (秒数或 HTTP 日期)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMGateway:
+    def __init__(self):
+        self.base_url = settings.DEEPSEEK_BASE_URL
+        self.headers = {
+            "Authorization": f"Bearer {settings.require('DEEPSEEK_API_KEY')}",
+            "Content-Type": "application/json"
+        }
+        self.max_retries = settings.LLM_MAX_RETRIES
+        self.rate_limiter = RateLimiter(
+            settings.LLM_REQUESTS_PER_MINUTE,
+            settings.LLM_TOKENS_PER_MINUTE,
+            settings.LLM_BACKGROUND_RESERVE
+        )
+        self._model_limits: Dict[str, PrioritySemaphore] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # 连接池与事件循环绑定，循环变化时重新创建
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                trust_env=False,
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=16)
+            )
+            self._client_loop = loop
+        return self._client
+
+    def _get_model_limit(self, model: str) -> PrioritySemaphore:
+        if model not in self._model_limits:
+            limit = settings.LLM_MODEL_CONCURRENCY.get(model, settings.LLM_DEFAULT_CONCURRENCY)
+            self._model_limits[model] = PrioritySemaphore(limit)
+        return self._model_limits[model]
+
+    async def chat(
+        self,
+        payload: Dict[str, Any],
+        priority: LLMPriority = LLMPriority.INTERACTIVE,
+        timeout: float = 120.0,
+        label: str = "chat"
+    ) -> Dict[str, Any]:
+        """
+        调用 chat/completions
+
+        Args:
+            payload: 请求体
+            priority: 优先级 (交互式 / 后台)
+            timeout: 单次请求超时 (秒)
+            label: 调用名称，用于日志
+
+        Returns:
+            API 返回的完整 JSON
+        """
+        model = payload.get("model", "")
+        estimated = estimate_tokens(payload)
+        model_limit = self._get_model_limit(model)
+
+        # 并发名额只在发送请求期间占用: 等待限流和重试退避时不占名额，交互式调用不会排在正在退避的后台调用之后
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            # 预估的 token 每次逻辑调用只扣减一次 (成功后按实际 usage 修正)，重试只占用请求数
+            await self._wait_for_rate(estimated if attempt == 0 else 0, priority)
+
+            retry_after = None
+            try:
+                await model_limit.acquire(priority)
+                started = time.monotonic()
+                try:
+                    response = await self._get_client().post(
+                        f"{self.base_url}/chat/completions",
+                        json=payload,
+                        headers=self.headers,
+                        timeout=timeout
+                    )
+                except httpx.TimeoutException:
+                    observe_upstream("llm", model, time.monotonic() - started, "timeout")
+                    raise
+                except httpx.TransportError:
+                    observe_upstream("llm", model, time.monotonic() - started, "error")
+                    raise
+                finally:
+                    model_limit.release()
+                observe_upstream("llm", model, time.monotonic() - started, str(response.status_code))
+                if response.status_code == 429:
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    self.rate_limiter.block_for(retry_after or self._backoff(attempt))
+                if response.status_code != 200:
+                    logger.error(f"LLM API 错误 [{label}]: {response.status_code} - {response.text[:500]}")
+                response.raise_for_status()
+                result = response.json()
+
+                usage = result.get("usage") or {}
+                if usage.get("total_tokens"):
+                    self.rate_limiter.adjust(usage["total_tokens"] - estimated)
+                return result
+
+            except httpx.HTTPStatusError as e:
+                last_error = e
+                if e.response.status_code not in RETRYABLE_STATUS:
+                    raise
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                last_error = e
+
+            if attempt == self.max_retries:
+                break
+
+            delay = retry_after if retry_after is not None else self._backoff(attempt)
+            logger.warning(
+                f"LLM 调用 [{label}] 失败 (尝试 {attempt + 1}/{self.max_retries + 1}): "
+                f"{type(last_error).__name__}: {str(last_error)}，{delay:.1f}s 后重试"
+            )
+            await asyncio.sleep(delay)
+
+        raise last_error
+
+    async def chat_content(
+        self,
+        payload: Dict[str, Any],
+        priority: LLMPriority = LLMPriority.INTERACTIVE,
+        timeout: float = 120.0,
+        label: str = "chat"
+    ) -> str:
+        """调用 chat/completions 并返回第一条消息的文本内容"""
+        result = await self.chat(payload, priority=priority, timeout=timeout, label=label)
+        if not result.get("choices"):
+            raise Exception(f"API returned no choices: {json.dumps(result, ensure_ascii=False)[:500]}")
+        return result["choices"][0]["message"]["content"] or ""
+
+    async def _wait_for_rate(self, tokens: int, priority: LLMPriority):
+        while True:
+            wait = self.rate_limiter.reserve(tokens, priority)
+            if wait <= 0:
+                return
+            await asyncio.sleep(min(wait, 5.0))
+
+    def _backoff(self, attempt: int) -> float:
+        """指数退避，在 [上限/2, 上限] 之间随机抖动"""
+        ceiling = min(settings.LLM_BACKOFF_MAX, settings.LLM_BACKOFF_BASE * (2 ** attempt))
+        return random.uniform(ceiling / 2, ceiling)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# 创建全局实例
+llm_gateway = lazy_service(LLMGateway, "llm_gateway", close="aclose")
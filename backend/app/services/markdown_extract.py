@@ -0,0 +1,166 @@
+"""
+Markdown 结构提取
+对 Jina Reader 返回的 Markdown 做单遍扫描，拆分为:
+标题、标题大纲、正文、外链列表、图片列表
+导航菜单、链接列表、图片引用和页脚不会进入正文，从而缩小 LLM 提示词和数据库行
+"""
+import re
+from typing import Dict, Any, List
+
+LINK_PATTERN = re.compile(r"(!?)\[([^\]]*)\]\(\s*<?([^)\s>]+)>?(?:\s+\"[^\"]*\")?\s*\)")
+BARE_URL_PATTERN = re.compile(r"https?://\S+")
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+SETEXT_UNDERLINE = re.compile(r"^(=+|-+)\s*$")
+# 这些行后面的 --- / === 是分隔线而不是标题下划线
+SETEXT_EXCLUDED_PREFIXES = ("```", "#", "-", "*", ">", "|")
+
+# Jina 默认格式的头部字段
+JINA_HEADER_PATTERN = re.compile(r"^(Title|URL Source|Published Time|Markdown Content):\s*(.*)$")
+
+# 出现后通常只剩页脚 / 推荐列表的标题
+FOOTER_HEADINGS = re.compile(
+    r"^(相关(文章|阅读|推荐)|推荐阅读|热门(文章|推荐)|猜你喜欢|评论|版权|footer|related (posts|articles)|"
+    r"comments|share this|you may also like|more from)",
+    re.IGNORECASE
+)
+
+# 导航 / 版权 / 分享等样板短行
+BOILERPLATE_LINE = re.compile(
+    r"^(skip to (main )?content|跳到主要内容|cookie|copyright|©|all rights reserved|版权所有|"
+    r"分享到|share on|subscribe|订阅|登录|注册|sign in|sign up|log in|menu|菜单|首页|home)\b",
+    re.IGNORECASE
+)
+
+MAX_LINKS = 200
+MAX_IMAGES = 50
+MAX_OUTLINE = 50
+
+
+def extract_markdown_structure(markdown: str) -> Dict[str, Any]:
+    """
+    单遍解析 Markdown
+
+    Args:
+        markdown: Jina Reader 返回的原始 Markdown
+
+    Returns:
+        {title, outline, body, links, images, stats}
+    """
+    title = ""
+    outline: List[Dict[str, Any]] = []
+    body: List[str] = []
+    links: List[Dict[str, str]] = []
+    images: List[Dict[str, str]] = []
+    seen_links = set()
+    seen_images = set()
+    dropped_lines = 0
+    in_code = False
+    in_header = True
+
+    def collect(match: re.Match) -> str:
+        is_image, text, url = match.group(1), match.group(2).strip(), match.group(3)
+        if is_image:
+            if url not in seen_images and len(images) < MAX_IMAGES:
+                seen_images.add(url)
+                images.append({"alt": text, "url": url})
+            return ""
+        if url.startswith(("http://", "https://")) and url not in seen_links and len(links) < MAX_LINKS:
+            seen_links.add(url)
+            links.append({"text": text, "url": url})
+        return text
+
+    lines = markdown.split("\n")
+    for raw_line in lines:
+        line = raw_line.strip()
+
+        # Jina 默认格式的 Title / URL Source 头部
+        if in_header:
+            header = JINA_HEADER_PATTERN.match(line)
+            if header:
+                if header.group(1) == "Title" and not title:
+                    title = header.group(2).strip()
+                continue
+            if line:
+                in_header = False
+
+        # 代码块原样保留
+        if line.startswith("```"):
+            in_code = not in_code
+            body.append(raw_line.rstrip())
+            continue
+        if in_code:
+            body.append(raw_line.rstrip())
+            continue
+
+        if not line:
+            if body and body[-1] != "":
+                body.append("")
+            continue
+
+        # Setext 标题的下划线 (上一行已作为段落加入)
+        previous = body[-1].lstrip() if body else ""
+        if SETEXT_UNDERLINE.match(line) and previous and not previous.startswith(SETEXT_EXCLUDED_PREFIXES):
+            level = 1 if line.startswith("=") else 2
+            heading_text = body[-1].strip()
+            if FOOTER_HEADINGS.match(heading_text):
+                body.pop()
+                break
+            if len(outline) < MAX_OUTLINE:
+                outline.append({"level": level, "text": heading_text})
+            if not title and level == 1:
+                title = heading_text
+            body[-1] = f"{'#' * level} {heading_text}"
+            continue
+
+        heading = HEADING_PATTERN.match(line)
+        if heading:
+            heading_text = LINK_PATTERN.sub(collect, heading.group(2)).strip()
+            if FOOTER_HEADINGS.match(heading_text):
+                break
+            if not heading_text:
+                dropped_lines += 1
+                continue
+            level = len(heading.group(1))
+            if len(outline) < MAX_OUTLINE:
+                outline.append({"level": level, "text": heading_text})
+            if not title and level == 1:
+                title = heading_text
+            body.append(f"{heading.group(1)} {heading_text}")
+            continue
+
+        # 提取链接和图片，正文只保留链接文字
+        link_count = len(LINK_PATTERN.findall(line))
+        text_line = LINK_PATTERN.sub(collect, raw_line.rstrip())
+        plain = BARE_URL_PATTERN.sub("", text_line).strip(" -*|>#·•\t")
+
+        if not plain:
+            dropped_lines += 1
+            continue
+        # 几乎全是链接的短行: 导航菜单或链接列表
+        if link_count and len(plain) < 40 and link_count * 15 >= len(plain):
+            dropped_lines += 1
+            continue
+        if len(plain) < 60 and BOILERPLATE_LINE.match(plain):
+            dropped_lines += 1
+            continue
+
+        body.append(text_line)
+
+    body_text = "\n".join(body).strip()
+
+    if not title:
+        first_line = next((l.strip() for l in lines if l.strip()), "")
+        title = first_line.replace("#", "").strip()[:200] or "无标题"
+
+    return {
+        "title": title,
+        "outline": outline,
+        "body": body_text,
+        "links": links,
+        "images": images,
+        "stats": {
+            "raw_length": len(markdown),
+            "body_length": len(body_text),
+            "dropped_lines": dropped_lines
+        }
+    }
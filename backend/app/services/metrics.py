@@ -0,0 +1,219 @@
+"""
+性能指标服务
+- 分析流水线各阶段的耗时区间 (fetch / ocr / content_analysis / intent / search / rank / persist / article / image)
+- 上游服务 (LLM 模型、Jina、搜索引擎、图片生成) 的请求耗时直方图
+- 以 Prometheus 文本格式在 /metrics 导出，可选同时输出 OpenTelemetry trace
+"""
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 阶段耗时的桶边界 (秒)，覆盖从缓存命中到长文章生成
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0, 160.0, 320.0)
+
+# 当前任务的阶段耗时记录 (写入 full_context)
+_stage_timings: contextvars.ContextVar[Optional[List[Dict[str, Any]]]] = contextvars.ContextVar(
+    "stage_timings", default=None
+)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Histogram:
+    """带标签的累计直方图 (Prometheus histogram 语义)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._series: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(round(series['sum'], 6))}")
+                lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+class Counter:
+    """带标签的计数器"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...],
+                  buckets: Tuple[float, ...] = STAGE_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...]) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_DURATION = registry.histogram(
+    "mosaic_stage_duration_seconds",
+    "Duration of analysis pipeline stages",
+    ("stage", "status")
+)
+UPSTREAM_DURATION = registry.histogram(
+    "mosaic_upstream_request_duration_seconds",
+    "Duration of upstream API requests by provider and model",
+    ("provider", "model", "status")
+)
+ANALYSIS_TASKS = registry.counter(
+    "mosaic_analysis_tasks_total",
+    "Finished analysis tasks",
+    ("status",)
+)
+
+
+class _Tracer:
+    """OpenTelemetry 为可选依赖，未安装或未开启时不输出 trace"""
+
+    def __init__(self):
+        self._tracer = None
+        self._loaded = False
+
+    def get(self):
+        if not self._loaded:
+            self._loaded = True
+            if settings.OTEL_ENABLED:
+                try:
+                    from opentelemetry import trace
+                    self._tracer = trace.get_tracer(settings.OTEL_SERVICE_NAME)
+                except ImportError:
+                    logger.warning("OTEL_ENABLED=true 但未安装 opentelemetry-api，跳过 trace 输出")
+        return self._tracer
+
+
+_tracer = _Tracer()
+
+
+@contextmanager
+def stage_span(stage: str, **attributes: Any):
+    """
+    记录一个流水线阶段的耗时
+
+    用法:
+        with stage_span("intent", model="deepseek-ai/DeepSeek-V3"):
+            ...
+    """
+    tracer = _tracer.get()
+    otel_span = tracer.start_as_current_span(f"mosaic.{stage}", attributes=attributes) if tracer else None
+    span = otel_span.__enter__() if otel_span else None
+
+    start = time.monotonic()
+    status = "ok"
+    try:
+        yield
+    except BaseException as e:
+        status = "error"
+        if span is not None:
+            span.record_exception(e)
+        raise
+    finally:
+        elapsed = time.monotonic() - start
+        STAGE_DURATION.observe(elapsed, stage=stage, status=status)
+        timings = _stage_timings.get()
+        if timings is not None:
+            timings.append({"stage": stage, "ms": round(elapsed * 1000, 1), "status": status, **attributes})
+        if otel_span is not None:
+            span.set_attribute("mosaic.status", status)
+            otel_span.__exit__(None, None, None)
+
+
+def observe_upstream(provider: str, model: str, seconds: float, status: str):
+    """记录一次上游请求的耗时 (status 为 HTTP 状态码或 error / timeout)"""
+    UPSTREAM_DURATION.observe(seconds, provider=provider, model=model, status=status)
+
+
+def start_stage_timing() -> List[Dict[str, Any]]:
+    """在当前异步任务中开始记录阶段耗时，返回记录列表"""
+    timings: List[Dict[str, Any]] = []
+    _stage_timings.set(timings)
+    return timings
+
+
+def summarize_stage_timings(timings: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """按阶段汇总耗时，保留每个区间明细"""
+    totals: Dict[str, float] = {}
+    for timing in timings:
+        totals[timing["stage"]] = round(totals.get(timing["stage"], 0) + timing["ms"], 1)
+    return {"totals_ms": totals, "spans": timings}
@@ -6,13 +6,85 @@ import logging
 import asyncio
 import re
 from typing import List, Dict, Any, Optional, Tuple
+from pydantic import BaseModel, ValidationInfo, field_validator, model_validator
 from app.services.search import search_service
-from app.services.deepseek import deepseek_service
+from app.services.llm_gateway import llm_gateway, LLMPriority
 from app.services.image_gen import image_gen_service
+from app.services.lazy_images import lazy_image_service
+from app.services.image_variants import image_variant_service, ARTICLE_IMAGE_SIZES
+from app.services.response_cache import response_cache
+from app.services.article_store import article_store
+from app.services.analysis_profiles import analysis_profile_service, AnalysisProfile
+from app.services.metrics import stage_span
+from app.services.structured_output import chat_structured, StructuredOutputError
 from app.database import supabase
+from app.services.container import lazy_service
 
 logger = logging.getLogger(__name__)
 
+TILE_TYPES = ("knowledge", "product", "location", "tutorial", "news", "community")
+
+
+class ArticleGenerationError(Exception):
+    """文章生成失败 (不保存、不缓存，下次请求重新生成)"""
+
+    def to_html(self) -> str:
+        """返回给前端展示的错误提示"""
+        return f"<div class='p-4 text-red-600'>生成文章失败: {str(self)}</div>"
+
+
+class RankedItem(BaseModel):
+    index: int  # 搜索结果序号 (1-based)
+    tile_type: str = "knowledge"
+    relevance_score: float = 0.5
+    why: str = ""
+
+    @field_validator("tile_type", mode="before")
+    @classmethod
+    def _normalize_tile_type(cls, value: Any) -> str:
+        value = str(value or "").strip().lower()
+        return value if value in TILE_TYPES else "knowledge"
+
+    @field_validator("relevance_score", mode="before")
+    @classmethod
+    def _clamp_score(cls, value: Any) -> float:
+        try:
+            score = float(value)
+        except (TypeError, ValueError):
+            return 0.5
+        return min(1.0, max(0.0, score))
+
+
+class RankingResult(BaseModel):
+    items: List[RankedItem]
+
+    @model_validator(mode="before")
+    @classmethod
+    def _accept_bare_list(cls, value: Any) -> Any:
+        # 兼容直接返回数组或使用其他字段名包裹数组的输出
+        if isinstance(value, list):
+            return {"items": value}
+        if isinstance(value, dict) and "items" not in value:
+            lists = [v for v in value.values() if isinstance(v, list)]
+            if len(lists) == 1:
+                return {"items": lists[0]}
+        return value
+
+    @model_validator(mode="after")
+    def _drop_invalid_indexes(self, info: ValidationInfo) -> "RankingResult":
+        limit = (info.context or {}).get("result_count")
+        seen = set()
+        items = []
+        for item in self.items:
+            if item.index in seen or item.index < 1 or (limit is not None and item.index > limit):
+                continue
+            seen.add(item.index)
+            items.append(item)
+        if not items:
+            raise ValueError("没有有效的搜索结果序号")
+        self.items = items
+        return self
+
 
 class RecommenderService:
     def __init__(self):
@@ -22,7 +94,8 @@ class RecommenderService:
         self,
         analysis_data: Dict[str, Any],
         user_id: str,
-        count: int = 10
+        count: Optional[int] = None,
+        profile: Optional[AnalysisProfile] = None
     ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
         """
         基于分析结果生成推荐内容
@@ -30,13 +103,16 @@ class RecommenderService:
         Args:
             analysis_data: AI 分析结果
             user_id: 用户 ID
-            count: 推荐数量
+            count: 推荐数量，默认使用档位的推荐数
+            profile: 分析档位 (搜索深度、查询数和排序模型)，默认使用默认档位
 
         Returns:
             (推荐磁贴列表, 原始搜索结果列表)
         """
         try:
-            logger.info(f"开始为用户 {user_id} 生成 {count} 个推荐")
+            profile = profile or analysis_profile_service.get(None)
+            count = count or profile.recommendation_count
+            logger.info(f"开始为用户 {user_id} 生成 {count} 个推荐 (档位 {profile.name})")
 
             # 1. 提取搜索关键词
             search_queries = analysis_data.get("search_queries", [])
@@ -53,9 +129,12 @@ class RecommenderService:
 
             # 3. 执行多个搜索查询
             all_results = []
-            for query in search_queries[:5]:  # 增加搜索次数限制，覆盖更多联想词
+            for query in search_queries[:profile.search_queries]:
                 try:
-                    results = await search_service.search(query, max_results=5)
+                    with stage_span("search"):
+                        results = await search_service.search(
+                            query, max_results=profile.results_per_query, depth=profile.search_depth
+                        )
                     all_results.extend(results)
                 except Exception as e:
                     logger.warning(f"搜索查询 '{query}' 失败: {str(e)}")
@@ -65,13 +144,19 @@ class RecommenderService:
                 logger.warning("搜索未返回结果，使用默认推荐")
                 return self._generate_fallback_recommendations(analysis_data), []
 
-            # 4. 使用 AI 对搜索结果进行评分和分类
-            recommendations = await self._rank_and_classify(
-                all_results,
-                analysis_data,
-                user_preferences,
-                count
-            )
+            # 4. 使用 AI 对搜索结果进行评分和分类 (fast 档位按搜索得分排序，不调用 LLM)
+            if profile.ranker_model:
+                with stage_span("rank"):
+                    recommendations = await self._rank_and_classify(
+                        all_results,
+                        analysis_data,
+                        user_preferences,
+                        count,
+                        model=profile.ranker_model
+                    )
+            else:
+                ranked = sorted(all_results, key=lambda r: r.get("score", 0), reverse=True)
+                recommendations = self._rank_by_search_order(ranked, count)
 
             logger.info(f"成功生成 {len(recommendations)} 个推荐")
             return recommendations, all_results
@@ -83,13 +168,18 @@ class RecommenderService:
     async def generate_article(
         self,
         recommendation: Dict[str, Any],
-        context: Dict[str, Any]
+        context: Dict[str, Any],
+        priority: LLMPriority = LLMPriority.INTERACTIVE
     ) -> Optional[str]:
         """
         基于推荐内容和上下文生成深度文章 (HTML)
         返回生成的 HTML，如果因锁等待而未生成（由其他任务处理），返回 None
+        生成失败时抛出 ArticleGenerationError
+        后台批量生成使用 BACKGROUND 优先级，让用户正在等待的调用先执行
+        篇幅和是否配图由上下文中记录的分析档位决定
         """
         rec_id = recommendation.get("id")
+        profile = analysis_profile_service.for_context(context)
         
         # 检查锁
         if rec_id in self._generation_locks:
@@ -113,6 +203,10 @@ class RecommenderService:
             
             title = recommendation.get("title", "相关内容")
             description = recommendation.get("description", "")
+            image_rule = (
+                '5. 如果有相关图片概念，使用 <div class="bg-gray-200 h-64 w-full rounded-lg flex items-center justify-center text-gray-500 mb-6">[图片占位符: 描述]</div> 表示。'
+                if profile.article_images else "5. 不要包含图片或图片占位符。"
+            )
             
             prompt = f"""请基于以下信息，写一篇关于 "{title}" 的深度文章。
 
@@ -123,11 +217,11 @@ class RecommenderService:
 {relevant_info}
 
 要求:
-1. **使用中文撰写**，内容深度、专业且引人入胜，篇幅要求 **1500字以上**。
+1. **使用中文撰写**，内容深度、专业且引人入胜，篇幅要求 **{profile.article_words}字以上**。
 2. 使用 HTML 格式输出（只输出 body 内容，不需要 html/head 标签）。
 3. 使用 Tailwind CSS 类名来美化排版 (例如: class="text-2xl font-bold mb-4", class="text-gray-700 mb-4 leading-relaxed", class="bg-gray-50 p-4 rounded-lg border-l-4 border-blue-500 italic")。
 4. 包含适当的标题 (h2, h3)、段落 (p)、列表 (ul/li) 和引用 (blockquote)。
-5. 如果有相关图片概念，使用 <div class="bg-gray-200 h-64 w-full rounded-lg flex items-center justify-center text-gray-500 mb-6">[图片占位符: 描述]</div> 表示。
+{image_rule}
 
 请直接返回 HTML 代码。"""
 
@@ -139,41 +233,17 @@ class RecommenderService:
                     {"role": "user", "content": prompt}
                 ],
                 "temperature": 0.7,
-                "max_tokens": 5000
+                "max_tokens": profile.article_max_tokens
             }
 
-            import httpx
-            
-            # Retry logic for robust generation
-            max_retries = 3
-            result = None
-            
-            for attempt in range(max_retries):
-                try:
-                    async with httpx.AsyncClient(timeout=300.0, trust_env=False) as client:
-                        response = await client.post(
-                            f"{deepseek_service.base_url}/chat/completions",
-                            json=payload,
-                            headers=deepseek_service.headers
-                        )
-                        response.raise_for_status()
-                        result = response.json()
-                        break # Success, exit loop
-                except httpx.TimeoutException:
-                    logger.warning(f"生成文章超时 (尝试 {attempt+1}/{max_retries})")
-                    if attempt == max_retries - 1:
-                        raise
-                    await asyncio.sleep(2) # Simple backoff
-                except Exception as api_err:
-                    logger.error(f"生成文章 API 调用失败 (尝试 {attempt+1}/{max_retries}): {str(api_err)}")
-                    if attempt == max_retries - 1:
-                        raise
-                    await asyncio.sleep(2)
-
-            if not result:
-                raise Exception("生成文章失败: 重试次数已耗尽")
-
-            content = result["choices"][0]["message"]["content"]
+            # 通过 LLM 网关调用 (限流、重试和退避由网关统一处理)
+            with stage_span("article", priority=priority.name.lower()):
+                content = await llm_gateway.chat_content(
+                    payload,
+                    priority=priority,
+                    timeout=300.0,
+                    label="generate_article"
+                )
             
             # 清理可能包含的 markdown 代码块标记
             content = content.replace("```html", "").replace("```", "").strip()
@@ -182,38 +252,68 @@ class RecommenderService:
             # 查找形如 <div ...>[图片占位符: 描述]</div> 的内容
             pattern = re.compile(r'(<div[^>]*>\s*\[图片占位符:\s*(.*?)\]\s*</div>)', re.DOTALL)
             matches = pattern.findall(content)
+
+            if matches and not profile.article_images:
+                # 不配图的档位: 删除模型仍然输出的占位符
+                for full_match, _ in matches:
+                    content = content.replace(full_match, "")
+                matches = []
             
             if matches:
-                logger.info(f"文章中发现 {len(matches)} 个图片占位符，开始生成配图...")
                 user_id = recommendation.get("user_id")
-                
-                for full_match, description in matches:
-                    try:
+                descriptions = [description for _, description in matches]
+
+                if lazy_image_service.enabled:
+                    # 延迟渲染: 文章立即返回，配图在浏览器首次请求或后台预取时生成
+                    logger.info(f"文章中发现 {len(matches)} 个图片占位符，使用延迟渲染")
+                    images = [
+                        (lazy_image_service.url_for(description, user_id), lazy_image_service.srcset_for(description, user_id))
+                        for description in descriptions
+                    ]
+                    lazy_image_service.prefetch(descriptions, user_id)
+                else:
+                    logger.info(f"文章中发现 {len(matches)} 个图片占位符，开始生成配图...")
+
+                    async def render(description: str) -> Tuple[str, str]:
                         # 翻译提示词 (简单处理：假设 Qwen/Flux 能理解中文，或者让 image_service 处理)
                         # 这里我们直接传入描述
-                        image_url = await image_gen_service.generate_image(description, user_id)
-                        
-                        # 构建 img 标签
-                        img_tag = (
-                            f'<figure class="mb-6">'
-                            f'<img src="{image_url}" alt="{description}" class="w-full h-auto rounded-lg shadow-md object-cover max-h-96" />'
-                            f'<figcaption class="text-center text-sm text-gray-500 mt-2">{description}</figcaption>'
-                            f'</figure>'
-                        )
-                        
-                        # 替换内容
-                        content = content.replace(full_match, img_tag)
-                        
-                    except Exception as img_err:
-                        logger.error(f"配图生成失败: {str(img_err)}")
-                        # 失败时保留原占位符或移除
-                        # content = content.replace(full_match, "") 
+                        with stage_span("image"):
+                            image = await image_gen_service.render(description, user_id)
+                        if not image:
+                            return image_gen_service.fallback_url(description), ""
+                        srcset = image_variant_service.srcset(image["variants"], image["url"], image_gen_service.image_width)
+                        return image["url"], srcset
+
+                    # 所有占位符并发提交，相同描述由配图缓存合并，FLUX 调用数受 IMAGE_GEN_CONCURRENCY 限制
+                    images = await asyncio.gather(
+                        *[render(description) for description in descriptions],
+                        return_exceptions=True
+                    )
+
+                for (full_match, description), image in zip(matches, images):
+                    if isinstance(image, BaseException):
+                        logger.error(f"配图生成失败: {str(image)}")
+                        # 失败时保留原占位符
+                        continue
+                    image_url, srcset = image
+
+                    # 构建 img 标签 (loading="lazy": 读者没有滚动到的配图不会被请求；srcset 按显示宽度选择 WebP 版本)
+                    responsive = f' srcset="{srcset}" sizes="{ARTICLE_IMAGE_SIZES}"' if srcset else ""
+                    img_tag = (
+                        f'<figure class="mb-6">'
+                        f'<img src="{image_url}"{responsive} alt="{description}" loading="lazy" class="w-full h-auto rounded-lg shadow-md object-cover max-h-96" />'
+                        f'<figcaption class="text-center text-sm text-gray-500 mt-2">{description}</figcaption>'
+                        f'</figure>'
+                    )
+
+                    # 替换内容
+                    content = content.replace(full_match, img_tag)
             
             return content
 
         except Exception as e:
             logger.error(f"生成文章失败: {str(e)}", exc_info=True)
-            return f"<div class='p-4 text-red-600'>生成文章失败: {str(e)}</div>"
+            raise ArticleGenerationError(str(e)) from e
         finally:
             if rec_id in self._generation_locks:
                 self._generation_locks.remove(rec_id)
@@ -225,19 +325,20 @@ class RecommenderService:
     ):
         """
         后台批量生成推荐文章
+        只预生成档位允许的前几篇，其余文章在用户打开时由文章接口按需生成
         """
-        logger.info(f"开始后台生成 {len(recommendations)} 篇文章")
+        profile = analysis_profile_service.for_context(context)
+        logger.info(f"开始后台生成 {min(len(recommendations), profile.article_count)}/{len(recommendations)} 篇文章 (档位 {profile.name})")
         
-        for rec in recommendations:
+        for rec in recommendations[:profile.article_count]:
             try:
                 # 生成文章
-                article_html = await self.generate_article(rec, context)
+                article_html = await self.generate_article(rec, context, priority=LLMPriority.BACKGROUND)
                 
                 if article_html:
-                    # 更新数据库
-                    supabase.table("recommendations").update({
-                        "article_html": article_html
-                    }).eq("id", rec["id"]).execute()
+                    # 更新数据库 (同时保存预压缩版本)
+                    await article_store.save(rec["id"], article_html)
+                    response_cache.invalidate(f"recommendation:{rec['id']}")
                     
                     logger.info(f"推荐 {rec['id']} 文章生成完成")
                 
@@ -260,14 +361,16 @@ class RecommenderService:
         search_results: List[Dict[str, Any]],
         analysis_data: Dict[str, Any],
         user_preferences: Optional[Dict[str, Any]],
-        count: int
+        count: int,
+        model: str = "deepseek-ai/DeepSeek-V3"
     ) -> List[Dict[str, Any]]:
         """对搜索结果进行排序和分类"""
         try:
             # 构建提示词
+            candidates = search_results[:15]
             results_text = "\n".join([
                 f"{i+1}. {r['title']}: {r['content'][:200]}"
-                for i, r in enumerate(search_results[:15])
+                for i, r in enumerate(candidates)
             ])
 
             user_pref_text = ""
@@ -288,17 +391,17 @@ class RecommenderService:
 {results_text}
 
 请从以上搜索结果中选择最相关的 {count} 个，并为每个结果分配类型和评分。
-返回 JSON 格式的列表，每项包含:
+返回 JSON 对象 {{"items": [...]}}，items 的每项包含:
 - index: 原始结果的序号 (1-based)
 - tile_type: 类型 (knowledge/product/location/tutorial/news/community)
 - relevance_score: 相关性评分 (0.0-1.0)
 - why: 推荐理由（一句话）
 
-请直接返回 JSON 数组，不要包含额外文字。"""
+请直接返回 JSON，不要包含额外文字。"""
 
             # 调用 AI 进行评分
             payload = {
-                "model": "deepseek-ai/DeepSeek-V3",
+                "model": model,
                 "messages": [
                     {"role": "system", "content": "你是推荐系统专家，擅长根据用户兴趣筛选内容。"},
                     {"role": "user", "content": prompt}
@@ -307,77 +410,54 @@ class RecommenderService:
                 "max_tokens": 2000
             }
 
-            import httpx
-            async with httpx.AsyncClient(timeout=60.0, trust_env=False) as client:
-                response = await client.post(
-                    f"{deepseek_service.base_url}/chat/completions",
-                    json=payload,
-                    headers=deepseek_service.headers
-                )
-                response.raise_for_status()
-                result = response.json()
-
-            content = result["choices"][0]["message"]["content"]
-
-            # 解析 AI 返回的排序结果
-            import json
-            try:
-                # Find the start and end of the JSON object
-                start_index = content.find('[')
-                if start_index == -1:
-                    start_index = content.find('{')
-                end_index = content.rfind(']')
-                if end_index == -1:
-                    end_index = content.rfind('}')
-                
-                if start_index != -1 and end_index != -1:
-                    json_str = content[start_index:end_index+1]
-                    rankings = json.loads(json_str)
-                else:
-                    raise json.JSONDecodeError("No JSON object found", content, 0)
-            except json.JSONDecodeError:
-                # 如果解析失败，使用默认排序
-                logger.warning(f"AI 返回结果解析失败，使用默认排序. Content: {content}")
-                rankings = [
-                    {"index": i+1, "tile_type": "knowledge", "relevance_score": 0.7, "why": "相关内容"}
-                    for i in range(min(count, len(search_results)))
-                ]
+            # 结构化输出: 序号越界和重复的项在校验时丢弃，修复重试后仍失败时走下方的默认排序
+            ranking = await chat_structured(
+                payload,
+                RankingResult,
+                label="rank_and_classify",
+                timeout=60.0,
+                context={"result_count": len(candidates)}
+            )
 
             # 构建最终推荐列表
             recommendations = []
-            for rank in rankings[:count]:
-                idx = rank.get("index", 1) - 1
-                if 0 <= idx < len(search_results):
-                    original = search_results[idx]
-                    recommendations.append({
-                        "title": original["title"],
-                        "description": original["content"][:300],
-                        "url": original["url"],
-                        "image_url": None,  # 可以后续增加图片抓取
-                        "source": original["source"],
-                        "relevance_score": rank.get("relevance_score", 0.5),
-                        "tile_type": rank.get("tile_type", "knowledge"),
-                        "display_order": len(recommendations)
-                    })
+            for rank in ranking.items[:count]:
+                original = search_results[rank.index - 1]
+                recommendations.append({
+                    "title": original["title"],
+                    "description": original["content"][:300],
+                    "url": original["url"],
+                    "image_url": None,  # 可以后续增加图片抓取
+                    "source": original["source"],
+                    "relevance_score": rank.relevance_score,
+                    "tile_type": rank.tile_type,
+                    "display_order": len(recommendations)
+                })
 
             return recommendations
 
+        except StructuredOutputError as e:
+            logger.warning(f"排序结果无法解析，按搜索得分顺序返回: {str(e)}")
+            return self._rank_by_search_order(search_results, count)
         except Exception as e:
             logger.error(f"排序和分类失败: {str(e)}", exc_info=True)
-            # 返回简化版推荐
-            return [
-                {
-                    "title": r["title"],
-                    "description": r["content"][:300],
-                    "url": r["url"],
-                    "image_url": None,
-                    "source": r["source"],
-                    "relevance_score": r.get("score", 0.5),
-                    "tile_type": "knowledge",
-                    "display_order": i
-                }
-                for i, r in enumerate(search_results[:count])
-            ]
+            return self._rank_by_search_order(search_results, count)
+
+    def _rank_by_search_order(self, search_results: List[Dict[str, Any]], count: int) -> List[Dict[str, Any]]:
+        """简化版推荐: 保持搜索结果顺序"""
+        return [
+            {
+                "title": r["title"],
+                "description": r["content"][:300],
+                "url": r["url"],
+                "image_url": None,
+                "source": r["source"],
+                "relevance_score": r.get("score", 0.5),
+                "tile_type": "knowledge",
+                "display_order": i
+            }
+            for i, r in enumerate(search_results[:count])
+        ]
 
     def _generate_fallback_recommendations(self, analysis_data: Dict[str, Any]) -> List[Dict[str, Any]]:
         """生成备用推荐（当搜索失败时）"""
@@ -398,4 +478,4 @@ class RecommenderService:
 
 
 # 创建全局实例
-recommender_service = RecommenderService()
+recommender_service = lazy_service(RecommenderService, "recommender_service")
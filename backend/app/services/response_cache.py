@@ -0,0 +1,186 @@
+"""
+读接口响应缓存
+分析详情、推荐列表和文章在生成完成后基本不变，按 (用户, 资源) 在进程内缓存序列化后的响应体和强 ETag:
+- 命中时不查询数据库、不重新序列化；请求带有匹配的 If-None-Match 时直接返回 304，不发送响应体
+- 条目带有标签 (analysis:{id} / recommendation:{id} / upload:{id})，反馈、重新生成和删除时按标签失效
+- 缓存只在当前进程内有效，多个 worker 时其他进程的条目最多在 RESPONSE_CACHE_TTL_SECONDS 后过期
+- 条目可以带有预压缩的响应体 (文章)，按 Accept-Encoding 直接返回并设置 Content-Encoding，GZipMiddleware 不会再压缩
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Set, Tuple
+from fastapi import Request, Response
+from pydantic import BaseModel
+from app.config import settings
+from app.services.container import lazy_service
+from app.services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE = registry.counter(
+    "mosaic_response_cache_total",
+    "Cached read endpoint responses by endpoint and outcome (hit / not_modified / miss / bypass)",
+    ("endpoint", "outcome")
+)
+
+# 浏览器可以保存响应，但每次使用前都要用 If-None-Match 重新验证
+CACHE_CONTROL = "private, no-cache"
+# 多种预压缩版本都可接受时的优先顺序
+ENCODING_PREFERENCE = ("br", "gzip")
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    tags: Tuple[str, ...]
+    expires_at: float
+    encoded: Dict[str, bytes] = field(default_factory=dict)  # 预压缩的响应体 {编码: 字节}
+
+
+def make_etag(body: bytes) -> str:
+    """响应体内容哈希作为强 ETag"""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    # 304 比较使用弱比较: 忽略 W/ 前缀 (中间代理可能把强 ETag 改为弱 ETag)
+    return "*" in candidates or etag in (value[2:] if value.startswith("W/") else value for value in candidates)
+
+
+def negotiate_encoding(accept_encoding: Optional[str], available: Iterable[str]) -> Optional[str]:
+    """在客户端接受 (q > 0) 的编码中按 ENCODING_PREFERENCE 选择一个预压缩版本，没有时返回 None"""
+    accepted = set()
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    available = set(available)
+    for encoding in ENCODING_PREFERENCE:
+        if encoding in available and (encoding in accepted or "*" in accepted):
+            return encoding
+    return None
+
+
+class ResponseCache:
+    def __init__(self):
+        self.enabled = settings.RESPONSE_CACHE_ENABLED
+        self.max_entries = settings.RESPONSE_CACHE_MAX_ENTRIES
+        self.ttl_seconds = settings.RESPONSE_CACHE_TTL_SECONDS
+        self._entries: "OrderedDict[Tuple[str, str], CachedResponse]" = OrderedDict()
+        self._tags: Dict[str, Set[Tuple[str, str]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, key: str) -> Optional[CachedResponse]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is None:
+                return None
+            if entry.expires_at < time.monotonic():
+                self._remove((user_id, key))
+                return None
+            self._entries.move_to_end((user_id, key))
+            return entry
+
+    def put(self, user_id: str, key: str, model: BaseModel, tags: Iterable[str], store: bool = True) -> CachedResponse:
+        """
+        序列化响应模型并计算 ETag
+
+        Args:
+            tags: 失效标签
+            store: 是否写入缓存 (未完成的资源只计算 ETag，不缓存)
+        """
+        body = model.model_dump_json().encode("utf-8")
+        return self.put_entry(user_id, key, self.make_entry(body, tags), store=store)
+
+    def make_entry(
+        self,
+        body: bytes,
+        tags: Iterable[str],
+        encoded: Optional[Dict[str, bytes]] = None,
+        etag: Optional[str] = None
+    ) -> CachedResponse:
+        """由已序列化 (以及已压缩) 的响应体构造条目，etag 为空时按响应体计算"""
+        return CachedResponse(
+            body, etag or make_etag(body), tuple(tags), time.monotonic() + self.ttl_seconds, encoded or {}
+        )
+
+    def put_entry(self, user_id: str, key: str, entry: CachedResponse, store: bool = True) -> CachedResponse:
+        if not (self.enabled and store):
+            return entry
+        with self._lock:
+            cache_key = (user_id, key)
+            self._remove(cache_key)
+            self._entries[cache_key] = entry
+            for tag in entry.tags:
+                self._tags.setdefault(tag, set()).add(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    def invalidate(self, *tags: str) -> int:
+        """删除带有任一标签的条目，返回删除数量"""
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for cache_key in list(self._tags.get(tag, ())):
+                    self._remove(cache_key)
+                    removed += 1
+        if removed:
+            logger.debug(f"响应缓存失效 {tags}: {removed} 条")
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "tags": len(self._tags)}
+
+    def _remove(self, cache_key: Tuple[str, str]):
+        entry = self._entries.pop(cache_key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(cache_key)
+                if not keys:
+                    del self._tags[tag]
+
+    @staticmethod
+    def respond(request: Request, entry: CachedResponse, endpoint: str, outcome: str) -> Response:
+        """If-None-Match 匹配时返回 304，否则返回缓存的响应体 (客户端接受时返回预压缩版本)"""
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"), entry.encoded)
+        # 不同编码是不同的表示，强 ETag 需要区分
+        etag = f'{entry.etag[:-1]}-{encoding}"' if encoding else entry.etag
+        headers = {
+            "ETag": etag,
+            "Cache-Control": CACHE_CONTROL,
+            "Vary": "Authorization, Accept-Encoding" if entry.encoded else "Authorization"
+        }
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            RESPONSE_CACHE.inc(endpoint=endpoint, outcome="not_modified")
+            return Response(status_code=304, headers=headers)
+        RESPONSE_CACHE.inc(endpoint=endpoint, outcome=outcome)
+        if encoding:
+            # 已设置 Content-Encoding 的响应 GZipMiddleware 直接透传
+            headers["Content-Encoding"] = encoding
+            return Response(content=entry.encoded[encoding], media_type="application/json", headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+# 创建全局实例
+response_cache = lazy_service(ResponseCache, "response_cache")
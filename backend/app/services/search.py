@@ -1,40 +1,345 @@
 """
 搜索服务
 支持 Tavily AI 和 Serper.dev 双搜索引擎
+多引擎路由: 健康追踪、熔断、自动故障转移和对冲请求
+批量分析时同一作用域内的重复查询只搜索一次
 """
 import httpx
+import asyncio
+import contextvars
 import logging
-from typing import List, Dict, Any
+import re
+import time
+from collections import deque
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Tuple
 from app.config import settings
+from app.services.metrics import observe_upstream
+from app.services.container import lazy_service
 
 logger = logging.getLogger(__name__)
 
+# 延迟直方图的桶边界 (秒)
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+
+# 计算 p95 所需的最少样本数
+MIN_SAMPLES_FOR_P95 = 20
+
+# 当前批量任务的共享查询作用域
+_shared_scope: contextvars.ContextVar[Optional["SharedSearchScope"]] = contextvars.ContextVar(
+    "shared_search_scope", default=None
+)
+
+
+class SharedSearchScope:
+    """
+    批量任务内的查询合并
+    规范化后相同的查询 (忽略大小写和多余空白) 只执行一次，其余调用等待同一个结果
+    """
+
+    def __init__(self):
+        self._pending: Dict[Tuple[str, int, str], asyncio.Future] = {}
+        self.requested = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return re.sub(r"\s+", " ", query).strip().lower()
+
+    async def run(
+        self,
+        query: str,
+        max_results: int,
+        depth: str,
+        search: Callable[[str, int, str], Awaitable[List[Dict[str, Any]]]]
+    ) -> List[Dict[str, Any]]:
+        self.requested += 1
+        key = (self.normalize(query), max_results, depth)
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(search(query, max_results, depth))
+            self._pending[key] = future
+        # shield: 某个调用方被取消时不影响其他等待者
+        results = await asyncio.shield(future)
+        return list(results)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queries_requested": self.requested,
+            "queries_executed": len(self._pending),
+            "queries_merged": self.requested - len(self._pending)
+        }
+
+
+def start_shared_search_scope() -> SharedSearchScope:
+    """在当前异步任务 (及其子任务) 中开启查询合并，返回作用域以便读取统计"""
+    scope = SharedSearchScope()
+    _shared_scope.set(scope)
+    return scope
+
+
+class ProviderHealth:
+    """
+    单个搜索引擎的健康状态
+    记录延迟分布、连续失败次数，并实现 closed -> open -> half_open 熔断器
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.total_requests = 0
+        self.total_failures = 0
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.recent_latencies = deque(maxlen=200)
+        self._half_open_in_flight = False
+
+    def is_available(self) -> bool:
+        """是否可以参与路由 (不占用半开探测名额)"""
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= settings.SEARCH_CIRCUIT_RESET_SECONDS
+        if self.state == self.HALF_OPEN:
+            return not self._half_open_in_flight
+        return True
+
+    def allow_request(self) -> bool:
+        """熔断器是否允许发起请求，半开状态下会占用唯一的探测名额"""
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at >= settings.SEARCH_CIRCUIT_RESET_SECONDS:
+                self.state = self.HALF_OPEN
+                self._half_open_in_flight = False
+            else:
+                return False
+
+        # 半开状态只放行一个探测请求
+        if self._half_open_in_flight:
+            return False
+        self._half_open_in_flight = True
+        return True
+
+    def record_success(self, latency: float):
+        self.total_requests += 1
+        self._observe(latency)
+        self.recent_latencies.append(latency)
+        self.consecutive_failures = 0
+        if self.state != self.CLOSED:
+            logger.info(f"搜索引擎 {self.name} 恢复正常，熔断器关闭")
+        self.state = self.CLOSED
+        self._half_open_in_flight = False
+
+    def record_failure(self, latency: float):
+        self.total_requests += 1
+        self.total_failures += 1
+        self._observe(latency)
+        self.consecutive_failures += 1
+        self._half_open_in_flight = False
+
+        if self.state == self.HALF_OPEN or (
+            self.state == self.CLOSED
+            and self.consecutive_failures >= settings.SEARCH_CIRCUIT_FAILURE_THRESHOLD
+        ):
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            logger.warning(f"搜索引擎 {self.name} 连续失败 {self.consecutive_failures} 次，熔断器打开")
+
+    def record_cancelled(self):
+        """对冲请求中落败被取消的请求，不计入成功或失败"""
+        self._half_open_in_flight = False
+
+    def p95(self) -> Optional[float]:
+        """最近成功请求的 p95 延迟，样本不足时返回 None"""
+        if len(self.recent_latencies) < MIN_SAMPLES_FOR_P95:
+            return None
+        ordered = sorted(self.recent_latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def _observe(self, latency: float):
+        self.latency_sum += latency
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.bucket_counts[i] += 1
+                return
+        self.bucket_counts[-1] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出健康状态和延迟直方图 (累积桶，Prometheus 风格)"""
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(list(LATENCY_BUCKETS) + ["+Inf"], self.bucket_counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures,
+            "latency_sum": round(self.latency_sum, 4),
+            "latency_buckets": buckets,
+            "p95": self.p95()
+        }
+
 
 class SearchService:
     def __init__(self):
         self.tavily_api_key = settings.TAVILY_API_KEY
         self.serper_api_key = settings.SERPER_API_KEY
         self.provider = settings.SEARCH_PROVIDER
+        self.timeout = settings.SEARCH_TIMEOUT
+        self._providers: Dict[str, Callable[[str, int, str], Awaitable[List[Dict[str, Any]]]]] = {
+            "tavily": self._search_tavily,
+            "serper": self._search_serper
+        }
+        self.health: Dict[str, ProviderHealth] = {
+            name: ProviderHealth(name) for name in self._providers
+        }
 
-    async def search(self, query: str, max_results: int = 10) -> List[Dict[str, Any]]:
+    async def search(self, query: str, max_results: int = 10, depth: str = "advanced") -> List[Dict[str, Any]]:
         """
         搜索内容
 
+        按优先级依次尝试已配置的搜索引擎，跳过熔断中的引擎；
+        开启对冲时，主引擎超过其 p95 仍未返回则并发请求备用引擎，取先返回的结果
+
         Args:
             query: 搜索关键词
             max_results: 最大结果数量
+            depth: 搜索深度 basic / advanced (只对 Tavily 生效)
 
         Returns:
             搜索结果列表
         """
-        if self.provider == "tavily":
-            return await self._search_tavily(query, max_results)
-        elif self.provider == "serper":
-            return await self._search_serper(query, max_results)
-        else:
+        scope = _shared_scope.get()
+        if scope is not None:
+            return await scope.run(query, max_results, depth, self._search)
+        return await self._search(query, max_results, depth)
+
+    async def _search(self, query: str, max_results: int, depth: str) -> List[Dict[str, Any]]:
+        if self.provider not in self._providers:
             raise ValueError(f"不支持的搜索引擎: {self.provider}")
 
-    async def _search_tavily(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        candidates = self._candidate_providers()
+        if not candidates:
+            raise Exception("所有搜索引擎均处于熔断状态")
+
+        if settings.SEARCH_HEDGE_ENABLED and len(candidates) > 1:
+            return await self._search_hedged(candidates, query, max_results, depth)
+
+        errors = []
+        for name in candidates:
+            try:
+                return await self._call_provider(name, query, max_results, depth)
+            except Exception as e:
+                errors.append(f"{name}: {str(e)}")
+                logger.warning(f"搜索引擎 {name} 失败，尝试下一个: {str(e)}")
+
+        raise Exception(f"所有搜索引擎均失败: {'; '.join(errors)}")
+
+    def get_provider_stats(self) -> Dict[str, Any]:
+        """各搜索引擎的健康状态和延迟直方图，用于调优对冲和熔断参数"""
+        return {
+            "primary": self.provider,
+            "hedge_enabled": settings.SEARCH_HEDGE_ENABLED,
+            "failover_enabled": settings.SEARCH_FAILOVER_ENABLED,
+            "providers": {
+                name: {"configured": self._is_configured(name), **health.snapshot()}
+                for name, health in self.health.items()
+            }
+        }
+
+    def _is_configured(self, name: str) -> bool:
+        if name == "tavily":
+            return bool(self.tavily_api_key)
+        if name == "serper":
+            return bool(self.serper_api_key)
+        return False
+
+    def _candidate_providers(self) -> List[str]:
+        """按优先级返回当前可用的搜索引擎 (主引擎优先)"""
+        ordered = [self.provider]
+        if settings.SEARCH_FAILOVER_ENABLED:
+            ordered += [
+                name for name in self._providers
+                if name != self.provider and self._is_configured(name)
+            ]
+
+        return [name for name in ordered if self.health[name].is_available()]
+
+    async def _call_provider(self, name: str, query: str, max_results: int, depth: str) -> List[Dict[str, Any]]:
+        """调用单个搜索引擎并记录健康状态"""
+        health = self.health[name]
+        if not health.allow_request():
+            raise Exception(f"搜索引擎 {name} 处于熔断状态")
+
+        start = time.monotonic()
+        try:
+            results = await self._providers[name](query, max_results, depth)
+        except asyncio.CancelledError:
+            health.record_cancelled()
+            observe_upstream(name, "search", time.monotonic() - start, "cancelled")
+            raise
+        except Exception:
+            health.record_failure(time.monotonic() - start)
+            observe_upstream(name, "search", time.monotonic() - start, "error")
+            raise
+
+        health.record_success(time.monotonic() - start)
+        observe_upstream(name, "search", time.monotonic() - start, "ok")
+        return results
+
+    async def _search_hedged(self, candidates: List[str], query: str, max_results: int, depth: str) -> List[Dict[str, Any]]:
+        """对冲请求: 主引擎超过 p95 未返回时启动下一个引擎，取最先成功的结果"""
+        pending = {}
+        errors = []
+        remaining = list(candidates)
+
+        def launch():
+            name = remaining.pop(0)
+            task = asyncio.create_task(self._call_provider(name, query, max_results, depth))
+            pending[task] = name
+            return name
+
+        try:
+            while pending or remaining:
+                if not pending:
+                    launch()
+
+                # 等待当前最新启动的引擎的 p95，超时则对冲下一个
+                current = list(pending.values())[-1]
+                delay = self.health[current].p95() or settings.SEARCH_HEDGE_DEFAULT_DELAY
+                done, _ = await asyncio.wait(
+                    pending.keys(),
+                    timeout=delay if remaining else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    hedged = launch()
+                    logger.info(f"搜索引擎 {current} 超过 {delay:.2f}s 未返回，对冲请求 {hedged}")
+                    continue
+
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        if name != candidates[0]:
+                            logger.info(f"对冲/备用搜索引擎 {name} 先返回结果")
+                        return task.result()
+                    errors.append(f"{name}: {str(task.exception())}")
+                    logger.warning(f"搜索引擎 {name} 失败: {str(task.exception())}")
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise Exception(f"所有搜索引擎均失败: {'; '.join(errors)}")
+
+    async def _search_tavily(self, query: str, max_results: int, depth: str = "advanced") -> List[Dict[str, Any]]:
         """使用 Tavily AI 搜索"""
         try:
             if not self.tavily_api_key:
@@ -45,13 +350,13 @@ class SearchService:
             payload = {
                 "api_key": self.tavily_api_key,
                 "query": query,
-                "search_depth": "advanced",  # basic 或 advanced
+                "search_depth": depth,  # basic 或 advanced
                 "max_results": max_results,
                 "include_answer": True,
                 "include_raw_content": False
             }
 
-            async with httpx.AsyncClient(timeout=60.0, trust_env=False) as client:
+            async with httpx.AsyncClient(timeout=self.timeout, trust_env=False) as client:
                 response = await client.post(
                     "https://api.tavily.com/search",
                     json=payload
@@ -77,8 +382,8 @@ class SearchService:
             logger.error(f"Tavily 搜索失败: {str(e)}", exc_info=True)
             raise Exception(f"Tavily 搜索失败: {str(e)}")
 
-    async def _search_serper(self, query: str, max_results: int) -> List[Dict[str, Any]]:
-        """使用 Serper.dev 搜索"""
+    async def _search_serper(self, query: str, max_results: int, depth: str = "advanced") -> List[Dict[str, Any]]:
+        """使用 Serper.dev 搜索 (没有搜索深度参数，忽略 depth)"""
         try:
             if not self.serper_api_key:
                 raise ValueError("Serper API Key 未配置")
@@ -95,7 +400,7 @@ class SearchService:
                 "num": max_results
             }
 
-            async with httpx.AsyncClient(timeout=60.0, trust_env=False) as client:
+            async with httpx.AsyncClient(timeout=self.timeout, trust_env=False) as client:
                 response = await client.post(
                     "https://google.serper.dev/search",
                     json=payload,
@@ -124,4 +429,4 @@ class SearchService:
 
 
 # 创建全局实例
-search_service = SearchService()
+search_service = lazy_service(SearchService, "search_service")
@@ -0,0 +1,257 @@
+"""
+结构化输出
+- 支持 JSON 模式的模型请求时附带 response_format={"type": "json_object"}
+- 容错解析: 去掉代码块标记和前后说明文字，修复尾随逗号、字符串中的裸换行和被截断的数组 / 对象
+- 用 Pydantic 模型校验结果，失败时用一次低成本的修复调用 (只发送原始输出和 Schema) 重试
+"""
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple, Type, TypeVar
+from pydantic import BaseModel, ValidationError
+from app.config import settings
+from app.services.llm_cache import llm_cache
+from app.services.llm_gateway import llm_gateway, LLMPriority
+from app.services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+
+FENCE_PATTERN = re.compile(r"```[a-zA-Z]*[ \t]*\n?(.*?)(?:```|$)", re.DOTALL)
+# 截断修复时最多回退的安全点数量
+MAX_TRUNCATION_BACKTRACK = 32
+# 修复调用中附带的原始输出长度上限 (字符)
+REPAIR_CONTENT_CHARS = 6000
+
+STRUCTURED_OUTPUT = registry.counter(
+    "mosaic_structured_output_total",
+    "Structured LLM output parses by call label and outcome (ok / repaired / failed / cached)",
+    ("label", "outcome")
+)
+
+
+class JSONExtractError(ValueError):
+    """模型输出中找不到可解析的 JSON"""
+
+
+class StructuredOutputError(Exception):
+    """修复重试后仍无法得到符合 Schema 的结果"""
+
+
+def _strip_trailing_comma(out: List[str]):
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ",":
+        del out[i:]
+
+
+def _closers(stack: List[str]) -> str:
+    return "".join(reversed(stack))
+
+
+def _scan(text: str, start: int) -> Tuple[str, List[str], List[Tuple[int, List[str]]], bool]:
+    """
+    从 start 开始单遍扫描一个 JSON 值，沿途修复尾随逗号和字符串中的裸换行
+
+    Returns:
+        (修复后的文本, 未闭合的括号栈, 截断时可回退的安全点 [(文本长度, 括号栈)], 是否完整闭合)
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    safe_points: List[Tuple[int, List[str]]] = []
+    in_string = False
+    escape = False
+
+    for ch in text[start:]:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            elif ch == "\n":
+                ch = "\\n"
+            elif ch == "\r":
+                continue
+            out.append(ch)
+            continue
+
+        if ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+            safe_points.append((len(out), list(stack)))
+        elif ch in "}]":
+            if not stack:
+                break
+            _strip_trailing_comma(out)
+            # 括号不匹配时按栈顶补正
+            out.append(stack.pop())
+            if not stack:
+                return "".join(out), stack, safe_points, True
+        elif ch == ",":
+            # 逗号之前的内容是完整的元素
+            safe_points.append((len(out), list(stack)))
+            out.append(ch)
+        else:
+            out.append(ch)
+
+    # 截断在字符串中间时不补引号，由调用方回退到上一个完整元素，避免保留半截的值
+    return "".join(out), stack, safe_points, False
+
+
+def extract_json(text: str) -> Any:
+    """
+    从模型输出中提取 JSON 值
+
+    依次尝试代码块内容和完整文本；截断的输出先直接补全括号，
+    仍无法解析时回退到最近一个完整的元素
+    """
+    if not text or not text.strip():
+        raise JSONExtractError("模型输出为空")
+
+    candidates = []
+    fenced = FENCE_PATTERN.search(text)
+    if fenced and fenced.group(1).strip():
+        candidates.append(fenced.group(1))
+    candidates.append(text)
+
+    last_error: Optional[Exception] = None
+    for candidate in candidates:
+        starts = [i for i in (candidate.find("{"), candidate.find("[")) if i != -1]
+        if not starts:
+            continue
+        repaired, stack, safe_points, complete = _scan(candidate, min(starts))
+        attempts = [(repaired, stack)]
+        if not complete:
+            attempts += [(repaired[:length], points_stack)
+                         for length, points_stack in reversed(safe_points[-MAX_TRUNCATION_BACKTRACK:])]
+        for prefix, open_brackets in attempts:
+            out = list(prefix)
+            _strip_trailing_comma(out)
+            try:
+                return json.loads("".join(out) + _closers(open_brackets))
+            except json.JSONDecodeError as e:
+                last_error = e
+
+    if last_error is None:
+        raise JSONExtractError("模型输出中没有 JSON 对象或数组")
+    raise JSONExtractError(f"无法从模型输出中解析 JSON: {last_error}")
+
+
+def parse_structured(content: str, schema: Type[T], context: Optional[Dict[str, Any]] = None) -> T:
+    """容错解析并按 Schema 校验，失败时抛出 JSONExtractError / ValidationError"""
+    return schema.model_validate(extract_json(content), context=context)
+
+
+def with_json_mode(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """模型支持 JSON 模式时附带 response_format"""
+    if payload.get("model") in settings.LLM_JSON_MODE_MODELS and "response_format" not in payload:
+        return {**payload, "response_format": {"type": "json_object"}}
+    return payload
+
+
+def _describe_error(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(p) for p in item['loc']) or '(root)'}: {item['msg']}"
+            for item in error.errors()[:10]
+        )
+    return str(error)
+
+
+async def chat_structured(
+    payload: Dict[str, Any],
+    schema: Type[T],
+    label: str,
+    priority: LLMPriority = LLMPriority.INTERACTIVE,
+    timeout: float = 120.0,
+    use_cache: bool = False,
+    bypass_cache: bool = False,
+    context: Optional[Dict[str, Any]] = None
+) -> T:
+    """
+    调用模型并返回校验后的结构化结果
+
+    Args:
+        payload: chat/completions 请求体 (提示词中应说明 JSON 格式)
+        schema: 结果的 Pydantic 模型
+        label: 调用名称，用于日志、指标和缓存记录
+        use_cache: 是否使用响应缓存 (只缓存校验通过的输出)
+        bypass_cache: 是否跳过响应缓存
+        context: 传给 Pydantic 校验器的上下文 (如结果序号的合法范围)
+
+    Raises:
+        StructuredOutputError: 修复重试后仍不符合 Schema
+    """
+    request = with_json_mode(payload)
+
+    if use_cache:
+        cached = await llm_cache.get(request, label, bypass=bypass_cache)
+        if cached is not None:
+            try:
+                result = parse_structured(cached, schema, context)
+                STRUCTURED_OUTPUT.inc(label=label, outcome="cached")
+                return result
+            except (JSONExtractError, ValidationError):
+                logger.warning(f"[{label}] 缓存的输出不符合 Schema，重新调用模型")
+
+    content = await llm_gateway.chat_content(request, priority=priority, timeout=timeout, label=label)
+    try:
+        result = parse_structured(content, schema, context)
+        outcome = "ok"
+    except (JSONExtractError, ValidationError) as e:
+        logger.warning(f"[{label}] 结构化输出解析失败，尝试修复: {_describe_error(e)}")
+        content = await _repair(request, content, e, schema, label, priority, timeout)
+        try:
+            result = parse_structured(content, schema, context)
+        except (JSONExtractError, ValidationError) as repair_error:
+            STRUCTURED_OUTPUT.inc(label=label, outcome="failed")
+            raise StructuredOutputError(f"[{label}] 修复后仍无法解析: {_describe_error(repair_error)}")
+        outcome = "repaired"
+
+    STRUCTURED_OUTPUT.inc(label=label, outcome=outcome)
+    if use_cache:
+        await llm_cache.set(request, content, bypass=bypass_cache)
+    return result
+
+
+async def _repair(
+    request: Dict[str, Any],
+    content: str,
+    error: Exception,
+    schema: Type[BaseModel],
+    label: str,
+    priority: LLMPriority,
+    timeout: float
+) -> str:
+    """只发送原始输出、错误和 Schema，不重复发送原始提示词"""
+    schema_text = json.dumps(schema.model_json_schema(), ensure_ascii=False, separators=(",", ":"))
+    repair_payload = with_json_mode({
+        "model": request.get("model"),
+        "messages": [
+            {"role": "system", "content": "你是 JSON 修复工具，只输出符合给定 Schema 的 JSON，不输出任何其他文字。"},
+            {
+                "role": "user",
+                "content": f"""下面的模型输出无法解析或不符合格式要求。
+
+错误: {_describe_error(error)}
+
+JSON Schema:
+{schema_text}
+
+原始输出:
+{content[:REPAIR_CONTENT_CHARS]}
+
+请返回修正后的 JSON。"""
+            }
+        ],
+        "temperature": 0,
+        "max_tokens": request.get("max_tokens", 2000)
+    })
+    return await llm_gateway.chat_content(repair_payload, priority=priority, timeout=timeout, label=f"{label}_repair")
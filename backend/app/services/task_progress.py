@@ -0,0 +1,138 @@
+"""
+任务进度上报
+在内存中维护 async_tasks 行的状态，只写入发生变化的列；
+进度更新在最小间隔内合并为一次写入，状态切换和终态 (completed / failed) 总是立即写入
+
+result_data 是整列替换的 JSONB，进行中只写入轮询页面需要的轻量字段 (progress_keys)，
+完整的中间结果由调用方另行保存 (例如 analyses.full_context)
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+from app.config import settings
+from app.database import supabase
+from app.services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+TASK_PROGRESS_WRITES = registry.counter(
+    "mosaic_task_progress_writes_total",
+    "Task progress updates by outcome (written / coalesced / skipped)",
+    ("outcome",)
+)
+
+
+class TaskProgressReporter:
+    def __init__(
+        self,
+        task_id: str,
+        result: Optional[Dict[str, Any]] = None,
+        progress_keys: Optional[Tuple[str, ...]] = None,
+        min_interval: Optional[float] = None
+    ):
+        """
+        Args:
+            task_id: async_tasks 行 ID
+            result: 任务的中间结果 (调用方持续修改，上报时按 progress_keys 取子集)
+            progress_keys: 进行中写入 result_data 的字段，None 表示全部字段
+            min_interval: 两次进度写入的最小间隔 (秒)
+        """
+        self.task_id = task_id
+        self.result = result if result is not None else {}
+        self.progress_keys = progress_keys
+        self.min_interval = settings.TASK_PROGRESS_MIN_INTERVAL if min_interval is None else min_interval
+
+        self._columns: Dict[str, Any] = {}  # 内存中的最新列值
+        self._sent: Dict[str, Any] = {}  # 最近一次写入的列值 (result_data 为序列化后的字符串)
+        self._last_write = float("-inf")
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.writes = 0
+        self.bytes_written = 0
+
+    def update(self, progress: Optional[int] = None, step_message: Optional[str] = None,
+               status: Optional[str] = None, **columns: Any):
+        """更新内存状态；距上次写入不足最小间隔时推迟到间隔结束后合并写入"""
+        if step_message is not None:
+            self.result["step_message"] = step_message
+        if progress is not None:
+            self._columns["progress"] = progress
+        if status is not None:
+            self._columns["status"] = status
+        self._columns.update(columns)
+
+        status_changed = status is not None and status != self._sent.get("status")
+        wait = self._last_write + self.min_interval - time.monotonic()
+        if status_changed or wait <= 0:
+            self._flush_quietly()
+            return
+
+        TASK_PROGRESS_WRITES.inc(outcome="coalesced")
+        if self._timer is None:
+            try:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._flush_quietly)
+            except RuntimeError:
+                self._flush_quietly()
+
+    def finish(self, status: str, result_keys: Optional[Tuple[str, ...]] = None, **columns: Any) -> bool:
+        """
+        写入终态，取消待合并的写入并立即写入 (失败时抛出异常)
+
+        Args:
+            status: completed / failed
+            result_keys: 终态写入 result_data 的字段，默认与 progress_keys 相同
+        """
+        self._columns["status"] = status
+        self._columns.update(columns)
+        return self.flush(result_keys)
+
+    def flush(self, result_keys: Optional[Tuple[str, ...]] = None) -> bool:
+        """立即写入所有变化的列，没有变化时不发请求"""
+        self._cancel_timer()
+        changes, encoded = self._changes(result_keys if result_keys is not None else self.progress_keys)
+        if not changes:
+            TASK_PROGRESS_WRITES.inc(outcome="skipped")
+            return False
+
+        changes["updated_at"] = datetime.utcnow().isoformat()
+        supabase.table("async_tasks").update(changes).eq("id", self.task_id).execute()
+
+        for key, value in changes.items():
+            self._sent[key] = encoded if key == "result_data" else value
+        self._last_write = time.monotonic()
+        self.writes += 1
+        self.bytes_written += len(json.dumps(changes, ensure_ascii=False, default=str).encode("utf-8"))
+        TASK_PROGRESS_WRITES.inc(outcome="written")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"writes": self.writes, "bytes_written": self.bytes_written}
+
+    def _changes(self, result_keys: Optional[Tuple[str, ...]]) -> Tuple[Dict[str, Any], Optional[str]]:
+        changes = {key: value for key, value in self._columns.items() if self._sent.get(key) != value}
+
+        if result_keys is None:
+            view = dict(self.result)
+        else:
+            view = {key: self.result[key] for key in result_keys if key in self.result}
+        encoded = None
+        if view or "result_data" in self._sent:
+            encoded = json.dumps(view, sort_keys=True, ensure_ascii=False, default=str)
+            if encoded != self._sent.get("result_data"):
+                changes["result_data"] = view
+        return changes, encoded
+
+    def _flush_quietly(self):
+        """进行中的进度写入失败不影响任务本身，下次写入时会重新发送"""
+        self._timer = None
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning(f"更新任务 {self.task_id} 进度失败: {str(e)}")
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
@@ -0,0 +1,187 @@
+"""
+流式上传处理
+边接收 multipart 数据块边计算哈希、检查大小并写入临时文件，
+超过大小上限立即中止，整个文件不会同时驻留在内存中
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Optional
+from fastapi import Request
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    import multipart
+    from multipart.multipart import parse_options_header
+
+logger = logging.getLogger(__name__)
+
+# multipart 边界和表单头部的额外开销上限
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadRejectedError(Exception):
+    """上传内容不合法 (格式错误、缺少文件、类型不支持)"""
+
+
+class UploadTooLargeError(UploadRejectedError):
+    """上传文件超过大小上限"""
+
+
+class SpooledUpload:
+    """已落盘到临时文件的上传内容"""
+
+    def __init__(self, path: str, size: int, sha256: str, filename: str, content_type: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.filename = filename
+        self.content_type = content_type
+
+    def read_bytes(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def cleanup(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def receive_file_upload(
+    request: Request,
+    max_bytes: int,
+    field_name: str = "file",
+    content_type_prefix: str = "image/"
+) -> SpooledUpload:
+    """
+    流式解析 multipart 请求体中的文件字段
+
+    Args:
+        request: 原始请求
+        max_bytes: 文件大小上限
+        field_name: 表单中的文件字段名
+        content_type_prefix: 允许的文件 MIME 前缀
+
+    Returns:
+        落盘后的上传文件
+
+    Raises:
+        UploadTooLargeError: 文件超过上限
+        UploadRejectedError: 请求格式或文件类型不合法
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadRejectedError("请求必须是 multipart/form-data")
+
+    # Content-Length 已经超限时无需读取请求体
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+            raise UploadTooLargeError(f"文件过大（最大 {max_bytes // (1024 * 1024)}MB）")
+
+    state = {
+        "header_field": b"",
+        "header_value": b"",
+        "headers": {},
+        "file": None,
+        "writer": None,
+        "size": 0,
+        "filename": None,
+        "content_type": None,
+        "done": False
+    }
+    hasher = hashlib.sha256()
+
+    def on_part_begin():
+        state["headers"] = {}
+
+    def on_header_field(data: bytes, start: int, end: int):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        filename = disposition.get(b"filename")
+        if name != field_name or filename is None or state["done"]:
+            return
+
+        part_type = state["headers"].get(b"content-type", b"").decode("latin-1")
+        if not part_type.startswith(content_type_prefix):
+            raise UploadRejectedError("只支持图片文件")
+
+        state["filename"] = filename.decode("utf-8", "replace")
+        state["content_type"] = part_type
+        state["file"] = tempfile.NamedTemporaryFile(prefix="mosaic-upload-", delete=False)
+        state["writer"] = state["file"]
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if state["writer"] is None:
+            return
+        chunk = data[start:end]
+        state["size"] += len(chunk)
+        if state["size"] > max_bytes:
+            raise UploadTooLargeError(f"文件过大（最大 {max_bytes // (1024 * 1024)}MB）")
+        hasher.update(chunk)
+        state["writer"].write(chunk)
+
+    def on_part_end():
+        if state["writer"] is not None:
+            state["writer"].close()
+            state["writer"] = None
+            state["done"] = True
+
+    parser = multipart.MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end
+    })
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    except UploadRejectedError:
+        _discard(state["file"])
+        raise
+    except Exception as e:
+        _discard(state["file"])
+        raise UploadRejectedError(f"解析上传内容失败: {str(e)}")
+
+    if not state["done"]:
+        _discard(state["file"])
+        raise UploadRejectedError("未找到上传文件")
+
+    return SpooledUpload(
+        path=state["file"].name,
+        size=state["size"],
+        sha256=hasher.hexdigest(),
+        filename=state["filename"],
+        content_type=state["content_type"]
+    )
+
+
+def _discard(file: Optional[tempfile._TemporaryFileWrapper]):
+    if file is None:
+        return
+    file.close()
+    try:
+        os.remove(file.name)
+    except FileNotFoundError:
+        pass
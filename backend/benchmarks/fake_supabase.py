@@ -0,0 +1,431 @@
+"""
+本地 Supabase 替身
+实现 supabase Python 客户端用到的 PostgREST、Storage 和 Auth 接口，
+数据保存在内存表中，表结构 (列、默认值、NOT NULL、枚举 CHECK、唯一键) 从 database/schema.sql 解析
+
+用法 (在 backend/ 目录下):
+    python -m uvicorn benchmarks.fake_supabase:app --port 54321
+
+    GET  /__stats  每个表 / 方法的请求数和读写字节数
+    POST /__reset  清空数据和统计
+
+只实现后端实际用到的子集: select 列投影、eq/neq/gt/gte/lt/lte/in/is/like/ilike 过滤、
+order / limit / offset / Range、count=exact、insert / upsert / update / delete 和 return=representation
+"""
+import json
+import re
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+SCHEMA_PATH = Path(__file__).parent.parent / "database" / "schema.sql"
+
+TABLE_PATTERN = re.compile(r"CREATE TABLE IF NOT EXISTS public\.(\w+) \((.*?)\n\);", re.DOTALL)
+COLUMN_PATTERN = re.compile(r"^(\w+)\s+([A-Z][A-Z ]*?(?:\(\d+(?:,\d+)?\))?(?:\[\])?)(?=\s|,|$)(.*)$")
+DEFAULT_PATTERN = re.compile(r"DEFAULT\s+('(?:[^']*)'(?:::\w+)?|[\w.]+(?:\(\))?)", re.IGNORECASE)
+CHECK_IN_PATTERN = re.compile(r"CHECK \((\w+) IN \(([^)]*)\)\)")
+UNIQUE_PATTERN = re.compile(r"UNIQUE\((\w+)\)")
+TABLE_KEYWORDS = ("CONSTRAINT", "PRIMARY", "UNIQUE", "FOREIGN", "CHECK")
+
+
+class Column:
+    def __init__(self, name: str, sql_type: str, rest: str):
+        self.name = name
+        self.sql_type = sql_type.strip()
+        self.not_null = "NOT NULL" in rest or "PRIMARY KEY" in rest
+        self.primary_key = "PRIMARY KEY" in rest
+        self.default = None
+        match = DEFAULT_PATTERN.search(rest)
+        if match:
+            self.default = match.group(1)
+        self.allowed: Optional[List[Optional[str]]] = None
+        check = CHECK_IN_PATTERN.search(rest)
+        if check:
+            self.allowed = [
+                None if v.strip() == "NULL" else v.strip().strip("'")
+                for v in check.group(2).split(",")
+            ]
+
+    def default_value(self) -> Any:
+        if self.default is None:
+            return None
+        value = self.default
+        upper = value.upper()
+        if upper == "GEN_RANDOM_UUID()":
+            return str(uuid.uuid4())
+        if upper == "NOW()":
+            return datetime.now(timezone.utc).isoformat()
+        if value.startswith("'"):
+            literal = value.split("::")[0].strip("'")
+            if literal in ("{}", "[]"):
+                return []
+            return literal
+        if upper in ("TRUE", "FALSE"):
+            return upper == "TRUE"
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+
+
+class Table:
+    def __init__(self, name: str, body: str):
+        self.name = name
+        self.columns: Dict[str, Column] = {}
+        self.unique: List[str] = []
+        for raw_line in body.split("\n"):
+            line = raw_line.split("--")[0].strip().rstrip(",")
+            if not line:
+                continue
+            unique = UNIQUE_PATTERN.match(line)
+            if unique:
+                self.unique.append(unique.group(1))
+                continue
+            if line.split()[0].upper() in TABLE_KEYWORDS:
+                continue
+            match = COLUMN_PATTERN.match(line)
+            if match:
+                column = Column(match.group(1), match.group(2), match.group(3))
+                self.columns[column.name] = column
+                if column.primary_key:
+                    self.unique.insert(0, column.name)
+        self.rows: List[Dict[str, Any]] = []
+
+    def new_row(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        unknown = [key for key in values if key not in self.columns]
+        if unknown:
+            raise PostgrestError(
+                400, "PGRST204", f"Could not find the '{unknown[0]}' column of '{self.name}' in the schema cache"
+            )
+        row = {name: column.default_value() for name, column in self.columns.items()}
+        row.update(values)
+        self.validate(row)
+        return row
+
+    def validate(self, row: Dict[str, Any]):
+        for name, column in self.columns.items():
+            value = row.get(name)
+            if column.not_null and value is None:
+                raise PostgrestError(
+                    400, "23502", f'null value in column "{name}" of relation "{self.name}" violates not-null constraint'
+                )
+            if column.allowed is not None and value not in column.allowed:
+                raise PostgrestError(
+                    400, "23514", f'new row for relation "{self.name}" violates check constraint on "{name}"'
+                )
+
+    def find_conflict(self, row: Dict[str, Any], on_conflict: Optional[str]) -> Optional[Dict[str, Any]]:
+        keys = [on_conflict] if on_conflict else self.unique
+        for key in keys:
+            if row.get(key) is None:
+                continue
+            for existing in self.rows:
+                if existing.get(key) == row[key]:
+                    return existing
+        return None
+
+
+class PostgrestError(Exception):
+    def __init__(self, status: int, code: str, message: str):
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+def load_schema(path: Path = SCHEMA_PATH) -> Dict[str, Table]:
+    sql = path.read_text(encoding="utf-8")
+    return {name: Table(name, body) for name, body in TABLE_PATTERN.findall(sql)}
+
+
+def _coerce(value: Any) -> Any:
+    """比较前把字符串形式的数字转为数字"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _matches(row_value: Any, op: str, operand: str) -> bool:
+    if op == "is":
+        target = {"null": None, "true": True, "false": False}.get(operand.lower(), operand)
+        return row_value is target or row_value == target
+    if row_value is None:
+        return False
+    if op in ("eq", "neq"):
+        if isinstance(row_value, (dict, list)):
+            try:
+                equal = row_value == json.loads(operand)
+            except ValueError:
+                equal = False
+        elif isinstance(row_value, bool):
+            equal = str(row_value).lower() == operand.lower()
+        else:
+            equal = _coerce(row_value) == _coerce(operand)
+        return equal if op == "eq" else not equal
+    if op == "in":
+        values = [v.strip().strip('"') for v in operand.strip("()").split(",")]
+        return any(_coerce(row_value) == _coerce(v) for v in values)
+    if op == "cs":
+        values = [v.strip().strip('"') for v in operand.strip("{}").split(",") if v.strip()]
+        return isinstance(row_value, list) and all(v in row_value for v in values)
+    if op in ("like", "ilike"):
+        pattern = "^" + re.escape(operand).replace(r"\*", ".*").replace("%", ".*") + "$"
+        return re.match(pattern, str(row_value), re.IGNORECASE if op == "ilike" else 0) is not None
+    left, right = _coerce(row_value), _coerce(operand)
+    if type(left) is not type(right):
+        left, right = str(row_value), operand
+    return {"gt": left > right, "gte": left >= right, "lt": left < right, "lte": left <= right}.get(op, True)
+
+
+def _apply_filters(rows: List[Dict[str, Any]], params: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    result = rows
+    for column, expression in params:
+        if column in ("select", "order", "limit", "offset", "on_conflict", "columns"):
+            continue
+        negate = expression.startswith("not.")
+        if negate:
+            expression = expression[4:]
+        op, _, operand = expression.partition(".")
+        result = [r for r in result if _matches(r.get(column), op, operand) != negate]
+    return result
+
+
+def _apply_order(rows: List[Dict[str, Any]], order: Optional[str]) -> List[Dict[str, Any]]:
+    if not order:
+        return rows
+    for clause in reversed(order.split(",")):
+        parts = clause.split(".")
+        column = parts[0]
+        desc = "desc" in parts[1:]
+        nulls_first = "nullsfirst" in parts[1:] or ("nullslast" not in parts[1:] and desc)
+        present = [r for r in rows if r.get(column) is not None]
+        missing = [r for r in rows if r.get(column) is None]
+        present.sort(key=lambda r: _coerce(r[column]) if not isinstance(r[column], (dict, list)) else str(r[column]),
+                     reverse=desc)
+        rows = missing + present if nulls_first else present + missing
+    return rows
+
+
+def _project(rows: List[Dict[str, Any]], select: Optional[str]) -> List[Dict[str, Any]]:
+    if not select or select.strip() == "*":
+        return [dict(r) for r in rows]
+    columns = [c.strip() for c in select.split(",") if c.strip() and "(" not in c]
+    if "*" in columns:
+        return [dict(r) for r in rows]
+    return [{c: r.get(c) for c in columns} for r in rows]
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.tables = load_schema()
+        self.objects: Dict[str, bytes] = {}
+        self.requests: Counter = Counter()
+        self.bytes_in: Counter = Counter()
+        self.bytes_out: Counter = Counter()
+
+    def record(self, key: str, body_in: int, body_out: int):
+        self.requests[key] += 1
+        self.bytes_in[key] += body_in
+        self.bytes_out[key] += body_out
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": dict(sorted(self.requests.items())),
+            "bytes_in": dict(sorted(self.bytes_in.items())),
+            "bytes_out": dict(sorted(self.bytes_out.items())),
+            "rows": {name: len(table.rows) for name, table in self.tables.items()},
+            "objects": len(self.objects)
+        }
+
+
+state = FakeSupabase()
+app = FastAPI(title="Fake Supabase")
+
+
+def _prefer(request: Request) -> Dict[str, str]:
+    prefs = {}
+    for item in request.headers.get("prefer", "").split(","):
+        key, _, value = item.strip().partition("=")
+        if key:
+            prefs[key] = value
+    return prefs
+
+
+def _range(request: Request, params: Dict[str, str]) -> Tuple[int, Optional[int]]:
+    offset = int(params.get("offset", 0))
+    limit = int(params["limit"]) if "limit" in params else None
+    header = request.headers.get("range")
+    if header and "-" in header:
+        start, _, end = header.partition("-")
+        offset = int(start)
+        limit = int(end) - offset + 1 if end else None
+    return offset, limit
+
+
+def _json_response(body: Any, status: int, key: str, body_in: int, headers: Optional[Dict[str, str]] = None) -> Response:
+    content = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+    state.record(key, body_in, len(content))
+    return Response(content=content, status_code=status, media_type="application/json", headers=headers)
+
+
+def _error(error: PostgrestError, key: str, body_in: int) -> Response:
+    return _json_response(
+        {"code": error.code, "message": error.message, "details": None, "hint": None},
+        error.status, key, body_in
+    )
+
+
+@app.api_route("/rest/v1/{table}", methods=["GET", "HEAD", "POST", "PATCH", "DELETE"])
+async def rest(table: str, request: Request):
+    raw = await request.body()
+    key = f"{request.method} {table}"
+    params_list = list(request.query_params.multi_items())
+    params = dict(params_list)
+    prefer = _prefer(request)
+    return_rows = prefer.get("return") == "representation"
+
+    if table not in state.tables:
+        return _error(PostgrestError(404, "42P01", f'relation "public.{table}" does not exist'), key, len(raw))
+    target = state.tables[table]
+
+    try:
+        with state.lock:
+            if request.method in ("GET", "HEAD"):
+                rows = _apply_order(_apply_filters(target.rows, params_list), params.get("order"))
+                total = len(rows)
+                offset, limit = _range(request, params)
+                page = rows[offset:offset + limit] if limit is not None else rows[offset:]
+                body = _project(page, params.get("select"))
+                headers = {}
+                if "count" in prefer:
+                    end = offset + len(page) - 1
+                    headers["content-range"] = f"{offset}-{end}/{total}" if page else f"*/{total}"
+                if request.method == "HEAD":
+                    state.record(key, len(raw), 0)
+                    return Response(status_code=200, headers=headers)
+                return _json_response(body, 200, key, len(raw), headers)
+
+            if request.method == "POST":
+                payload = json.loads(raw or b"{}")
+                items = payload if isinstance(payload, list) else [payload]
+                upsert = prefer.get("resolution") in ("merge-duplicates", "ignore-duplicates")
+                written = []
+                for item in items:
+                    existing = target.find_conflict(item, params.get("on_conflict")) if upsert else None
+                    if existing is not None:
+                        if prefer["resolution"] == "merge-duplicates":
+                            existing.update(item)
+                            target.validate(existing)
+                        written.append(existing)
+                        continue
+                    row = target.new_row(item)
+                    if target.find_conflict(row, None) is not None:
+                        raise PostgrestError(409, "23505", f'duplicate key value violates unique constraint on "{table}"')
+                    target.rows.append(row)
+                    written.append(row)
+                return _json_response(_project(written, params.get("select")) if return_rows else [], 201, key, len(raw))
+
+            if request.method == "PATCH":
+                payload = json.loads(raw or b"{}")
+                unknown = [k for k in payload if k not in target.columns]
+                if unknown:
+                    raise PostgrestError(400, "PGRST204", f"Could not find the '{unknown[0]}' column of '{table}'")
+                matched = _apply_filters(target.rows, params_list)
+                for row in matched:
+                    row.update(payload)
+                    target.validate(row)
+                return _json_response(_project(matched, params.get("select")) if return_rows else [], 200, key, len(raw))
+
+            # DELETE
+            matched = _apply_filters(target.rows, params_list)
+            matched_ids = {id(r) for r in matched}
+            target.rows = [r for r in target.rows if id(r) not in matched_ids]
+            return _json_response(_project(matched, params.get("select")) if return_rows else [], 200, key, len(raw))
+
+    except PostgrestError as e:
+        return _error(e, key, len(raw))
+
+
+@app.get("/auth/v1/user")
+async def auth_user(request: Request):
+    """任意 Bearer token 都视为有效用户，用户 ID 由 token 稳定派生"""
+    token = request.headers.get("authorization", "").replace("Bearer ", "")
+    if not token:
+        return JSONResponse({"msg": "missing token"}, status_code=401)
+    user_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"fake-supabase:{token}"))
+    state.record("auth user", 0, 0)
+    return {
+        "id": user_id,
+        "aud": "authenticated",
+        "role": "authenticated",
+        "email": f"{token}@loadtest.local",
+        "app_metadata": {"provider": "email"},
+        "user_metadata": {},
+        "created_at": "2025-01-01T00:00:00+00:00"
+    }
+
+
+@app.post("/storage/v1/object/{bucket}/{path:path}")
+@app.put("/storage/v1/object/{bucket}/{path:path}")
+async def storage_upload(bucket: str, path: str, request: Request):
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        data = b""
+        for value in form.values():
+            if hasattr(value, "read"):
+                data = await value.read()
+                break
+    else:
+        data = await request.body()
+    key = f"{bucket}/{path}"
+    if key in state.objects and request.method == "POST" and request.headers.get("x-upsert") != "true":
+        return JSONResponse({"statusCode": "409", "error": "Duplicate", "message": "The resource already exists"}, status_code=400)
+    state.objects[key] = data
+    state.record("storage upload", len(data), 0)
+    return {"Key": key, "Id": str(uuid.uuid4())}
+
+
+@app.get("/storage/v1/object/public/{bucket}/{path:path}")
+@app.get("/storage/v1/object/{bucket}/{path:path}")
+async def storage_download(bucket: str, path: str):
+    data = state.objects.get(f"{bucket}/{path}")
+    if data is None:
+        return JSONResponse({"statusCode": "404", "error": "not_found", "message": "Object not found"}, status_code=400)
+    state.record("storage download", 0, len(data))
+    return Response(content=data, media_type="application/octet-stream")
+
+
+@app.delete("/storage/v1/object/{bucket}")
+async def storage_remove(bucket: str, request: Request):
+    payload = await request.json()
+    removed = []
+    for path in payload.get("prefixes", []):
+        if state.objects.pop(f"{bucket}/{path}", None) is not None:
+            removed.append({"name": path, "bucket_id": bucket})
+    state.record("storage remove", 0, 0)
+    return removed
+
+
+@app.get("/__stats")
+async def stats():
+    return state.stats()
+
+
+@app.post("/__reset")
+async def reset():
+    state.reset()
+    return {"ok": True}
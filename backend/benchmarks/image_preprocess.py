@@ -0,0 +1,147 @@
+"""
+OCR 图片预处理基准测试
+对比发送给 DeepSeek-OCR 的原图和预处理后的图片:
+
+- 合成样本: 手机照片 (4032x3024 JPEG)、长截图 (1170x5000 PNG，带文字)、已压缩的小截图 (WebP)
+- 预处理耗时 (进程池中执行，与线上相同)、处理前后的请求体大小 (base64)
+- 按 --bandwidth-mbps 估算的上传耗时，以及扣除预处理耗时后的净收益
+- --live 时用真实的 DeepSeek-OCR 分别识别原图和处理后的图片，对比端到端的 OCR 耗时
+  (需要 DEEPSEEK_API_KEY；同一图片第二次请求会命中 LLM 缓存，测量时关闭缓存)
+
+用法 (在 backend/ 目录下):
+    python -m benchmarks.image_preprocess --iterations 5 --bandwidth-mbps 20
+    LLM_CACHE_BACKEND=none python -m benchmarks.image_preprocess --live --iterations 3 --json preprocess.json
+"""
+import argparse
+import asyncio
+import base64
+import json
+import statistics
+import time
+from io import BytesIO
+from typing import Any, Callable, Dict, List
+from PIL import Image, ImageDraw
+from app.services.image_preprocess import image_preprocess_service, sniff_format, FORMAT_MIME
+
+
+def phone_photo() -> bytes:
+    image = Image.new("RGB", (4032, 3024), (120, 150, 170))
+    draw = ImageDraw.Draw(image)
+    for i in range(0, 4032, 24):
+        draw.line([(i, 0), (4032 - i, 3024)], fill=(i % 255, 80, 140), width=5)
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def tall_screenshot() -> bytes:
+    image = Image.new("RGB", (1170, 5000), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for row, y in enumerate(range(40, 5000, 36)):
+        draw.text((40, y), f"第 {row} 行 Mosaic screenshot text line {row} " * 2, fill=(20, 20, 20))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def small_webp() -> bytes:
+    image = Image.new("RGB", (900, 600), (240, 240, 240))
+    draw = ImageDraw.Draw(image)
+    for y in range(20, 600, 30):
+        draw.text((20, y), "compact webp screenshot", fill=(30, 30, 30))
+    buffer = BytesIO()
+    image.save(buffer, format="WEBP", quality=60)
+    return buffer.getvalue()
+
+
+SAMPLES: Dict[str, Callable[[], bytes]] = {
+    "phone_photo": phone_photo,
+    "tall_screenshot": tall_screenshot,
+    "small_webp": small_webp,
+}
+
+
+def upload_ms(payload_bytes: int, bandwidth_mbps: float) -> float:
+    return payload_bytes * 8 / (bandwidth_mbps * 1_000_000) * 1000
+
+
+def raw_data_url(data: bytes) -> str:
+    mime = FORMAT_MIME.get(sniff_format(data), "image/jpeg")
+    return f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"
+
+
+async def timed_ocr(data_url: str, iterations: int) -> float:
+    from app.services.deepseek import deepseek_service
+
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await deepseek_service.analyze_image(data_url, is_url=False)
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 1)
+
+
+async def measure(name: str, data: bytes, args) -> Dict[str, Any]:
+    preprocess_ms: List[float] = []
+    prepared = None
+    for _ in range(args.iterations):
+        prepared = await image_preprocess_service.prepare_for_ocr(data)
+        preprocess_ms.append(prepared["stats"]["preprocess_ms"])
+    stats = prepared["stats"]
+    raw_payload = len(raw_data_url(data))
+    processed_payload = len(prepared["data_url"])
+    median_preprocess = round(statistics.median(preprocess_ms), 1)
+
+    report = {
+        "original_size": stats.get("original_size"),
+        "processed_size": stats.get("processed_size"),
+        "kept_original": stats["kept_original"],
+        "raw_payload_bytes": raw_payload,
+        "processed_payload_bytes": processed_payload,
+        "preprocess_ms": median_preprocess,
+        "raw_upload_ms": round(upload_ms(raw_payload, args.bandwidth_mbps), 1),
+        "processed_upload_ms": round(upload_ms(processed_payload, args.bandwidth_mbps), 1),
+    }
+    report["net_gain_ms"] = round(report["raw_upload_ms"] - report["processed_upload_ms"] - median_preprocess, 1)
+
+    if args.live:
+        report["raw_ocr_ms"] = await timed_ocr(raw_data_url(data), args.iterations)
+        report["processed_ocr_ms"] = await timed_ocr(prepared["data_url"], args.iterations)
+        report["live_gain_ms"] = round(report["raw_ocr_ms"] - report["processed_ocr_ms"] - median_preprocess, 1)
+    return report
+
+
+async def run(args) -> Dict[str, Any]:
+    try:
+        return {name: await measure(name, build(), args) for name, build in SAMPLES.items()}
+    finally:
+        image_preprocess_service.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mosaic OCR 图片预处理基准测试")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--bandwidth-mbps", type=float, default=20.0, help="估算上传耗时使用的上行带宽")
+    parser.add_argument("--live", action="store_true", help="调用真实的 DeepSeek-OCR 对比原图和处理后的识别耗时")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    for name, row in report.items():
+        print(f"\n== {name} ({row['original_size']} -> {row['processed_size']}"
+              f"{', 使用原图' if row['kept_original'] else ''}) ==")
+        print(f"  请求体      原图 {row['raw_payload_bytes']:>9} B   处理后 {row['processed_payload_bytes']:>9} B")
+        print(f"  上传 ({args.bandwidth_mbps:g} Mbps)  原图 {row['raw_upload_ms']}ms   处理后 {row['processed_upload_ms']}ms")
+        print(f"  预处理 {row['preprocess_ms']}ms   净收益 {row['net_gain_ms']}ms")
+        if args.live:
+            print(f"  OCR        原图 {row['raw_ocr_ms']}ms   处理后 {row['processed_ocr_ms']}ms   "
+                  f"净收益 {row['live_gain_ms']}ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
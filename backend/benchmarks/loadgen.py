@@ -0,0 +1,283 @@
+"""
+端到端压测
+启动本地 fake_supabase 和压测模式的 Mosaic API (上游走 fixtures 回放)，
+模拟 N 个用户并发执行: 上传 (text / url / image) -> 发起分析 -> 轮询任务 -> 获取推荐 -> 反馈 -> 查看历史，
+报告各接口的 p50/p95/p99 延迟、端到端分析耗时，以及 fake_supabase 统计的按表请求数和写入字节数
+(例如每个分析任务写 async_tasks 的次数和字节数)
+
+用法 (在 backend/ 目录下):
+    python -m benchmarks.loadgen --users 20 --uploads-per-user 2
+    python -m benchmarks.loadgen --users 50 --mix text,url --poll-interval 0.5 --json loadtest.json
+    python -m benchmarks.loadgen --app-url http://127.0.0.1:8000 --supabase-url http://127.0.0.1:54321
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+import httpx
+from benchmarks.pipeline import percentile
+
+BACKEND_DIR = Path(__file__).parent.parent
+TEXT_SAMPLE = (
+    "手冲咖啡的萃取受研磨度、水温和注水节奏影响。浅烘豆子适合 92-94 度的水温，"
+    "粉水比 1:15 左右，分三段注水，总时间控制在两分半到三分钟之间。"
+)
+URL_SAMPLE = "https://example.com/blog/pour-over"
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.analysis_seconds: List[float] = []
+        self.polls: List[int] = []
+        self.failed_tasks = 0
+        self.rejected = 0  # 分析提交被准入控制拒绝 (429) 的次数
+
+    async def call(self, name: str, request, allow: Tuple[int, ...] = ()) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await request
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            return None
+        self.latencies[name].append(time.perf_counter() - start)
+        if response.status_code >= 400 and response.status_code not in allow:
+            self.errors[name] += 1
+            return None
+        return response
+
+    def report(self) -> Dict[str, Any]:
+        endpoints = {}
+        for name, samples in sorted(self.latencies.items()):
+            endpoints[name] = {
+                "count": len(samples),
+                "errors": self.errors.get(name, 0),
+                "p50_ms": round(percentile(samples, 50) * 1000, 1),
+                "p95_ms": round(percentile(samples, 95) * 1000, 1),
+                "p99_ms": round(percentile(samples, 99) * 1000, 1),
+            }
+        return {
+            "endpoints": endpoints,
+            "analysis": {
+                "completed": len(self.analysis_seconds),
+                "failed": self.failed_tasks,
+                "rejected": self.rejected,
+                "p50_s": round(percentile(self.analysis_seconds, 50), 2),
+                "p95_s": round(percentile(self.analysis_seconds, 95), 2),
+                "mean_polls": round(statistics.mean(self.polls), 1) if self.polls else 0,
+            }
+        }
+
+
+async def simulate_user(client: httpx.AsyncClient, stats: LoadStats, index: int, args, image_bytes: bytes):
+    headers = {"Authorization": f"Bearer loadtest-user-{index}"}
+    mix = args.mix.split(",")
+
+    for n in range(args.uploads_per_user):
+        kind = mix[(index + n) % len(mix)]
+        if kind == "image":
+            request = client.post(
+                "/api/upload/image", headers=headers,
+                files={"file": (f"user{index}-{n}.jpg", image_bytes, "image/jpeg")}
+            )
+        else:
+            # 每个用户的内容不同，避免命中分析去重
+            content = f"{URL_SAMPLE}?u={index}&n={n}" if kind == "url" else f"{TEXT_SAMPLE} #{index}-{n}"
+            request = client.post(
+                f"/api/upload/{kind}", headers=headers,
+                json={"type": kind, "content": content, "user_id": ""}
+            )
+        response = await stats.call(f"upload_{kind}", request)
+        if response is None:
+            continue
+        upload_id = response.json()["upload_id"]
+
+        # 队列已满时按 Retry-After 等待后重新提交
+        for _ in range(args.max_retries + 1):
+            response = await stats.call("analyze", client.post(
+                "/api/analysis/analyze", headers=headers, json={"upload_id": upload_id}
+            ), allow=(429,))
+            if response is None or response.status_code != 429:
+                break
+            stats.rejected += 1
+            await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+        if response is None or response.status_code == 429:
+            stats.failed_tasks += 1
+            continue
+        task_id = response.json()["task_id"]
+
+        started = time.perf_counter()
+        polls = 0
+        task = None
+        while time.perf_counter() - started < args.task_timeout:
+            await asyncio.sleep(args.poll_interval)
+            polls += 1
+            response = await stats.call("task_status", client.get(f"/api/analysis/task/{task_id}", headers=headers))
+            if response is None:
+                continue
+            task = response.json()
+            if task["status"] in ("completed", "failed"):
+                break
+        stats.polls.append(polls)
+
+        if not task or task["status"] != "completed":
+            stats.failed_tasks += 1
+            continue
+        stats.analysis_seconds.append(time.perf_counter() - started)
+
+        analysis_id = (task.get("result") or {}).get("final_result", {}).get("analysis_id")
+        if not analysis_id:
+            continue
+        response = await stats.call("recommendations", client.get(
+            f"/api/recommendations/analysis/{analysis_id}", headers=headers
+        ))
+        if response is None:
+            continue
+        recommendations = response.json()["recommendations"]
+
+        # 反馈会重新生成未处理的推荐，下一次反馈从返回的新列表中选择 (与前端行为一致)
+        acted = set()
+        for i in range(args.feedback_per_analysis):
+            pending = [rec for rec in recommendations if rec["id"] not in acted and not rec.get("user_action")]
+            if not pending:
+                break
+            acted.add(pending[0]["id"])
+            response = await stats.call("feedback", client.post(
+                "/api/recommendations/feedback", headers=headers,
+                json={"recommendation_id": pending[0]["id"], "action": "keep" if i % 2 == 0 else "discard"}
+            ))
+            if response is not None:
+                recommendations = response.json().get("updated_recommendations") or recommendations
+
+        await stats.call("history", client.get("/api/history/", headers=headers, params={"page": 1, "page_size": 20}))
+
+
+def _spawn(module_args: List[str], log_file) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", *module_args], cwd=BACKEND_DIR, env=dict(os.environ),
+        stdout=log_file, stderr=subprocess.STDOUT
+    )
+
+
+async def _wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"服务未在 {timeout}s 内就绪: {url}")
+
+
+def summarize_db(db_stats: Dict[str, Any], tasks: int) -> Dict[str, Any]:
+    """按每个分析任务折算 fake_supabase 的读写量"""
+    per_task = {}
+    if tasks:
+        for key, count in db_stats["requests"].items():
+            per_task[key] = {
+                "requests": round(count / tasks, 2),
+                "bytes_in": round(db_stats["bytes_in"].get(key, 0) / tasks),
+            }
+    return {**db_stats, "per_analysis": per_task}
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n== 接口延迟 ({report['users']} 用户, {report['elapsed_s']}s) ==")
+    for name, row in report["endpoints"].items():
+        print(
+            f"  {name:<16} n={row['count']:<5} 失败 {row['errors']:<3} "
+            f"p50 {row['p50_ms']}ms  p95 {row['p95_ms']}ms  p99 {row['p99_ms']}ms"
+        )
+    analysis = report["analysis"]
+    print(
+        f"\n== 端到端分析 ==\n  完成 {analysis['completed']}  失败 {analysis['failed']}  "
+        f"p50 {analysis['p50_s']}s  p95 {analysis['p95_s']}s  平均轮询 {analysis['mean_polls']} 次  "
+        f"提交被拒绝 (429) {analysis['rejected']} 次"
+    )
+    print("\n== 每个分析任务的数据库读写 (fake_supabase) ==")
+    for key, row in report["db"]["per_analysis"].items():
+        print(f"  {key:<32} 请求 {row['requests']:>7}  写入 {row['bytes_in']:>9} B")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Mosaic 端到端压测")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--uploads-per-user", type=int, default=1)
+    parser.add_argument("--mix", default="text,url,image", help="上传类型轮换，逗号分隔")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--task-timeout", type=float, default=120.0)
+    parser.add_argument("--feedback-per-analysis", type=int, default=2)
+    parser.add_argument("--max-retries", type=int, default=5, help="分析提交返回 429 时的最多重试次数")
+    parser.add_argument("--latency-scale", type=float, default=0.02, help="回放上游延迟的缩放系数")
+    parser.add_argument("--app-url", help="使用已启动的应用，不自动启动")
+    parser.add_argument("--supabase-url", default="http://127.0.0.1:54321")
+    parser.add_argument("--app-port", type=int, default=8100)
+    parser.add_argument("--log", default="loadtest-server.log", help="自动启动的服务的日志文件")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    supabase_port = str(httpx.URL(args.supabase_url).port or 54321)
+    processes: List[subprocess.Popen] = []
+    app_url = args.app_url
+    log_file = open(args.log, "w", encoding="utf-8")
+    try:
+        if not app_url:
+            processes.append(_spawn([
+                "uvicorn", "benchmarks.fake_supabase:app", "--port", supabase_port, "--log-level", "warning"
+            ], log_file))
+            await _wait_ready(f"{args.supabase_url}/__stats")
+            processes.append(_spawn([
+                "benchmarks.serve_app", "--port", str(args.app_port),
+                "--supabase-url", args.supabase_url, "--latency-scale", str(args.latency_scale)
+            ], log_file))
+            app_url = f"http://127.0.0.1:{args.app_port}"
+            await _wait_ready(f"{app_url}/health")
+
+        async with httpx.AsyncClient() as admin:
+            await admin.post(f"{args.supabase_url}/__reset")
+
+        from benchmarks.mock_upstream import _fixture_image
+        image_bytes = _fixture_image()
+        stats = LoadStats()
+        limits = httpx.Limits(max_connections=args.users * 2)
+        async with httpx.AsyncClient(base_url=app_url, timeout=60.0, limits=limits) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*[
+                simulate_user(client, stats, i, args, image_bytes) for i in range(args.users)
+            ])
+            elapsed = time.perf_counter() - started
+
+        async with httpx.AsyncClient() as admin:
+            db_stats = (await admin.get(f"{args.supabase_url}/__stats")).json()
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=10)
+        log_file.close()
+
+    report = {
+        "users": args.users,
+        "elapsed_s": round(elapsed, 2),
+        **stats.report(),
+        "db": summarize_db(db_stats, len(stats.analysis_seconds) + stats.failed_tasks),
+    }
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "report": report}, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,258 @@
+"""
+上游服务回放
+拦截 httpx 的同步 / 异步传输层，把 DeepSeek (SiliconFlow)、Jina、Tavily、Serper、FLUX 和 Supabase
+的请求路由到 fixtures/ 中录制的响应，并按服务注入可配置的延迟、统计调用次数
+
+Supabase 的 REST 调用按表回放录制的行，并支持 eq / neq / in / is 过滤和 count=exact，
+写操作原样回显请求体 (不保存状态)
+"""
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import parse_qsl
+import httpx
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+# 各服务默认注入的延迟 (秒)，接近线上观测到的中位数
+DEFAULT_LATENCY: Dict[str, float] = {
+    "deepseek.ocr": 6.0,
+    "deepseek.content_analysis": 8.0,
+    "deepseek.intent": 6.0,
+    "deepseek.rank": 5.0,
+    "deepseek.article": 40.0,
+    "deepseek.summarize": 6.0,
+    "flux": 3.0,
+    "flux.download": 0.3,
+    "jina": 2.5,
+    "tavily": 1.5,
+    "serper": 0.8,
+    "supabase.rest": 0.04,
+    "supabase.auth": 0.05,
+    "supabase.storage": 0.15,
+}
+
+# chat/completions 按系统提示词 / 用户提示词中的关键字选择录制的响应
+CHAT_ROUTES: List[Tuple[str, str]] = [
+    ("DeepSeek-OCR", "ocr"),
+    ("内容分析师", "content_analysis"),
+    ("意图分析", "intent"),
+    ("推荐系统专家", "rank"),
+    ("专栏作家", "article"),
+    ("信息压缩", "summarize"),
+]
+
+
+def _load_json(name: str) -> Any:
+    with open(FIXTURES_DIR / name, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _fixture_image() -> bytes:
+    """生成一张 2400x1800 的 JPEG，作为 Storage 中的上传图片和 FLUX 输出"""
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (2400, 1800), (180, 140, 100))
+    draw = ImageDraw.Draw(image)
+    for i in range(0, 2400, 60):
+        draw.line([(i, 0), (2400 - i, 1800)], fill=(i % 255, 90, 160), width=8)
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class MockUpstream:
+    def __init__(self, latency_scale: float = 1.0, latency: Optional[Dict[str, float]] = None, jitter: float = 0.2,
+                 passthrough_hosts: Optional[List[str]] = None):
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        # 这些主机的请求走真实网络 (如本地 fake_supabase)，不做回放
+        self.passthrough_hosts = set(passthrough_hosts or [])
+        self.latency_scale = latency_scale
+        self.jitter = jitter
+        self.calls: Counter = Counter()
+
+        self.chat_fixtures = _load_json("deepseek.json")
+        self.tavily = _load_json("tavily.json")
+        self.serper = _load_json("serper.json")
+        self.flux = _load_json("flux.json")
+        self.jina_page = (FIXTURES_DIR / "jina_page.md").read_text(encoding="utf-8")
+        supabase_fixture = _load_json("supabase.json")
+        self.auth_user = supabase_fixture["auth_user"]
+        self.tables: Dict[str, List[Dict[str, Any]]] = supabase_fixture["tables"]
+        self.image_bytes = _fixture_image()
+
+        self._original_sync = None
+        self._original_async = None
+
+    # ---- 安装 / 卸载 ----
+
+    def install(self):
+        """替换 httpx 传输层，之后创建的和已创建的客户端都会走回放"""
+        mock = self
+        self._original_sync = httpx.HTTPTransport.handle_request
+        self._original_async = httpx.AsyncHTTPTransport.handle_async_request
+
+        original_sync = self._original_sync
+        original_async = self._original_async
+
+        def handle_request(transport, request: httpx.Request) -> httpx.Response:
+            if request.url.host in mock.passthrough_hosts:
+                return original_sync(transport, request)
+            service, response = mock.route(request)
+            delay = mock._delay(service)
+            if delay:
+                # Supabase 客户端是同步的，阻塞事件循环的代价也是被测对象的一部分
+                time.sleep(delay)
+            return response
+
+        async def handle_async_request(transport, request: httpx.Request) -> httpx.Response:
+            if request.url.host in mock.passthrough_hosts:
+                return await original_async(transport, request)
+            await request.aread()
+            service, response = mock.route(request)
+            delay = mock._delay(service)
+            if delay:
+                await asyncio.sleep(delay)
+            return response
+
+        httpx.HTTPTransport.handle_request = handle_request
+        httpx.AsyncHTTPTransport.handle_async_request = handle_async_request
+
+    def uninstall(self):
+        if self._original_sync is not None:
+            httpx.HTTPTransport.handle_request = self._original_sync
+            httpx.AsyncHTTPTransport.handle_async_request = self._original_async
+
+    def seed_uploads(self, count: int):
+        """把录制的上传记录复制到 count 条 (历史记录分页基准使用)"""
+        base = self.tables["uploads"]
+        base_analysis = self.tables["analyses"][0]
+        uploads, analyses = [], []
+        for i in range(count):
+            upload = dict(base[i % len(base)], id=str(uuid.uuid4()))
+            uploads.append(upload)
+            analyses.append(dict(base_analysis, id=str(uuid.uuid4()), upload_id=upload["id"]))
+        self.tables["uploads"] = uploads
+        self.tables["analyses"] = self.tables["analyses"][:1] + analyses
+
+    def reset_counts(self):
+        self.calls = Counter()
+
+    def _delay(self, service: str) -> float:
+        base = self.latency.get(service, self.latency.get(service.split(".")[0], 0.0)) * self.latency_scale
+        if base <= 0:
+            return 0.0
+        return max(0.0, random.uniform(base * (1 - self.jitter), base * (1 + self.jitter)))
+
+    # ---- 路由 ----
+
+    def route(self, request: httpx.Request) -> Tuple[str, httpx.Response]:
+        host = request.url.host
+        path = request.url.path
+
+        if host == "r.jina.ai":
+            return self._count("jina", httpx.Response(200, text=self.jina_page, request=request))
+        if host == "api.tavily.com":
+            return self._count("tavily", httpx.Response(200, json=self.tavily, request=request))
+        if host == "google.serper.dev":
+            return self._count("serper", httpx.Response(200, json=self.serper, request=request))
+        if host == "flux-output.bench":
+            return self._count("flux.download", httpx.Response(
+                200, content=self.image_bytes, headers={"content-type": "image/jpeg"}, request=request
+            ))
+        if path.endswith("/chat/completions"):
+            return self._chat(request)
+        if path.endswith("/images/generations"):
+            return self._count("flux", httpx.Response(200, json=self.flux, request=request))
+        if path.startswith("/rest/v1/"):
+            return self._rest(request)
+        if path.startswith("/auth/v1/"):
+            return self._count("supabase.auth", httpx.Response(200, json=self.auth_user, request=request))
+        if path.startswith("/storage/v1/"):
+            return self._storage(request)
+
+        return self._count("unknown", httpx.Response(404, json={"error": f"no fixture for {request.url}"}, request=request))
+
+    def _count(self, service: str, response: httpx.Response, detail: Optional[str] = None) -> Tuple[str, httpx.Response]:
+        self.calls[detail or service] += 1
+        return service, response
+
+    def _chat(self, request: httpx.Request):
+        # 统一按非 ASCII 转义的形式匹配中文关键字
+        body = json.dumps(json.loads(request.content or b"{}"), ensure_ascii=False)
+        fixture = "intent"
+        for marker, name in CHAT_ROUTES:
+            if marker in body:
+                fixture = name
+                break
+        service = f"deepseek.{fixture}"
+        return self._count(service, httpx.Response(200, json=self.chat_fixtures[fixture], request=request))
+
+    def _storage(self, request: httpx.Request):
+        if request.method == "GET":
+            response = httpx.Response(200, content=self.image_bytes, headers={"content-type": "image/jpeg"}, request=request)
+        else:
+            response = httpx.Response(200, json={"Key": request.url.path.split("/object/")[-1]}, request=request)
+        return self._count("supabase.storage", response, f"supabase.storage.{request.method}")
+
+    def _rest(self, request: httpx.Request):
+        table = request.url.path[len("/rest/v1/"):].strip("/")
+        method = request.method
+        detail = f"supabase.rest.{method} {table}"
+        rows = self.tables.get(table, [])
+
+        if method in ("GET", "HEAD"):
+            matched = self._filter(rows, request.url)
+            headers = {"content-range": f"0-{max(0, len(matched) - 1)}/{len(matched)}"}
+            params = dict(parse_qsl(request.url.query.decode()))
+            offset = int(params.get("offset", 0))
+            body = matched[offset:offset + int(params["limit"])] if "limit" in params else matched[offset:]
+            return self._count("supabase.rest", httpx.Response(200, json=body, headers=headers, request=request), detail)
+
+        if method in ("POST", "PATCH"):
+            payload = json.loads(request.content or b"{}")
+            items = payload if isinstance(payload, list) else [payload]
+            now = datetime.now(timezone.utc).isoformat()
+            if method == "POST":
+                echoed = [{"id": str(uuid.uuid4()), "created_at": now, **item} for item in items]
+            else:
+                base = self._filter(rows, request.url)[:1] or [{}]
+                echoed = [{**base[0], **item} for item in items]
+            return self._count("supabase.rest", httpx.Response(201, json=echoed, request=request), detail)
+
+        # DELETE
+        return self._count("supabase.rest", httpx.Response(200, json=[], request=request), detail)
+
+    @staticmethod
+    def _filter(rows: List[Dict[str, Any]], url: httpx.URL) -> List[Dict[str, Any]]:
+        result = rows
+        for column, expression in parse_qsl(url.query.decode()):
+            if column in ("select", "order", "limit", "offset", "on_conflict"):
+                continue
+            op, _, value = expression.partition(".")
+            if op == "eq":
+                result = [r for r in result if column not in r or str(r[column]) == value]
+            elif op == "neq":
+                result = [r for r in result if column not in r or str(r[column]) != value]
+            elif op == "in":
+                values = {v.strip('"') for v in value.strip("()").split(",")}
+                result = [r for r in result if column not in r or str(r[column]) in values]
+            elif op == "is" and value == "null":
+                result = [r for r in result if r.get(column) is None]
+        return result
+
+
+def parse_latency_overrides(values: List[str]) -> Dict[str, float]:
+    """解析命令行的 service=seconds 延迟覆盖"""
+    overrides = {}
+    for item in values:
+        name, _, seconds = item.partition("=")
+        overrides[name.strip()] = float(seconds)
+    return overrides
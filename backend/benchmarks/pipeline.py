@@ -0,0 +1,240 @@
+"""
+分析流水线离线基准测试
+用 fixtures/ 中录制的上游响应 (DeepSeek、Jina、Tavily、Serper、FLUX、Supabase) 回放，
+按配置的并发度驱动以下场景，报告 p50/p95/p99 延迟、吞吐量和每次操作的上游调用次数:
+
+- analysis:  process_analysis_task (image / url / text)
+- history:   get_history
+- feedback:  submit_feedback (包含重新搜索、排序和推荐写入)
+- articles:  generate_articles_background
+
+用法 (在 backend/ 目录下):
+    python -m benchmarks.pipeline --scenario all --concurrency 8 --iterations 40
+    python -m benchmarks.pipeline --scenario analysis --upload-type url --latency-scale 0.05
+    python -m benchmarks.pipeline --scenario history --latency supabase.rest=0.1 --json results.json
+    python -m benchmarks.pipeline --scenario analysis --profile fast
+
+默认 --latency-scale 0.02 把录制的线上延迟缩小 50 倍，用于快速对比代码路径；
+不需要网络，也不需要真实的 API Key
+"""
+import os
+
+# 必须在导入 app 之前设置，未配置的环境变量使用基准测试的默认值
+os.environ.setdefault("SUPABASE_URL", "http://supabase.bench")
+os.environ.setdefault("SUPABASE_KEY", "bench-service-key")
+os.environ.setdefault("SUPABASE_DB_PASSWORD", "bench")
+os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+os.environ.setdefault("JINA_API_KEY", "bench")
+os.environ.setdefault("TAVILY_API_KEY", "bench")
+os.environ.setdefault("SERPER_API_KEY", "bench")
+# 基准测试对比的是代码路径: 默认关闭响应缓存，并放开 LLM 限流 (可通过环境变量覆盖)
+os.environ.setdefault("LLM_CACHE_BACKEND", "none")
+os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "1000000")
+os.environ.setdefault("LLM_TOKENS_PER_MINUTE", "1000000000")
+os.environ.setdefault("ANALYSIS_DEDUP_ENABLED", "false")
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import time
+from collections import Counter
+from typing import Dict, Any, List, Callable, Awaitable, Optional
+from benchmarks.mock_upstream import MockUpstream, parse_latency_overrides
+
+SCENARIOS = ("analysis", "history", "feedback", "articles")
+AUTHORIZATION = "Bearer bench-token"
+
+
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+async def run_load(operation: Callable[[int], Awaitable[bool]], iterations: int, concurrency: int) -> Dict[str, Any]:
+    """以固定并发度执行 iterations 次操作，返回延迟分布和吞吐量"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                ok = await operation(i)
+            except Exception as e:
+                logging.getLogger("benchmarks").warning(f"操作失败: {type(e).__name__}: {e}")
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if ok is False:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(iterations)])
+    elapsed = time.perf_counter() - started
+
+    return {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(iterations / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1) if latencies else 0.0,
+    }
+
+
+def build_operation(scenario: str, mock: MockUpstream, upload_type: str,
+                    profile: Optional[str] = None) -> Callable[[int], Awaitable[bool]]:
+    """构造单次操作，只在这里导入 app，保证环境变量和回放已经就绪"""
+    from fastapi import BackgroundTasks
+    from app.api import analysis, history, recommendations
+    from app.services.recommender import recommender_service
+
+    user_id = mock.auth_user["id"]
+
+    if scenario == "analysis":
+        upload = next(u for u in mock.tables["uploads"] if u["type"] == upload_type)
+
+        async def operation(i: int) -> bool:
+            return await analysis.process_analysis_task(f"bench-task-{i}", upload["id"], user_id, profile=profile)
+        return operation
+
+    if scenario == "history":
+        async def operation(i: int) -> bool:
+            result = await history.get_history(page=1, page_size=20, authorization=AUTHORIZATION)
+            return len(result.items) > 0
+        return operation
+
+    if scenario == "feedback":
+        rec_ids = [rec["id"] for rec in mock.tables["recommendations"]]
+
+        async def operation(i: int) -> bool:
+            tasks = BackgroundTasks()
+            result = await recommendations.submit_feedback(
+                recommendations.FeedbackRequest(
+                    recommendation_id=rec_ids[i % len(rec_ids)],
+                    action="keep" if i % 2 == 0 else "discard"
+                ),
+                tasks,
+                authorization=AUTHORIZATION
+            )
+            # 后台任务 (偏好更新) 计入本次操作
+            await tasks()
+            return result.success
+        return operation
+
+    if scenario == "articles":
+        context = mock.tables["analyses"][0]["full_context"]
+        if profile:
+            context = {**context, "profile": {"requested": profile, "effective": profile}}
+
+        async def operation(i: int) -> bool:
+            recs = [dict(rec, id=f"{rec['id']}-{i}") for rec in mock.tables["recommendations"][:3]]
+            await recommender_service.generate_articles_background(recs, context)
+            return True
+        return operation
+
+    raise ValueError(f"未知场景: {scenario}")
+
+
+async def run_scenario(scenario: str, mock: MockUpstream, args) -> Dict[str, Any]:
+    from app.services.recommender import recommender_service
+
+    if scenario == "history":
+        mock.seed_uploads(args.history_rows)
+
+    # 分析和反馈会在后台启动文章生成，这里替换为空操作，文章生成由 articles 场景单独测量
+    original_background = recommender_service.generate_articles_background
+    if scenario in ("analysis", "feedback"):
+        async def skip_articles(*_args, **_kwargs):
+            return None
+        recommender_service.generate_articles_background = skip_articles
+
+    try:
+        operation = build_operation(scenario, mock, args.upload_type, args.profile)
+        # 预热: 导入、连接池和进程池初始化不计入结果
+        await operation(0)
+        mock.reset_counts()
+
+        result = await run_load(operation, args.iterations, args.concurrency)
+    finally:
+        recommender_service.generate_articles_background = original_background
+
+    calls: Counter = mock.calls
+    result["scenario"] = scenario if scenario != "analysis" else f"analysis[{args.upload_type}]"
+    if args.profile and scenario in ("analysis", "articles"):
+        result["scenario"] += f" ({args.profile})"
+    result["upstream_calls"] = dict(sorted(calls.items()))
+    result["upstream_calls_per_op"] = {
+        name: round(count / args.iterations, 2) for name, count in sorted(calls.items())
+    }
+    return result
+
+
+def print_report(result: Dict[str, Any]):
+    print(f"\n== {result['scenario']} (并发 {result['concurrency']}, {result['iterations']} 次) ==")
+    print(
+        f"  p50 {result['p50_ms']}ms  p95 {result['p95_ms']}ms  p99 {result['p99_ms']}ms  "
+        f"平均 {result['mean_ms']}ms"
+    )
+    print(f"  吞吐量 {result['throughput_per_s']}/s  耗时 {result['elapsed_s']}s  失败 {result['errors']}")
+    print("  每次操作的上游调用:")
+    for name, per_op in result["upstream_calls_per_op"].items():
+        print(f"    {name:<45} {per_op:>8}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="分析流水线离线基准测试")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=40)
+    parser.add_argument("--upload-type", choices=("image", "url", "text"), default="url")
+    parser.add_argument("--latency-scale", type=float, default=0.02, help="录制延迟的缩放系数，1.0 为线上延迟")
+    parser.add_argument("--latency", action="append", default=[], metavar="SERVICE=SECONDS",
+                        help="覆盖单个服务的延迟，如 deepseek.article=30 或 supabase.rest=0.1")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延迟随机抖动比例")
+    parser.add_argument("--history-rows", type=int, default=60, help="history 场景的上传记录数")
+    parser.add_argument("--profile", choices=("fast", "standard", "deep"),
+                        help="analysis / articles 场景使用的分析档位，默认 ANALYSIS_DEFAULT_PROFILE")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    parser.add_argument("--verbose", action="store_true", help="输出应用日志")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.ERROR)
+
+    mock = MockUpstream(
+        latency_scale=args.latency_scale,
+        latency=parse_latency_overrides(args.latency),
+        jitter=args.jitter
+    )
+    mock.install()
+
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+    results = []
+    try:
+        for scenario in scenarios:
+            result = await run_scenario(scenario, mock, args)
+            print_report(result)
+            results.append(result)
+    finally:
+        from app.services.container import shutdown_services
+        await shutdown_services()
+        mock.uninstall()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,197 @@
+"""
+响应序列化基准测试
+用 fixtures/ 中录制的分析结果构造历史记录、分析详情和任务状态的响应，
+对比每个请求在序列化和 GZip 压缩上花费的 CPU:
+
+- build:           由数据库行构造响应模型 (包含 full_context 等透传字段的校验)
+- fastapi:         FastAPI >= 0.130 的 response_model 路径，pydantic-core 直接序列化为 JSON 字节
+- fastapi_legacy:  FastAPI < 0.130 的路径，先转换为 Python 对象再 json.dumps
+- orjson_class:    把 orjson 响应类设为默认时的路径 (绕过上面的快速路径，已安装 orjson 时才测试)
+- gzip-N:          GZipMiddleware 以压缩级别 N 压缩响应体
+
+用法 (在 backend/ 目录下):
+    python -m benchmarks.serialization --items 20 --iterations 200
+    python -m benchmarks.serialization --gzip-levels 1,6,9 --json serialization.json
+"""
+import argparse
+import asyncio
+import copy
+import gzip
+import json
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from pydantic import BaseModel
+from app.api.analysis import AnalysisDetailResponse, TaskStatusResponse
+from app.api.history import HistoryItem, HistoryResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FIXTURES = Path(__file__).parent / "fixtures" / "supabase.json"
+
+
+def load_tables() -> Dict[str, List[Dict[str, Any]]]:
+    with open(FIXTURES, encoding="utf-8") as f:
+        return json.load(f)["tables"]
+
+
+def item_context(context: Dict[str, Any], index: int) -> Dict[str, Any]:
+    """每条记录的 full_context 略有不同，避免 GZip 只压缩到重复内容"""
+    context = copy.deepcopy(context)
+    results = context.get("search_results") or []
+    if results:
+        shift = index % len(results)
+        context["search_results"] = results[shift:] + results[:shift]
+    context["step_message"] = f"{context.get('step_message', '')} #{index}"
+    return context
+
+
+def history_payload(tables: Dict[str, Any], items: int) -> Tuple[type, Callable[[], BaseModel]]:
+    uploads = tables["uploads"]
+    analysis = tables["analyses"][0]
+    contexts = [item_context(analysis["full_context"], i) for i in range(items)]
+
+    def build() -> BaseModel:
+        return HistoryResponse(
+            items=[
+                HistoryItem(
+                    id=f"{uploads[i % len(uploads)]['id']}-{i}",
+                    type=uploads[i % len(uploads)]["type"],
+                    content_preview=" · ".join(analysis["keywords"][:2]),
+                    analysis_id=analysis["id"],
+                    analysis_summary=f"兴趣: {', '.join(analysis['interest_tags'][:3])}",
+                    recommendation_count=len(tables["recommendations"]),
+                    created_at=uploads[i % len(uploads)]["created_at"],
+                    full_context=contexts[i],
+                    image_url=uploads[i % len(uploads)].get("image_url")
+                )
+                for i in range(items)
+            ],
+            total=items,
+            page=1,
+            page_size=items
+        )
+    return HistoryResponse, build
+
+
+def analysis_payload(tables: Dict[str, Any]) -> Tuple[type, Callable[[], BaseModel]]:
+    analysis = tables["analyses"][0]
+    upload = next((row for row in tables["uploads"] if row["id"] == analysis["upload_id"]), tables["uploads"][0])
+
+    def build() -> BaseModel:
+        return AnalysisDetailResponse.model_validate({
+            **analysis,
+            "original_content": {
+                "type": upload["type"],
+                "content": upload.get("image_url") if upload["type"] == "image" else upload.get("content_text")
+            }
+        })
+    return AnalysisDetailResponse, build
+
+
+def task_payload(tables: Dict[str, Any]) -> Tuple[type, Callable[[], BaseModel]]:
+    """已完成的分析任务: 轮询结果合并了 analyses.full_context"""
+    analysis = tables["analyses"][0]
+    result_data = {
+        **analysis["full_context"],
+        "step_message": "分析完成",
+        "final_result": {"analysis_id": analysis["id"], "recommendations_count": len(tables["recommendations"])}
+    }
+
+    def build() -> BaseModel:
+        return TaskStatusResponse(task_id="bench-task", status="completed", progress=100, result=result_data)
+    return TaskStatusResponse, build
+
+
+async def measure(payload_type: type, build: Callable[[], BaseModel], iterations: int,
+                  gzip_levels: List[int]) -> Dict[str, Dict[str, float]]:
+    field = create_model_field(name="Response", type_=payload_type, mode="serialization")
+    legacy_render = JSONResponse(content=None).render
+
+    async def fastapi_path(model: BaseModel) -> bytes:
+        return await serialize_response(field=field, response_content=model, dump_json=True)
+
+    async def legacy_path(model: BaseModel) -> bytes:
+        return legacy_render(await serialize_response(field=field, response_content=model))
+
+    async def orjson_path(model: BaseModel) -> bytes:
+        return orjson.dumps(await serialize_response(field=field, response_content=model))
+
+    paths = {"fastapi": fastapi_path, "fastapi_legacy": legacy_path}
+    if orjson is not None:
+        paths["orjson_class"] = orjson_path
+
+    model = build()
+    body = await fastapi_path(model)
+    report = {"build": {"ms": timed(build, iterations), "bytes": 0}}
+    for name, path in paths.items():
+        report[name] = {"ms": await timed_async(lambda: path(model), iterations), "bytes": len(await path(model))}
+    for level in gzip_levels:
+        report[f"gzip-{level}"] = {
+            "ms": timed(lambda: gzip.compress(body, compresslevel=level), iterations),
+            "bytes": len(gzip.compress(body, compresslevel=level))
+        }
+    return report
+
+
+def timed(func: Callable[[], Any], iterations: int) -> float:
+    func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return round((time.perf_counter() - start) / iterations * 1000, 3)
+
+
+async def timed_async(func: Callable[[], Any], iterations: int) -> float:
+    await func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    return round((time.perf_counter() - start) / iterations * 1000, 3)
+
+
+async def run(args) -> Dict[str, Any]:
+    tables = load_tables()
+    gzip_levels = [int(level) for level in args.gzip_levels.split(",") if level]
+    payloads = {
+        f"history ({args.items} 条)": history_payload(tables, args.items),
+        "analysis": analysis_payload(tables),
+        "task_status": task_payload(tables),
+    }
+    return {
+        name: await measure(payload_type, build, args.iterations, gzip_levels)
+        for name, (payload_type, build) in payloads.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mosaic 响应序列化基准测试")
+    parser.add_argument("--items", type=int, default=20, help="历史记录每页条数")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--gzip-levels", default="1,6,9", help="对比的 GZip 压缩级别，逗号分隔")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    for name, rows in report.items():
+        print(f"\n== {name} ==")
+        for path, row in rows.items():
+            size = f"{row['bytes']:>10} B" if row["bytes"] else ""
+            print(f"  {path:<16} {row['ms']:>8.3f}ms/请求 {size}")
+    if orjson is None:
+        print("\n未安装 orjson，跳过 orjson_class")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+以压测模式启动真实的 FastAPI 应用
+Supabase 请求发往本地 fake_supabase (真实 HTTP)，其余上游 (DeepSeek、Jina、搜索、FLUX) 走 fixtures 回放
+
+用法 (在 backend/ 目录下，通常由 benchmarks.loadgen 自动启动):
+    python -m benchmarks.serve_app --port 8100 --supabase-url http://127.0.0.1:54321 --latency-scale 0.02
+"""
+import argparse
+import os
+from urllib.parse import urlparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以压测模式启动 Mosaic API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--supabase-url", default="http://127.0.0.1:54321")
+    parser.add_argument("--latency-scale", type=float, default=0.02, help="回放上游延迟的缩放系数")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    # 必须在导入 app 之前设置；压测对比的是代码路径，默认关闭响应缓存并放开 LLM 限流
+    os.environ["SUPABASE_URL"] = args.supabase_url
+    os.environ.setdefault("SUPABASE_KEY", "loadtest-service-key")
+    os.environ.setdefault("SUPABASE_DB_PASSWORD", "loadtest")
+    os.environ.setdefault("DEEPSEEK_API_KEY", "loadtest")
+    os.environ.setdefault("JINA_API_KEY", "loadtest")
+    os.environ.setdefault("TAVILY_API_KEY", "loadtest")
+    os.environ.setdefault("SERPER_API_KEY", "loadtest")
+    os.environ.setdefault("LLM_CACHE_BACKEND", "none")
+    os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "1000000")
+    os.environ.setdefault("LLM_TOKENS_PER_MINUTE", "1000000000")
+
+    import uvicorn
+    from benchmarks.mock_upstream import MockUpstream
+
+    mock = MockUpstream(
+        latency_scale=args.latency_scale,
+        jitter=args.jitter,
+        passthrough_hosts=[urlparse(args.supabase_url).hostname]
+    )
+    mock.install()
+    try:
+        from app.main import app
+        uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level)
+    finally:
+        mock.uninstall()
+
+
+if __name__ == "__main__":
+    main()
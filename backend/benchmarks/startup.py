@@ -0,0 +1,138 @@
+"""
+启动耗时基准测试
+在全新的子进程中多次导入 app.main，报告导入耗时和第一个请求 (/health) 的耗时分布，
+以及 -X importtime 统计的累计耗时最多的模块，并检查慢依赖 (supabase 客户端及其子包) 是否在导入时被加载
+
+用法 (在 backend/ 目录下):
+    python -m benchmarks.startup --runs 10
+    python -m benchmarks.startup --without-keys --json startup.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, Any, List, Tuple
+from benchmarks.pipeline import percentile
+
+BACKEND_DIR = Path(__file__).parent.parent
+# 启动时不应加载的慢依赖，第一次用到对应服务时才导入
+DEFERRED_MODULES = ("supabase", "postgrest", "storage3", "supabase_auth")
+SECRET_SETTINGS = ("SUPABASE_URL", "SUPABASE_KEY", "SUPABASE_DB_PASSWORD", "DEEPSEEK_API_KEY", "JINA_API_KEY")
+
+CHILD_SCRIPT = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+
+async def first_request():
+    messages = []
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message):
+        messages.append(message)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/health", "raw_path": b"/health", "root_path": "",
+        "query_string": b"", "headers": [], "client": ("bench", 1), "server": ("bench", 80),
+    }
+    await app.main.app(scope, receive, send)
+    return messages[0]["status"]
+
+status = asyncio.run(first_request())
+ready = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_request_ms": (ready - imported) * 1000,
+    "status": status,
+    "loaded": {name: name in sys.modules for name in %r},
+}))
+""" % (DEFERRED_MODULES,)
+
+
+def _child_env(without_keys: bool) -> Dict[str, str]:
+    env = dict(os.environ)
+    if without_keys:
+        for name in SECRET_SETTINGS:
+            env.pop(name, None)
+    return env
+
+
+def run_once(env: Dict[str, str]) -> Dict[str, Any]:
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def top_imports(env: Dict[str, str], limit: int) -> List[Tuple[str, float]]:
+    """-X importtime 中累计耗时最多的模块 (app.main 本身和它直接导入的模块)"""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in output.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        # 缩进不超过 3 个空格: 顶层导入和它的直接子导入
+        if match and len(match.group(2)) <= 3:
+            rows.append((match.group(3), int(match.group(1)) / 1000))
+    return sorted(rows, key=lambda row: row[1], reverse=True)[:limit]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(percentile(samples, 50), 1),
+        "p95_ms": round(percentile(samples, 95), 1),
+        "mean_ms": round(statistics.mean(samples), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mosaic 启动耗时基准测试")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=12, help="列出累计导入耗时最多的模块数")
+    parser.add_argument("--without-keys", action="store_true", help="不设置任何 API Key 启动 (验证可在测试环境中导入)")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    env = _child_env(args.without_keys)
+    # 第一次运行预热 .pyc 和文件系统缓存，不计入统计
+    run_once(env)
+    runs = [run_once(env) for _ in range(args.runs)]
+
+    report = {
+        "runs": args.runs,
+        "without_keys": args.without_keys,
+        "import": summarize([run["import_ms"] for run in runs]),
+        "first_request": summarize([run["first_request_ms"] for run in runs]),
+        "status": runs[-1]["status"],
+        "loaded_at_import": runs[-1]["loaded"],
+        "top_imports": top_imports(env, args.top),
+    }
+
+    print(f"\n== 启动耗时 ({args.runs} 次{', 无 API Key' if args.without_keys else ''}) ==")
+    for name in ("import", "first_request"):
+        row = report[name]
+        label = "导入 app.main" if name == "import" else "首个请求"
+        print(f"  {label:<14} p50 {row['p50_ms']}ms  p95 {row['p95_ms']}ms  平均 {row['mean_ms']}ms")
+    print(f"  /health 状态码 {report['status']}")
+    loaded = [name for name, flag in report["loaded_at_import"].items() if flag]
+    print(f"  导入时加载的延迟依赖: {', '.join(loaded) if loaded else '无'}")
+    print("\n== 累计导入耗时最多的模块 ==")
+    for module, ms in report["top_imports"]:
+        print(f"  {module:<40} {ms:>8.1f}ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+上传峰值内存基准测试
+对比旧的 `await file.read()` 整体读入方式和流式落盘方式，
+在并发上传大文件时服务进程的峰值 RSS
+
+用法 (在 backend/ 目录下):
+    python -m benchmarks.upload_rss --concurrency 8 --size-mb 20
+
+每种模式各启动一个独立的 uvicorn 子进程 (ru_maxrss 是进程生命周期内的峰值)，
+只测量请求解析和落盘，不包含 Supabase Storage 上传
+"""
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+import httpx
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile
+
+MAX_BYTES = 64 * 1024 * 1024
+
+bench_app = FastAPI()
+
+
+@bench_app.post("/buffered")
+async def buffered_upload(file: UploadFile = File(...)):
+    """旧实现: 整个文件读入内存"""
+    content = await file.read()
+    await asyncio.sleep(0.2)  # 模拟持有字节期间的 Storage 上传
+    return {"size": len(content)}
+
+
+@bench_app.post("/streaming")
+async def streaming_upload(request: Request):
+    """新实现: 流式校验并落盘"""
+    from app.services.upload_stream import receive_file_upload, UploadRejectedError
+
+    try:
+        upload = await receive_file_upload(request, max_bytes=MAX_BYTES)
+    except UploadRejectedError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        await asyncio.sleep(0.2)
+        return {"size": upload.size}
+    finally:
+        upload.cleanup()
+
+
+@bench_app.get("/rss")
+async def peak_rss():
+    # Linux 下 ru_maxrss 单位为 KB
+    return {"peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _multipart_body(boundary: str, size: int):
+    """分块生成 multipart 请求体，客户端本身也不在内存中构造完整文件"""
+    chunk = os.urandom(1024 * 1024)
+
+    async def body():
+        yield (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="bench.jpg"\r\n'
+            f"Content-Type: image/jpeg\r\n\r\n"
+        ).encode()
+        remaining = size
+        while remaining > 0:
+            part = chunk[:min(len(chunk), remaining)]
+            remaining -= len(part)
+            yield part
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    return body()
+
+
+async def _run_mode(mode: str, concurrency: int, size: int) -> dict:
+    port = _free_port()
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.upload_rss:bench_app",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=backend_dir
+    )
+    base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        async with httpx.AsyncClient(timeout=120.0, trust_env=False) as client:
+            for _ in range(50):
+                try:
+                    await client.get(f"{base_url}/rss")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+
+            baseline = (await client.get(f"{base_url}/rss")).json()["peak_rss_mb"]
+
+            async def one_upload():
+                boundary = os.urandom(8).hex()
+                response = await client.post(
+                    f"{base_url}/{mode}",
+                    content=_multipart_body(boundary, size),
+                    headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+                )
+                response.raise_for_status()
+
+            start = time.monotonic()
+            await asyncio.gather(*[one_upload() for _ in range(concurrency)])
+            elapsed = time.monotonic() - start
+
+            peak = (await client.get(f"{base_url}/rss")).json()["peak_rss_mb"]
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        "mode": mode,
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(peak, 1),
+        "delta_mb": round(peak - baseline, 1),
+        "elapsed_s": round(elapsed, 2)
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="上传峰值内存基准测试")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--size-mb", type=int, default=20)
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    print(f"并发 {args.concurrency} 个 {args.size_mb}MB 上传")
+    for mode in ("buffered", "streaming"):
+        result = await _run_mode(mode, args.concurrency, size)
+        print(
+            f"{result['mode']:>10}: 峰值 RSS {result['peak_rss_mb']}MB "
+            f"(基线 {result['baseline_rss_mb']}MB, 增量 {result['delta_mb']}MB), "
+            f"耗时 {result['elapsed_s']}s"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
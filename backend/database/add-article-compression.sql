@@ -0,0 +1,9 @@
+-- 为已有数据库添加压缩存储的文章列（文章生成时压缩一次，文章接口直接返回压缩后的响应体）
+-- 请在 Supabase Dashboard -> SQL Editor 中执行此脚本
+-- 已有的 article_html 纯文本在第一次读取时由后端转为压缩存储并清空
+
+ALTER TABLE public.recommendations ADD COLUMN IF NOT EXISTS article_body BYTEA;
+ALTER TABLE public.recommendations ADD COLUMN IF NOT EXISTS article_encoding TEXT;
+ALTER TABLE public.recommendations ADD COLUMN IF NOT EXISTS article_etag TEXT;
+ALTER TABLE public.recommendations ADD COLUMN IF NOT EXISTS article_images TEXT[];
+CREATE INDEX IF NOT EXISTS idx_recommendations_article_images ON public.recommendations USING GIN (article_images);
@@ -0,0 +1,7 @@
+-- 为已有数据库添加上传内容哈希列（用于上传去重和分析复用）
+-- 请在 Supabase Dashboard -> SQL Editor 中执行此脚本
+
+ALTER TABLE public.uploads ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_uploads_content_hash ON public.uploads(type, content_hash);
+CREATE INDEX IF NOT EXISTS idx_uploads_user_content_hash ON public.uploads(user_id, type, content_hash);
@@ -0,0 +1,6 @@
+-- 为已有数据库添加派生图片列（缩略图和响应式宽度的 WebP 版本）
+-- 请在 Supabase Dashboard -> SQL Editor 中执行此脚本
+
+ALTER TABLE public.uploads ADD COLUMN IF NOT EXISTS image_variants JSONB;
+
+ALTER TABLE public.generated_images ADD COLUMN IF NOT EXISTS variants JSONB;
@@ -0,0 +1,21 @@
+-- 创建生成图片缓存表 (文章配图按规范化提示词复用)
+-- 请在 Supabase Dashboard -> SQL Editor 中执行此脚本
+
+CREATE TABLE IF NOT EXISTS public.generated_images (
+    cache_key TEXT PRIMARY KEY,
+    prompt TEXT NOT NULL,
+    model TEXT NOT NULL,
+    scope TEXT NOT NULL DEFAULT 'global',
+    user_id UUID REFERENCES auth.users(id) ON DELETE SET NULL,
+    storage_path TEXT NOT NULL,
+    public_url TEXT NOT NULL,
+    variants JSONB,
+    hit_count INTEGER DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    last_used_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_generated_images_last_used_at ON public.generated_images(last_used_at DESC);
+
+-- 不对用户开放，只允许使用 service role key 的后端访问
+ALTER TABLE public.generated_images ENABLE ROW LEVEL SECURITY;
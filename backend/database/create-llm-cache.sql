@@ -0,0 +1,16 @@
+-- 创建 LLM 响应缓存表 (LLM_CACHE_BACKEND=postgres 时使用)
+-- 请在 Supabase Dashboard -> SQL Editor 中执行此脚本
+
+CREATE TABLE IF NOT EXISTS public.llm_cache (
+    cache_key TEXT PRIMARY KEY,
+    model TEXT,
+    response TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    last_accessed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_llm_cache_created_at ON public.llm_cache(created_at);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_last_accessed_at ON public.llm_cache(last_accessed_at DESC);
+
+-- 不对用户开放，只允许使用 service role key 的后端访问
+ALTER TABLE public.llm_cache ENABLE ROW LEVEL SECURITY;
@@ -23,6 +23,8 @@ CREATE TABLE IF NOT EXISTS public.uploads (
     -- 元数据
     content_preview TEXT,  -- 内容预览（前200字符）
     file_size INTEGER,
+    content_hash TEXT,     -- 内容哈希（图片字节 / 规范化 URL / 折叠空白后的文本的 SHA-256），用于去重
+    image_variants JSONB,  -- 缩略图和响应式宽度的 WebP 版本 {"thumb": url, "w480": url, ...}
 
     -- 时间戳
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
@@ -36,6 +38,8 @@ CREATE TABLE IF NOT EXISTS public.uploads (
 
 CREATE INDEX idx_uploads_user_id ON public.uploads(user_id);
 CREATE INDEX idx_uploads_created_at ON public.uploads(created_at DESC);
+CREATE INDEX idx_uploads_content_hash ON public.uploads(type, content_hash);
+CREATE INDEX idx_uploads_user_content_hash ON public.uploads(user_id, type, content_hash);
 
 
 -- 3. 分析结果表
@@ -80,7 +84,11 @@ CREATE TABLE IF NOT EXISTS public.recommendations (
     source TEXT,                   -- 内容来源（Tavily, Serper 等）
     relevance_score DECIMAL(3,2),  -- 0.00 - 1.00 的相关性评分
     tile_type TEXT,                -- knowledge, product, location, tutorial, etc.
-    article_html TEXT,             -- 深度文章 HTML 内容
+    article_html TEXT,             -- 深度文章 HTML 纯文本 (只用于旧记录和关闭压缩时，开启压缩后为 NULL)
+    article_body BYTEA,            -- 文章接口响应体，按 article_encoding 压缩
+    article_encoding TEXT,         -- br 或 gzip
+    article_etag TEXT,             -- 响应体的 ETag
+    article_images TEXT[],         -- 文章引用的生成图片 Storage 路径
 
     -- 用户反馈
     user_action TEXT CHECK (user_action IN ('keep', 'discard', NULL)),
@@ -96,6 +104,7 @@ CREATE TABLE IF NOT EXISTS public.recommendations (
 CREATE INDEX idx_recommendations_analysis_id ON public.recommendations(analysis_id);
 CREATE INDEX idx_recommendations_user_id ON public.recommendations(user_id);
 CREATE INDEX idx_recommendations_user_action ON public.recommendations(user_action);
+CREATE INDEX idx_recommendations_article_images ON public.recommendations USING GIN (article_images);
 
 
 -- 5. 用户偏好表 (用于实时学习和调整推荐)
@@ -147,6 +156,37 @@ CREATE INDEX idx_async_tasks_user_id ON public.async_tasks(user_id);
 CREATE INDEX idx_async_tasks_status ON public.async_tasks(status);
 
 
+-- 7. LLM 响应缓存表 (LLM_CACHE_BACKEND=postgres 时使用，仅后端读写)
+CREATE TABLE IF NOT EXISTS public.llm_cache (
+    cache_key TEXT PRIMARY KEY,   -- (model, messages 哈希, temperature, max_tokens) 的 SHA-256
+    model TEXT,
+    response TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    last_accessed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_llm_cache_created_at ON public.llm_cache(created_at);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_last_accessed_at ON public.llm_cache(last_accessed_at DESC);
+
+
+-- 8. 生成图片缓存表 (文章配图按规范化提示词复用)
+CREATE TABLE IF NOT EXISTS public.generated_images (
+    cache_key TEXT PRIMARY KEY,   -- (模型, 作用域, 规范化提示词) 的 SHA-256
+    prompt TEXT NOT NULL,
+    model TEXT NOT NULL,
+    scope TEXT NOT NULL DEFAULT 'global',  -- global 或 user:{user_id}
+    user_id UUID REFERENCES auth.users(id) ON DELETE SET NULL,
+    storage_path TEXT NOT NULL,   -- uploads bucket 中的路径
+    public_url TEXT NOT NULL,
+    variants JSONB,               -- 缩略图和响应式宽度的 WebP 版本
+    hit_count INTEGER DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    last_used_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_generated_images_last_used_at ON public.generated_images(last_used_at DESC);
+
+
 -- 启用 Row Level Security (RLS)
 ALTER TABLE public.user_profiles ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.uploads ENABLE ROW LEVEL SECURITY;
@@ -154,6 +194,10 @@ ALTER TABLE public.analyses ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.recommendations ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.user_preferences ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.async_tasks ENABLE ROW LEVEL SECURITY;
+-- llm_cache 不配置策略，只允许使用 service role key 的后端访问
+ALTER TABLE public.llm_cache ENABLE ROW LEVEL SECURITY;
+-- generated_images 同样只允许后端访问
+ALTER TABLE public.generated_images ENABLE ROW LEVEL SECURITY;
 
 
 -- RLS 策略: 用户只能访问自己的数据